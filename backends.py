@@ -0,0 +1,279 @@
+import os
+import re
+import math
+import time
+import random
+import asyncio
+import hashlib
+import threading
+from collections import namedtuple
+
+# "live" talks to Gemini / Nominatim / OpenWeather / Meteostat; "fake" uses the deterministic local
+# stand-ins below (no network, no API keys, no quota). Each backend can be switched on its own.
+BACKEND = os.getenv("TRAVEL_BACKEND", "live")
+GEMINI_BACKEND = os.getenv("GEMINI_BACKEND", BACKEND)
+GEOCODER_BACKEND = os.getenv("GEOCODER_BACKEND", BACKEND)
+WEATHER_BACKEND = os.getenv("WEATHER_BACKEND", BACKEND)
+
+# fake latencies: median milliseconds per call, log-normally distributed with sigma FAKE_LATENCY_SIGMA.
+# Override with FAKE_LATENCY="gemini_parse=300,gemini_plan=1500,..."; FAKE_LATENCY_SCALE multiplies all.
+FAKE_LATENCY_MS = {"gemini_parse": 400.0, "gemini_plan": 2500.0, "gemini_chunk": 40.0,
+                   "geocode": 250.0, "weather_current": 120.0, "weather_monthly": 600.0}
+FAKE_LATENCY_SIGMA = float(os.getenv("FAKE_LATENCY_SIGMA", "0.4"))
+FAKE_LATENCY_SCALE = float(os.getenv("FAKE_LATENCY_SCALE", "1.0"))
+FAKE_SEED = int(os.getenv("FAKE_SEED", "0"))
+
+Location = namedtuple("Location", ["latitude", "longitude", "address"])
+
+MONTH_WORDS = ["january", "february", "march", "april", "may", "june", "july", "august",
+               "september", "october", "november", "december", "spring", "summer", "autumn", "fall", "winter"]
+THEME_WORDS = {"beach": "Beaches", "beaches": "Beaches", "food": "Cuisine", "nightlife": "Nightlife",
+               "hiking": "Adventure", "nature": "Nature", "spa": "Wellness", "culture": "Culture"}
+
+
+def _latency_config():
+    config = dict(FAKE_LATENCY_MS)
+    for item in filter(None, os.getenv("FAKE_LATENCY", "").split(",")):
+        name, _, value = item.partition("=")
+        config[name.strip()] = float(value)
+    return config
+
+
+def _digest(*parts) -> int:
+    return int.from_bytes(hashlib.blake2b("|".join(map(str, parts)).encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class Latency:
+    """
+    Log-normal latency model: median ms scaled by FAKE_LATENCY_SCALE, spread sigma (0 = constant).
+    Draws come from one seeded RNG, so a run with the same seed and call order is reproducible.
+    """
+
+    def __init__(self, seed=FAKE_SEED, scale=FAKE_LATENCY_SCALE, sigma=FAKE_LATENCY_SIGMA, medians=None):
+        self.medians = medians or _latency_config()
+        self.scale = scale
+        self.sigma = sigma
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample(self, name: str) -> float:
+        """
+        Returns:
+            float: seconds
+        """
+        median = self.medians.get(name, 0.0) * self.scale / 1000.0
+        if median <= 0:
+            return 0.0
+        with self._lock:
+            z = self._rng.gauss(0.0, 1.0)
+        return median * math.exp(self.sigma * z)
+
+    def sleep(self, name: str):
+        time.sleep(self.sample(name))
+
+    async def asleep(self, name: str):
+        await asyncio.sleep(self.sample(name))
+
+
+class FakeResponse:
+    def __init__(self, text: str, prompt_tokens: int = 0):
+        self.text = text
+        output_tokens = -(-len(text) // 4)
+        self.usage_metadata = _Usage(prompt_tokens, output_tokens)
+
+
+class _Usage:
+    def __init__(self, prompt_tokens, output_tokens):
+        self.prompt_token_count = prompt_tokens
+        self.candidates_token_count = output_tokens
+        self.total_token_count = prompt_tokens + output_tokens
+
+
+class FakeGeminiModels:
+    """
+    Stand-in for genai.Client().aio.models: answers the parse prompt with JSON pulled out of the user
+    request by a few regexes, and any other prompt with a deterministic day-by-day itinerary.
+    """
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.calls = 0
+
+    @staticmethod
+    def _is_parse(contents) -> bool:
+        return "strict JSON parser" in str(contents)
+
+    @staticmethod
+    def _parse_reply(contents) -> str:
+        request = str(contents).split("User request:", 1)[-1].strip()
+        lower = request.lower()
+        place = re.findall(r"\b(?:in|to|visit)\s+([A-Z][\w'-]+(?:\s+[A-Z][\w'-]+)*)", request)
+        days = re.search(r"(\d+)\s*(?:day|night)", lower)
+        weeks = re.search(r"(\d+)\s*week", lower)
+        time_word = next((w for w in MONTH_WORDS if re.search(rf"\b{w}\b", lower)), None)
+        theme = next((t for w, t in THEME_WORDS.items() if re.search(rf"\b{w}\b", lower)), "Culture")
+        duration = int(days.group(1)) if days else int(weeks.group(1)) * 7 if weeks else 5
+        return ('{"place": "%s", "theme": "%s", "duration": %d, "time": "%s", "extras": ""}'
+                % (place[0] if place else "Unknown", theme, duration, time_word.capitalize() if time_word else "Today"))
+
+    @staticmethod
+    def _itinerary(contents) -> str:
+        text = str(contents)
+        place = re.search(r"Place: (.+)", text)
+        days = re.search(r"Duration: (\d+)", text)
+        place = place.group(1).strip() if place else "your destination"
+        days = min(int(days.group(1)) if days else 3, 14)
+        rng = random.Random(_digest(text))
+        activities = ["old town walking tour", "local market", "museum visit", "food tour", "day hike",
+                      "river cruise", "cooking class", "viewpoint at sunset", "neighbourhood cafes"]
+        lines = [f"Itinerary for {place}:"]
+        for day in range(1, days + 1):
+            lines.append(f"Day {day}: {', '.join(rng.sample(activities, 3))}.")
+        return "\n".join(lines)
+
+    async def generate_content(self, model=None, contents="", config=None):
+        self.calls += 1
+        parse = self._is_parse(contents)
+        await self.latency.asleep("gemini_parse" if parse else "gemini_plan")
+        text = self._parse_reply(contents) if parse else self._itinerary(contents)
+        return FakeResponse(text, -(-len(str(contents)) // 4))
+
+    async def generate_content_stream(self, model=None, contents="", config=None):
+        self.calls += 1
+        parse = self._is_parse(contents)
+        await self.latency.asleep("gemini_parse" if parse else "gemini_plan")
+        text = self._parse_reply(contents) if parse else self._itinerary(contents)
+
+        async def chunks():
+            lines = text.splitlines(keepends=True)
+            for i, line in enumerate(lines):
+                if i:
+                    await self.latency.asleep("gemini_chunk")
+                yield FakeResponse(line, -(-len(str(contents)) // 4) if i == len(lines) - 1 else 0)
+        return chunks()
+
+
+class FakeGeminiClient:
+    """
+    Drop-in for genai.Client: only .aio.models.generate_content / generate_content_stream are provided.
+    """
+
+    def __init__(self, latency=None):
+        self.latency = latency or Latency()
+        self.aio = _Namespace(models=FakeGeminiModels(self.latency))
+
+
+class _Namespace:
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class FakeGeocoder:
+    """
+    Stand-in for the rate-limited Nominatim geocode callable: place -> Location at coordinates derived
+    from a hash of the name. Names containing "nowhere" are not found.
+    """
+
+    def __init__(self, latency=None):
+        self.latency = latency or Latency()
+        self.calls = 0
+
+    def __call__(self, place: str):
+        self.calls += 1
+        self.latency.sleep("geocode")
+        if "nowhere" in place.lower():
+            return None
+        h = _digest("geo", place.strip().lower())
+        lat = (h % 1_400_000) / 10_000.0 - 60.0          # -60 .. 80
+        lon = ((h >> 24) % 3_600_000) / 10_000.0 - 180.0
+        return Location(round(lat, 4), round(lon, 4), place)
+
+
+class FakeWeather:
+    """
+    Stand-in for OpenWeather (current) and Meteostat (monthly): deterministic temperatures from the
+    coordinates, returned in the same shapes the live clients produce.
+    """
+
+    def __init__(self, latency=None):
+        self.latency = latency or Latency()
+        self.calls = 0
+
+    @staticmethod
+    def _temperature(lat, lon, month):
+        season = math.cos((month - 7) / 12 * 2 * math.pi) * (1 if lat >= 0 else -1)
+        return round(28 - abs(lat) * 0.45 + season * min(abs(lat), 50) * 0.25 + (_digest(lat, lon) % 30) / 10, 1)
+
+    def _current(self, lat, lon):
+        self.calls += 1
+        temp = self._temperature(lat, lon, time.localtime().tm_mon)
+        sky = ["clear sky", "few clouds", "scattered clouds", "light rain"][_digest(lat, lon, "sky") % 4]
+        return {"coord": {"lat": lat, "lon": lon}, "weather": [{"description": sky}],
+                "main": {"temp": temp, "feels_like": temp, "humidity": 60}, "name": "fake"}
+
+    def current(self, lat, lon) -> dict:
+        """
+        Returns:
+            dict: OpenWeather /data/2.5/weather-shaped JSON
+        """
+        self.latency.sleep("weather_current")
+        return self._current(lat, lon)
+
+    async def acurrent(self, lat, lon) -> dict:
+        await self.latency.asleep("weather_current")
+        return self._current(lat, lon)
+
+    def monthly(self, lat, lon, month) -> float:
+        """
+        Returns:
+            float: average temperature (°C) for the month, as Meteostat's tavg mean
+        """
+        self.calls += 1
+        self.latency.sleep("weather_monthly")
+        return self._temperature(lat, lon, month)
+
+
+_fakes = {}
+_fakes_lock = threading.Lock()
+
+
+def _fake(name, factory):
+    with _fakes_lock:
+        if name not in _fakes:
+            _fakes[name] = factory()
+        return _fakes[name]
+
+
+def gemini_client():
+    """
+    Returns:
+        genai.Client, or the shared FakeGeminiClient when GEMINI_BACKEND=fake
+    """
+    if GEMINI_BACKEND == "fake":
+        return _fake("gemini", FakeGeminiClient)
+    from google import genai
+    return genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
+
+
+def geocoder_backend(min_delay_seconds):
+    """
+    Returns:
+        callable: place -> location (with .latitude/.longitude) or None; Nominatim behind geopy's
+        RateLimiter, or the shared FakeGeocoder when GEOCODER_BACKEND=fake
+    """
+    if GEOCODER_BACKEND == "fake":
+        return _fake("geocoder", FakeGeocoder)
+    from geopy.geocoders import Nominatim
+    from geopy.extra.rate_limiter import RateLimiter
+    geolocator = Nominatim(user_agent="travel_chatbot")
+    return RateLimiter(geolocator.geocode, min_delay_seconds=min_delay_seconds, swallow_exceptions=False)
+
+
+def fake_weather():
+    """
+    Returns:
+        FakeWeather or None: the shared fake when WEATHER_BACKEND=fake; None means use the live services
+    """
+    if WEATHER_BACKEND == "fake":
+        return _fake("weather", FakeWeather)
+    return None
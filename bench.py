@@ -0,0 +1,428 @@
+"""
+Offline benchmark suite. Runs against the local fake Gemini / geocoder / weather backends (see backends.py),
+so it needs no API keys, network access or quota.
+
+    python bench.py                                 # all suites -> .bench/<commit>.json
+    python bench.py --suites rag,search --out r.json
+    python bench.py --latency-scale 0.05 --requests 100 --concurrency 1,16,64
+    python bench.py --compare .bench/abc1234.json .bench/def5678.json
+
+Suites:
+    rag     cold start: CityStore parse vs mmap load, TravelRAG.load with an empty vs a warm index cache
+    search  rag.TravelRAG / simple_rag.TravelRAG single-query latency and search_batch throughput
+    chat    end-to-end /chat throughput and p50/p99 latency under concurrent load (in-process ASGI)
+    embed   query encoding throughput from concurrent threads: one model.encode per query vs the
+            micro-batching EmbeddingService, without and with its LRU cache
+    geo     GeoIndex radius / k-nearest latency on the dataset and on --geo-points synthetic points,
+            and RoutePlanner.plan latency
+Every suite runs in a fresh process and records that process's RSS and high-water mark afterwards, so the
+memory figures of one suite do not include what earlier suites loaded.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import asyncio
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+import numpy as np
+
+SUITES = ["rag", "search", "chat", "embed", "geo"]
+DESCRIPTIVE_QUERIES = [
+    "quiet beaches and seafood", "ancient temples and tea houses", "mountain hiking village",
+    "nightlife and street food", "desert safari", "wine region with castles", "tropical island diving",
+    "northern lights", "canals and museums", "jungle wildlife lodge",
+]
+MISSPELLED_QUERIES = ["Pariss", "Kyotoo", "Barcelonna", "Lisbn", "Reykjavik Iceland", "new york"]
+THEMES = ["culture", "food", "beaches", "nightlife", "hiking", "nature"]
+MONTHS = ["January", "March", "May", "July", "September", "November"]
+ROUTE_PLACES = ["Northern Italy", "Japan", "Southern Spain", "Rome, Florence and Venice", "United States",
+                "south america"]
+
+
+def setup_environment(args, workdir):
+    """
+    Point every backend at the fakes and every cache at workdir. Must run before the app modules are
+    imported: they read their configuration at import time.
+    """
+    os.environ["TRAVEL_BACKEND"] = "fake"
+    os.environ["FAKE_LATENCY_SCALE"] = str(args.latency_scale)
+    os.environ["FAKE_SEED"] = str(args.seed)
+    os.environ["GEMINI_RPM"] = str(args.gemini_rpm)
+    os.environ["GEMINI_TPM"] = str(args.gemini_rpm * 100_000)
+    os.environ["GEMINI_PLAN_QUEUE"] = os.environ["GEMINI_PARSE_QUEUE"] = "100000"
+    os.environ["RAG_DENSE"] = "1" if args.dense else "0"
+    os.environ.setdefault("GEMINI_API_KEY", "bench")
+    for name, sub in [("RAG_CACHE_DIR", "rag"), ("CITY_STORE_DIR", "citystore")]:
+        os.environ[name] = os.path.join(workdir, sub)
+    for name, sub in [("WEATHER_CACHE_PATH", "weather.sqlite"), ("GEOCODE_CACHE_PATH", "geocode.sqlite")]:
+        os.environ[name] = os.path.join(workdir, sub)
+    os.environ.pop("RESPONSE_CACHE_PATH", None)
+
+
+def memory():
+    """
+    Returns:
+        dict: current RSS and peak RSS (high-water mark) of this process in MB
+    """
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        peak_kb //= 1024            # ru_maxrss is bytes on macOS
+    rss_kb = None
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    rss_kb = int(line.split()[1])
+    except OSError:
+        pass
+    return {"rss_mb": round(rss_kb / 1024, 1) if rss_kb else None, "peak_rss_mb": round(peak_kb / 1024, 1)}
+
+
+def latency_stats(samples):
+    """
+    Returns:
+        dict: count, mean, p50, p95, p99 and max of samples (seconds), in milliseconds
+    """
+    if not samples:
+        return {"count": 0}
+    ms = np.asarray(samples, dtype=np.float64) * 1000.0
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    return {"count": len(ms), "mean_ms": round(float(ms.mean()), 3), "p50_ms": round(float(p50), 3),
+            "p95_ms": round(float(p95), 3), "p99_ms": round(float(p99), 3), "max_ms": round(float(ms.max()), 3)}
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def bench_rag(args):
+    import city_store
+    import rag
+
+    results = {}
+    city_store._stores.clear()
+    shutil.rmtree(city_store.CITY_STORE_DIR, ignore_errors=True)
+    seconds, _ = timed(city_store.build_store, args.csv)
+    results["city_store_parse_s"] = round(seconds, 4)
+    seconds, _ = timed(city_store.build_store, args.csv)
+    results["city_store_mmap_load_s"] = round(seconds, 4)
+
+    seconds, _ = timed(lambda: rag.TravelRAG(args.csv, cache_dir=None, dense=False))
+    results["simple_load_s"] = round(seconds, 4)
+    if args.dense:
+        try:
+            # a lazy instance loads nothing until .model is read, so this times the model alone (including
+            # the sentence_transformers import, which the loads below then no longer pay)
+            lazy = rag.TravelRAG(args.csv, cache_dir=rag.CACHE_DIR, lazy=True)
+            seconds, _ = timed(lambda: lazy.model)
+            results["model_load_s"] = round(seconds, 4)
+            shutil.rmtree(rag.CACHE_DIR, ignore_errors=True)
+            seconds, _ = timed(lambda: rag.TravelRAG(args.csv, cache_dir=rag.CACHE_DIR))
+            results["dense_load_cold_s"] = round(seconds, 4)        # encode all docs + build the index
+            seconds, _ = timed(lambda: rag.TravelRAG(args.csv, cache_dir=rag.CACHE_DIR))
+            results["dense_load_cached_s"] = round(seconds, 4)      # mmap the saved embeddings/index
+        except Exception as e:
+            results["dense"] = {"skipped": f"{type(e).__name__}: {e}"}
+    return results
+
+
+def search_queries(store, n_cities):
+    step = max(1, len(store) // n_cities)
+    cities = [store.city[i] for i in range(0, len(store), step)][:n_cities]
+    countries = list(dict.fromkeys(store.country[i] for i in range(0, len(store), step)))[:10]
+    return cities + countries + DESCRIPTIVE_QUERIES + MISSPELLED_QUERIES
+
+
+def bench_search(args):
+    import rag
+    import simple_rag
+    from city_store import get_city_store
+
+    queries = search_queries(get_city_store(args.csv), 50)
+    impls = {"simple_rag": lambda: simple_rag.TravelRAG(args.csv)}
+    if args.dense:
+        impls["rag"] = lambda: rag.TravelRAG(args.csv)
+    results = {"queries": len(queries)}
+    for name, factory in impls.items():
+        try:
+            engine = factory()
+            engine.warm_up()
+        except Exception as e:
+            results[name] = {"skipped": f"{type(e).__name__}: {e}"}
+            continue
+        single = []
+        for _ in range(args.repeat):
+            for q in queries:
+                seconds, _ = timed(engine.search, q)
+                single.append(seconds)
+        batch = [timed(engine.search_batch, queries)[0] for _ in range(args.repeat)]
+        results[name] = {
+            "single": latency_stats(single),
+            "batch": {**latency_stats(batch), "per_query_ms": round(1000 * float(np.median(batch)) / len(queries), 4)},
+            "found": sum(r is not None for r in engine.search_batch(queries)),
+        }
+    return results
+
+
+def chat_messages(store, n, offset):
+    """
+    n distinct /chat messages. Most take the local fast-path parser and the dataset climatology; one in four
+    needs Gemini to parse it, one in eight asks for today's weather and one in eight names a town outside
+    the dataset (fake geocoder + fake Meteostat).
+    """
+    messages = []
+    for k in range(n):
+        i = (offset + k * 7) % len(store)
+        city, theme, month, days = store.city[i], THEMES[k % len(THEMES)], MONTHS[k % len(MONTHS)], 2 + k % 6
+        if k % 8 == 7:
+            messages.append(f"Plan {days} days in Bench{offset + k}ville in {month}, I love {theme}")
+        elif k % 4 == 3:
+            messages.append(f"Could you plan something fun for me in {city}, maybe around {month}? I love {theme}")
+        elif k % 8 == 5:
+            messages.append(f"{days} days in {city} today for {theme}")
+        else:
+            messages.append(f"{days} days in {city} in {month} for {theme}")
+    return messages
+
+
+async def run_load(client, messages, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, statuses, cache = [], {}, {}
+
+    async def one(message):
+        async with semaphore:
+            start = time.perf_counter()
+            resp = await client.post("/chat", json={"message": message})
+            latencies.append(time.perf_counter() - start)
+            statuses[resp.status_code] = statuses.get(resp.status_code, 0) + 1
+            status = resp.headers.get("x-cache", "ERROR")
+            cache[status] = cache.get(status, 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(m) for m in messages))
+    elapsed = time.perf_counter() - start
+    return {"requests": len(messages), "concurrency": concurrency, "elapsed_s": round(elapsed, 3),
+            "throughput_rps": round(len(messages) / elapsed, 2), "latency": latency_stats(latencies),
+            "status": {str(k): v for k, v in statuses.items()}, "x_cache": cache}
+
+
+async def bench_chat_async(args):
+    import httpx
+    import main
+    from city_store import get_city_store
+    from utils import aclose_async_client
+
+    await asyncio.to_thread(main.chatbot.rag.warm_up)
+    store = get_city_store(args.csv)
+    transport = httpx.ASGITransport(app=main.app)
+    results = {"gemini_calls": 0}
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        for n, concurrency in enumerate(args.concurrency):
+            messages = chat_messages(store, args.requests, offset=n * args.requests)
+            results[f"c{concurrency}_cold"] = await run_load(client, messages, concurrency)
+            results[f"c{concurrency}_cached"] = await run_load(client, messages, concurrency)
+    await aclose_async_client()
+    results["gemini_calls"] = main.chatbot.client.aio.models.calls
+    results["scheduler"] = main.chatbot.scheduler.stats()
+    results["caches"] = main.get_cache_stats()
+    return results
+
+
+def bench_chat(args):
+    return asyncio.run(bench_chat_async(args))
+
+
+def bench_embed(args):
+    import rag
+    from concurrent.futures import ThreadPoolExecutor
+    from embedder import EmbeddingService
+
+    if not args.dense:
+        return {"skipped": "--no-dense"}
+    engine = rag.TravelRAG(args.csv, lazy=True)
+    engine.model
+    # distinct texts so only the warm pass can hit the cache
+    queries = [f"{DESCRIPTIVE_QUERIES[k % len(DESCRIPTIVE_QUERIES)]} {k}" for k in range(args.requests * 4)]
+
+    def run(encode, threads):
+        latencies = []
+
+        def one(query):
+            seconds, _ = timed(encode, query)
+            latencies.append(seconds)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(threads) as pool:
+            list(pool.map(one, queries))
+        elapsed = time.perf_counter() - start
+        return {"throughput_qps": round(len(queries) / elapsed, 1), "latency": latency_stats(latencies)}
+
+    results = {"queries": len(queries)}
+    for threads in args.concurrency:
+        batched = EmbeddingService(engine._encode_queries, cache_size=0)
+        cached = EmbeddingService(engine._encode_queries)
+        run(lambda q: cached.encode([q]), threads)
+        results[f"c{threads}"] = {
+            "direct": run(lambda q: engine.model.encode([q], convert_to_numpy=True), threads),
+            "batched": {**run(lambda q: batched.encode([q]), threads), "mean_batch": batched.stats()["mean_batch"]},
+            "cached": run(lambda q: cached.encode([q]), threads),
+        }
+    return results
+
+
+def bench_geo(args):
+    from city_store import get_city_store
+    from geo_index import GeoIndex
+    from route_planner import get_route_planner
+
+    store = get_city_store(args.csv)
+    rng = np.random.default_rng(args.seed)
+    n = args.geo_points
+    datasets = {"dataset": (store.lat, store.lon),
+                # uniform over the sphere
+                "synthetic": (np.degrees(np.arcsin(rng.uniform(-1, 1, n))), rng.uniform(-180, 180, n))}
+    results = {}
+    for name, (lat, lon) in datasets.items():
+        seconds, index = timed(GeoIndex, lat, lon)
+        picks = rng.integers(0, len(lat), 200)
+        queries = [(float(lat[i]), float(lon[i])) for i in picks if not np.isnan(lat[i])]
+        radius = [timed(index.radius, a, o, 100.0)[0] for _ in range(args.repeat) for a, o in queries]
+        nearest = [timed(index.nearest, a, o, 10)[0] for _ in range(args.repeat) for a, o in queries]
+        results[name] = {"points": len(index), "build_s": round(seconds, 4),
+                         "radius_100km": latency_stats(radius), "nearest_10": latency_stats(nearest)}
+
+    planner = get_route_planner(args.csv)
+    planner.plan(ROUTE_PLACES[0], 10)
+    routes = [timed(planner.plan, place, 14, "Culture", 7)[0] for _ in range(args.repeat) for place in ROUTE_PLACES]
+    results["route_plan"] = latency_stats(routes)
+    return results
+
+
+def run_suite(name, args):
+    """
+    Run one suite and record its wall time and memory. Called in a process of its own (see main), so
+    peak_rss_mb is this suite's high-water mark.
+    """
+    runners = {"rag": bench_rag, "search": bench_search, "chat": bench_chat, "embed": bench_embed,
+               "geo": bench_geo}
+    start = time.perf_counter()
+    try:
+        result = runners[name](args)
+    except Exception as e:
+        result = {"error": f"{type(e).__name__}: {e}"}
+        print(f"❌ [bench] {name} failed:", e)
+    result["wall_s"] = round(time.perf_counter() - start, 3)
+    result["memory"] = memory()
+    return result
+
+
+def git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=10)
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"],
+                               capture_output=True, text=True, timeout=30).stdout.strip()
+        return out.stdout.strip() + ("-dirty" if dirty else "") if out.returncode == 0 else None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def flatten(tree, prefix=""):
+    flat = {}
+    for key, value in tree.items():
+        path = f"{prefix}.{key}" if prefix else str(key)
+        if isinstance(value, dict):
+            flat.update(flatten(value, path))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[path] = value
+    return flat
+
+
+def compare(old_path, new_path):
+    """
+    Print every numeric result present in both files with its relative change.
+    """
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    a, b = flatten(old["suites"]), flatten(new["suites"])
+    print(f"{'metric':<60} {old['meta'].get('commit') or 'old':>12} {new['meta'].get('commit') or 'new':>12} {'change':>9}")
+    for key in sorted(a.keys() & b.keys()):
+        change = f"{(b[key] - a[key]) / a[key] * 100:+.1f}%" if a[key] else ""
+        print(f"{key:<60} {a[key]:>12} {b[key]:>12} {change:>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline Travel Planner benchmarks (fake backends).")
+    parser.add_argument("--suites", default=",".join(SUITES), help="comma-separated subset of " + ",".join(SUITES))
+    parser.add_argument("--out", help="result file (default .bench/<commit>.json)")
+    parser.add_argument("--csv", default="cities.csv")
+    parser.add_argument("--no-dense", dest="dense", action="store_false",
+                        help="skip the MiniLM + FAISS paths (exact + BM25 only)")
+    parser.add_argument("--repeat", type=int, default=5, help="passes over the search query set")
+    parser.add_argument("--requests", type=int, default=48, help="/chat requests per concurrency level")
+    parser.add_argument("--concurrency", default="1,8,32", help="comma-separated /chat (and embed suite thread) concurrency levels")
+    parser.add_argument("--latency-scale", type=float, default=0.1, help="multiplier on the fake backend latencies")
+    parser.add_argument("--gemini-rpm", type=float, default=1e6, help="scheduler requests-per-minute limit")
+    parser.add_argument("--geo-points", type=int, default=1_000_000, help="synthetic points for the geo suite")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="diff two result files and exit")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+    args.concurrency = [int(c) for c in args.concurrency.split(",") if c]
+    suites = [s for s in args.suites.split(",") if s]
+    unknown = set(suites) - set(SUITES)
+    if unknown:
+        parser.error(f"unknown suites: {', '.join(sorted(unknown))}")
+
+    workdir = tempfile.mkdtemp(prefix="travel-bench-")
+    setup_environment(args, workdir)
+    commit = git_commit()
+    report = {
+        "meta": {
+            "commit": commit,
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "config": {k: v for k, v in vars(args).items() if k not in ("compare", "out")},
+        },
+        "suites": {},
+    }
+    # fork where available: the parent has not imported the app, so each suite starts from the same state
+    context = multiprocessing.get_context("fork" if "fork" in multiprocessing.get_all_start_methods() else "spawn")
+    try:
+        for name in suites:
+            print(f"🔹 [bench] running {name} ...", flush=True)
+            try:
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                    result = pool.submit(run_suite, name, args).result()
+            except Exception as e:
+                result = {"error": f"{type(e).__name__}: {e}"}
+                print(f"❌ [bench] {name} failed:", e)
+            report["suites"][name] = result
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    out = args.out or os.path.join(".bench", f"{commit or 'results'}.json")
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(report, f, indent=2, default=str)
+    print(f"✅ [bench] results written to {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,116 @@
-from google import genai
-from google.genai import types
 import os
 import re
-from utils import get_current_weather, get_historical_weather
-from rag import TravelRAG
-from dotenv import load_dotenv
+import asyncio
+import threading
+from utils import aget_current_weather, aget_historical_weather
+from backends import gemini_client
+from gemini_scheduler import get_scheduler, is_quota_error, retry_after
+from rag import get_rag
+from rag_context import describe, render_context, render_route, render_route_context, summary
+from route_planner import get_route_planner
+from city_store import get_city_store
+from prompt_parser import DEFAULT_DETAILS, FastPromptParser, SEASON_MONTHS
+from recommender import get_recommender, preferences_from_message
+from telemetry import span
+from geocode import normalize_name
 import json
+import logging
 from datetime import datetime
 
-load_dotenv()
+log = logging.getLogger(__name__)
+
+GEMINI_MODEL = "gemini-2.0-flash-exp"
+# requests the local parser understands at least this well skip the Gemini parse call
+FAST_PARSE_THRESHOLD = float(os.getenv("FAST_PARSE_THRESHOLD", "0.75"))
+# max concurrent Gemini calls per batch
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+# parsed places that mean "pick one for me"
+VAGUE_PLACES = {"", "unknown", "none", "n a", "anywhere", "somewhere", "any"}
+
+MONTHS = {
+    "january": 1, "february": 2, "march": 3,
+    "april": 4, "may": 5, "june": 6,
+    "july": 7, "august": 8, "september": 9,
+    "october": 10, "november": 11, "december": 12
+}
+
+def trip_month(time) -> int:
+    """
+    Month (1-12) named by a parsed time ("July", "summer"); the current month for "Today" or anything else.
+    """
+    time = str(time or "Today").strip().lower()
+    return MONTHS.get(time) or SEASON_MONTHS.get(time, datetime.today().month)
+
+
+def weather_key(details: dict, place: str):
+    """
+    Weather identity of a request: items with the same weather place (see weather_place) and month share
+    one weather lookup.
+    """
+    time = str(details.get("time", "Today")).lower()
+    month = "today" if time == "today" else trip_month(time)
+    return str(place).strip().lower(), month
+
+
+def generation_config(temperature: float):
+    """
+    Gemini GenerateContentConfig; google.genai is imported on first use so importing this module stays cheap.
+    """
+    from google.genai import types
+    return types.GenerateContentConfig(temperature=temperature)
+
+
+def error_result(e: Exception, **fields) -> dict:
+    """
+    Per-item error entry for batch results; quota/backpressure errors carry retry_after (seconds).
+    """
+    result = {**fields, "error": str(e)}
+    if is_quota_error(e):
+        result["retry_after"] = retry_after(e)
+    return result
+
 
-rag_system = TravelRAG()
 class TravelChatbot:
     def __init__(self):
-        # load Gemini client
-        self.client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
-        # init RAG
-        self.rag = TravelRAG("cities.csv")
+        # Gemini client (a local fake when GEMINI_BACKEND=fake), created on first use
+        self._client = None
+        # every Gemini call goes through the shared rate limiter / priority queue
+        self.scheduler = get_scheduler()
+        # shared RAG (loaded on first use or at API startup)
+        self.rag = get_rag("cities.csv")
+        # rule-based parser for the common request shapes, built on first use and after dataset reloads
+        self._fast_parser = None
+        self._init_lock = threading.Lock()
+
+    @property
+    def client(self):
+        with self._init_lock:
+            if self._client is None:
+                self._client = gemini_client()
+        return self._client
+
+    @property
+    def fast_parser(self):
+        with self._init_lock:
+            if self._fast_parser is None or self._fast_parser.store is not get_city_store("cities.csv"):
+                self._fast_parser = FastPromptParser("cities.csv")
+        return self._fast_parser
+
+    def warm_up(self):
+        """
+        Create the Gemini client and the fast parser and import the google.genai types ahead of the first
+        request (called from the API warm-up).
+        """
+        generation_config(0.0)
+        return self.client, self.fast_parser
 
     def parse_prompt(self, message: str) -> dict:
+        """
+        Synchronous wrapper around aparse_prompt (for scripts; do not call from a running event loop).
+        """
+        return asyncio.run(self.aparse_prompt(message))
+
+    async def aparse_prompt(self, message: str) -> dict:
         """
         Use Gemini to parse the user's free-text request into structured details.
         
@@ -33,6 +125,52 @@ class TravelChatbot:
         For example, if the user does not provide a theme, the function will default to "Culture".
         If the user does not provide a duration, the function defaults to 5.
         If the user does not provide a time, the function will default to "Today".
+
+        Requests the local FastPromptParser understands with confidence >= FAST_PARSE_THRESHOLD are answered
+        without calling Gemini.
+        """
+        with span("parse") as s:
+            details, confidence = self.fast_parser.parse(message)
+            if confidence >= FAST_PARSE_THRESHOLD:
+                s.set(path="fast", confidence=confidence)
+                log.debug("✅ [parse_prompt] Fast-path parsed details (confidence %s): %s", confidence, details)
+                return details
+            s.set(path="llm", confidence=confidence)
+            fast_extras = details.get("extras")
+            details = await self._aparse_with_gemini(message)
+            if not details.get("extras") and fast_extras:
+                # keep the constraints the fast parser could not read when Gemini returned none
+                details["extras"] = fast_extras
+            return self.resolve_place(message, details)
+
+    def is_vague_place(self, place: str) -> bool:
+        """
+        True if place names no destination: empty or a word like "anywhere", or a phrase ("somewhere warm")
+        that is neither a dataset city or country (TravelRAG.canonical_place) nor cities or an area the
+        route planner knows.
+        """
+        if normalize_name(place or "") in VAGUE_PLACES:
+            return True
+        return self.rag.canonical_place(place) is None and not get_route_planner().known_place(place)
+
+    def resolve_place(self, message: str, details: dict) -> dict:
+        """
+        If the request names no destination ("somewhere warm with beaches in February"), fill in the
+        best match from the DestinationRecommender instead of letting the LLM guess.
+        """
+        if not self.is_vague_place(details.get("place")):
+            return details
+        prefs = preferences_from_message(message)
+        results = get_recommender().recommend(**prefs, top_k=1)
+        if not results:
+            return details
+        place = f"{results[0]['city']}, {results[0]['country']}"
+        log.info("✅ [parse_prompt] No destination given; recommended: %s", place)
+        return {**details, "place": place}
+
+    async def _aparse_with_gemini(self, message: str) -> dict:
+        """
+        The Gemini half of aparse_prompt.
         """
 
         prompt = f"""
@@ -45,29 +183,30 @@ class TravelChatbot:
         User request: {message}
         """
 
-        print("🔹 Sending parse prompt to Gemini (trimmed preview):", prompt[:300])
+        log.debug("🔹 Sending parse prompt to Gemini: %s", prompt)
 
-        response = self.client.models.generate_content(
-            model="gemini-2.0-flash-exp",
+        response = await self.scheduler.generate(
+            self.client, "parse",
+            model=GEMINI_MODEL,
             contents=prompt,
-            config=types.GenerateContentConfig(temperature=0.3)
+            config=generation_config(0.3)
         )
 
         text = response.text.strip()
-        print("🔹 [parse_prompt] Gemini raw output:", text)
+        log.debug("🔹 [parse_prompt] Gemini raw output: %s", text)
 
         # --- Fix: strip ```json ... ``` fences if present ---
         if text.startswith("```"):
             text = re.sub(r"^```[a-zA-Z]*\n?", "", text)   # remove opening fence (```json or ``` etc.)
             text = re.sub(r"```$", "", text)               # remove trailing fence
             text = text.strip()
-            print("🔹 [parse_prompt] Cleaned output (after removing fences):", text)
+            log.debug("🔹 [parse_prompt] Cleaned output (after removing fences): %s", text)
 
         # --- Try parsing JSON ---
         try:
             details = json.loads(text)
         except Exception as e:
-            print("❌ [parse_prompt] JSON parsing failed:", e)
+            log.warning("❌ [parse_prompt] JSON parsing failed: %s", e)
             details = {
                 "place": "Unknown",
                 "theme": "Culture",
@@ -76,60 +215,155 @@ class TravelChatbot:
                 "extras": ""
             }
 
-        print("✅ [parse_prompt] Final parsed details:", details)
+        log.debug("✅ [parse_prompt] Final parsed details: %s", details)
         return details
 
-    def travel_planner(self, details: dict) -> dict:
+    async def aget_weather(self, place: str, time: str) -> dict:
         """
-        Build full response: itinerary + weather + RAG info.
+        Current weather when time is "today", otherwise the historical average for the month named in time.
         """
-        place = details.get("place", "Unknown")
-        duration = details.get("duration", 5)
-        theme = details.get("theme", "Culture")
-        time = details.get("time", "Today")
-
-        # --- Weather ---
         if time.lower() == "today":
-            weather = get_current_weather(place)
+            return await aget_current_weather(place)
+        return await aget_historical_weather(place, trip_month(time))
+
+    def build_planning_prompt(self, details: dict, record, weather: dict, route=None) -> str:
+        """
+        Build the Gemini itinerary prompt from the parsed details, RAG record and weather.
+
+        The dataset section comes from rag_context.render_context: only the travel month's climate and
+        the relevant themes, kept under RAG_CONTEXT_TOKENS. For a multi-city trip the planned route
+        (rag_context.render_route) is added and the model is asked to follow it; record is then the list
+        of the stops' records (see context_queries) and every stop gets a share of the budget.
+        """
+        month = trip_month(details.get("time"))
+        if route:
+            context = render_route_context(record, month=month, theme=details.get("theme"))
         else:
-            # crude month mapping
-            month_map = {
-                "january": 1, "february": 2, "march": 3,
-                "april": 4, "may": 5, "june": 6,
-                "july": 7, "august": 8, "september": 9,
-                "october": 10, "november": 11, "december": 12
-            }
-            month = month_map.get(time.lower(), datetime.today().month)
-            weather = get_historical_weather(place, month)
+            context = render_context(record, month=month, theme=details.get("theme"))
+        lines = [
+            "You are a helpful travel agent. Based on the following details, suggest a day-by-day itinerary.",
+            "",
+            "Trip details:",
+            f"Place: {details.get('place', 'Unknown')}",
+            f"Duration: {details.get('duration', 5)} days",
+            f"Theme: {details.get('theme', 'Culture')}",
+            f"Time: {details.get('time', 'Today')}",
+            f"Extra Info: {details.get('extras', '')}",
+            "",
+        ]
+        if route:
+            lines += [
+                "Route (follow these stops in this order and spend the given days at each; plan the travel between them):",
+                render_route(route, month),
+                "",
+            ]
+        lines += [
+            "Destination facts:",
+            context,
+            "",
+            "Weather summary" + (f" ({self.weather_place(details, route)}):" if route else ":"),
+            str(weather.get("summary", "N/A")),
+        ]
+        return "\n".join(lines)
 
-        # --- RAG info ---
-        rag_info = self.rag.search(place)
-        rag_summary = rag_info.split("🌍 Overview:")[-1].split("🌡️")[0].strip() \
-        if "🌍 Overview:" in rag_info else rag_info[:200]
+    def plan_route(self, details: dict):
+        """
+        Ordered multi-city route with a day split when details name several cities or an area ("Japan",
+        "Northern Italy") for a long enough trip; None for a single destination.
+        """
+        try:
+            duration = int(details.get("duration") or 5)
+        except (TypeError, ValueError):
+            duration = 5
+        with span("route") as s:
+            route = get_route_planner().plan(details.get("place") or "", duration, details.get("theme"),
+                                             trip_month(details.get("time")))
+            s.set(stops=len(route["stops"]) if route else 0)
+        return route
 
-        # --- Itinerary (ask Gemini again, but now with context) ---
-        planning_prompt = f"""
-        You are a helpful travel agent. Based on the following details,
-        suggest a day-by-day itinerary.
+    @staticmethod
+    def weather_place(details: dict, route):
+        """
+        Place the weather is looked up for: the first stop of a route (an area phrase like "Northern Italy"
+        would go to remote geocoding and could contradict the stops' climate in the route context), else
+        the requested place.
+        """
+        if route:
+            stop = route["stops"][0]
+            return f"{stop['city']}, {stop['country']}"
+        return details.get("place", "Unknown")
+
+    @staticmethod
+    def context_queries(details: dict, route):
+        """
+        RAG queries for a request: the place itself, or for a route the exact "City, Country" of every stop
+        (an area phrase like "Northern Italy" is not a city and free-text search would match an unrelated one).
+        """
+        if route:
+            return [f"{stop['city']}, {stop['country']}" for stop in route["stops"]]
+        return [details.get("place", "Unknown")]
+
+    @staticmethod
+    def context_record(records, route):
+        """
+        The record(s) for context_queries() results: the stops' records for a route, else the single record.
+        """
+        return list(records) if route else records[0]
+
+    @staticmethod
+    def rag_summary(record) -> str:
+        if isinstance(record, list):
+            return " -> ".join(f"{r['city']}, {r['country']}" for r in record if r) or summary(None)
+        return summary(record)
+
+    @staticmethod
+    def rag_info_raw(record, place: str) -> str:
+        if isinstance(record, list):
+            return "\n\n".join(describe(r) for r in record if r) or f"No info found for {place}."
+        return describe(record) if record else f"No info found for {place}."
+
+    async def gather_context(self, details: dict, route=None):
+        """
+        Run the weather lookup and the RAG search concurrently.
 
-        Trip details:
-        Place: {place}
-        Duration: {duration} days
-        Theme: {theme}
-        Time: {time}
-        Extra Info: {details.get("extras","")}
+        Returns:
+            tuple: (weather dict, RAG record dict or None; for a route the list of its stops' records)
+        """
+        time = details.get("time", "Today")
+        weather, records = await asyncio.gather(
+            self.aget_weather(self.weather_place(details, route), time),
+            asyncio.to_thread(self.rag.search_batch, self.context_queries(details, route)),
+        )
+        return weather, self.context_record(records, route)
 
-        Additional knowledge:
-        {rag_info}
+    def travel_planner(self, details: dict) -> dict:
+        """
+        Synchronous wrapper around atravel_planner (for scripts; do not call from a running event loop).
+        """
+        return asyncio.run(self.atravel_planner(details))
 
-        Weather summary:
-        {weather.get("summary","N/A")}
+    async def atravel_planner(self, details: dict) -> dict:
         """
+        Build full response: itinerary + weather + RAG info.
+        Weather and RAG lookups run concurrently; the itinerary call waits for both.
+        """
+        route = self.plan_route(details)
+        weather, record = await self.gather_context(details, route)
+        return await self.aplan(details, weather, record, route)
 
-        resp = self.client.models.generate_content(
-            model="gemini-2.0-flash-exp",
+    async def aplan(self, details: dict, weather: dict, record, route=None) -> dict:
+        """
+        Generate the itinerary for details given already-fetched weather, RAG record(s) and route
+        (see gather_context and plan_route).
+        """
+        # --- Itinerary (ask Gemini again, but now with context) ---
+        planning_prompt = self.build_planning_prompt(details, record, weather, route)
+
+        resp = await self.scheduler.generate(
+            self.client, "plan",
+            model=GEMINI_MODEL,
             contents=planning_prompt,
-            config=types.GenerateContentConfig(temperature=0.7)
+            config=generation_config(0.7)
         )
 
         itinerary_text = resp.text.strip()
@@ -138,28 +372,137 @@ class TravelChatbot:
         return {
             "parsed_prompt": details,
             "weather": weather,
-            "rag_info_raw": rag_info,
-            "rag_summary": rag_summary,
+            "rag_info_raw": self.rag_info_raw(record, details.get("place", "Unknown")),
+            "rag_summary": self.rag_summary(record),
+            "route": route,
             "itinerary": itinerary_text
         }
 
     def generate_itinerary(self, message: str) -> dict:
+        """
+        Synchronous wrapper around agenerate_itinerary (for scripts; do not call from a running event loop).
+        """
+        return asyncio.run(self.agenerate_itinerary(message))
+
+    async def agenerate_itinerary(self, message: str) -> dict:
         """
         Main entry point to generate a travel itinerary.
 
         The method takes a user's free-text request and returns a structured JSON
         with the following keys: parsed_prompt, weather, rag_info_raw, rag_summary, and itinerary.
 
-        The method first calls parse_prompt to extract structured information from the request
-        and then calls travel_planner to generate the itinerary based on the extracted information.
+        The method first calls aparse_prompt to extract structured information from the request
+        and then calls atravel_planner to generate the itinerary based on the extracted information.
         """
-        details = self.parse_prompt(message)
-        result = self.travel_planner(details)
+        details = await self.aparse_prompt(message)
+        result = await self.atravel_planner(details)
         return result
 
+    def generate_batch(self, items, concurrency=BATCH_CONCURRENCY) -> list:
+        """
+        Synchronous wrapper around agenerate_batch returning results in input order
+        (for scripts; do not call from a running event loop).
+        """
+        async def collect():
+            results = [None] * len(items)
+            async for i, result in self.agenerate_batch(items, concurrency):
+                results[i] = result
+            return results
+        return asyncio.run(collect())
+
+    async def agenerate_batch(self, items, concurrency=BATCH_CONCURRENCY):
+        """
+        Generate many itineraries at once.
+
+        Each item is either {"message": "..."} (parsed like a /chat request) or an already-structured
+        details dict with place/theme/duration/time/extras. Retrieval for all items is one batched
+        encode + FAISS search, weather is fetched once per distinct place/month, and Gemini calls fan
+        out under a semaphore of size concurrency.
+
+        Async generator yielding (index, result) as each itinerary completes; a failed item yields
+        (index, {"error": ...}) without aborting the batch.
+        """
+        semaphore = asyncio.Semaphore(max(1, concurrency))
 
+        async def parse(item):
+            if "message" not in item:
+                return {**DEFAULT_DETAILS, **item}
+            async with semaphore:
+                return await self.aparse_prompt(item["message"])
 
+        parsed = await asyncio.gather(*(parse(item) for item in items), return_exceptions=True)
 
+        ok = [i for i, d in enumerate(parsed) if not isinstance(d, BaseException)]
+        routes = {i: self.plan_route(parsed[i]) for i in ok}
+        queries = {i: self.context_queries(parsed[i], routes[i]) for i in ok}
+        found = iter(await asyncio.to_thread(self.rag.search_batch, [q for i in ok for q in queries[i]]))
+        records = {i: self.context_record([next(found) for _ in queries[i]], routes[i]) for i in ok}
 
+        weather_tasks, weather_keys = {}, {}
+        for i in ok:
+            place = self.weather_place(parsed[i], routes[i])
+            key = weather_keys[i] = weather_key(parsed[i], place)
+            if key not in weather_tasks:
+                weather_tasks[key] = asyncio.create_task(self.aget_weather(place, parsed[i].get("time", "Today")))
 
+        async def plan(i):
+            details = parsed[i]
+            if isinstance(details, BaseException):
+                return i, error_result(details)
+            try:
+                weather = await weather_tasks[weather_keys[i]]
+                async with semaphore:
+                    return i, await self.aplan(details, weather, records[i], routes[i])
+            except Exception as e:
+                return i, error_result(e, parsed_prompt=details)
 
+        for next_done in asyncio.as_completed([plan(i) for i in range(len(items))]):
+            yield await next_done
+
+    async def astream_itinerary(self, message: str):
+        """
+        Streaming variant of agenerate_itinerary.
+
+        Async generator yielding (event, data) tuples as each stage finishes:
+        - ("parsed_prompt", details)
+        - ("route", route) for a multi-city trip (see plan_route)
+        - ("weather", weather) and ("rag", {"rag_summary", "rag_info_raw"}), in whichever order they complete
+        - ("itinerary", {"text": chunk}) for every chunk streamed from Gemini
+        - ("done", {})
+        """
+        details = await self.aparse_prompt(message)
+        yield "parsed_prompt", details
+
+        place = details.get("place", "Unknown")
+        route = self.plan_route(details)
+        if route:
+            yield "route", route
+        weather_task = asyncio.create_task(
+            self.aget_weather(self.weather_place(details, route), details.get("time", "Today")))
+        rag_task = asyncio.create_task(asyncio.to_thread(self.rag.search_batch, self.context_queries(details, route)))
+        try:
+            pending = {weather_task, rag_task}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                if weather_task in done:
+                    yield "weather", weather_task.result()
+                if rag_task in done:
+                    record = self.context_record(rag_task.result(), route)
+                    yield "rag", {"rag_summary": self.rag_summary(record),
+                                  "rag_info_raw": self.rag_info_raw(record, place)}
+        finally:
+            for task in (weather_task, rag_task):
+                task.cancel()
+
+        record = self.context_record(rag_task.result(), route)
+        planning_prompt = self.build_planning_prompt(details, record, weather_task.result(), route)
+        stream = self.scheduler.generate_stream(
+            self.client, "plan",
+            model=GEMINI_MODEL,
+            contents=planning_prompt,
+            config=generation_config(0.7)
+        )
+        async for chunk in stream:
+            if chunk.text:
+                yield "itinerary", {"text": chunk.text}
+        yield "done", {}
@@ -0,0 +1,356 @@
+import os
+import csv
+import json
+import hashlib
+import logging
+import threading
+import numpy as np
+
+CITY_STORE_DIR = os.getenv("CITY_STORE_DIR", os.path.join(".cache", "citystore"))
+FORMAT_VERSION = 2
+
+THEME_COLUMNS = ["culture", "adventure", "nature", "beaches", "nightlife", "cuisine", "wellness", "urban", "seclusion"]
+BUDGET_LEVELS = ["Budget", "Mid-range", "Luxury"]
+DURATION_LABELS = ["Day trip", "Weekend", "Short trip", "One week", "Long trip"]
+CLIMATE_STATS = ("avg", "min", "max")
+
+TEXT_COLUMNS = ["id", "city", "short_description"]      # stored as one UTF-8 blob + offsets each
+CATEGORY_COLUMNS = ["country", "region"]                # stored as int16 codes + vocabulary
+
+# used when the CSV is missing
+FALLBACK_CITIES = [
+    {"id": "fallback-tokyo", "city": "Tokyo", "country": "Japan", "region": "asia",
+     "short_description": "major cultural sites, great food, efficient transport",
+     "latitude": 35.6762, "longitude": 139.6503, "budget_level": "Luxury",
+     "ideal_durations": '["Short trip","One week"]', "themes": [5, 3, 3, 1, 4, 5, 3, 5, 1]},
+    {"id": "fallback-kyoto", "city": "Kyoto", "country": "Japan", "region": "asia",
+     "short_description": "temples, traditional culture, best during cherry blossom and autumn",
+     "latitude": 35.0116, "longitude": 135.7681, "budget_level": "Mid-range",
+     "ideal_durations": '["Weekend","Short trip"]', "themes": [5, 2, 3, 1, 3, 5, 3, 4, 2]},
+    {"id": "fallback-paris", "city": "Paris", "country": "France", "region": "europe",
+     "short_description": "museums, cafes, art, lively nightlife",
+     "latitude": 48.8566, "longitude": 2.3522, "budget_level": "Luxury",
+     "ideal_durations": '["Short trip","One week"]', "themes": [5, 3, 4, 2, 5, 5, 4, 5, 1]},
+    {"id": "fallback-bangkok", "city": "Bangkok", "country": "Thailand", "region": "asia",
+     "short_description": "street food, temples, vibrant nightlife",
+     "latitude": 13.7563, "longitude": 100.5018, "budget_level": "Budget",
+     "ideal_durations": '["Weekend","Short trip"]', "themes": [4, 4, 3, 4, 5, 5, 3, 4, 1]},
+]
+
+
+log = logging.getLogger(__name__)
+
+def parse_monthly_temps(raw):
+    """
+    Parse an avg_temp_monthly JSON blob ({"1": {"avg": .., "min": .., "max": ..}, ...}) into a 12x3 list.
+
+    Returns:
+        list or None: [[avg, min, max], ...] for months 1-12 (NaN for gaps); None if the blob is unusable
+    """
+    try:
+        data = json.loads(raw)
+    except (TypeError, ValueError):
+        return None
+    if not isinstance(data, dict):
+        return None
+    monthly = []
+    for m in range(1, 13):
+        entry = data.get(str(m)) or {}
+        monthly.append([float(entry[s]) if entry.get(s) is not None else float("nan") for s in CLIMATE_STATS])
+    return monthly
+
+
+def parse_durations(raw):
+    """
+    Parse an ideal_durations JSON list (["Short trip", "One week"]) into a DURATION_LABELS bitmask.
+    """
+    try:
+        labels = json.loads(raw)
+    except (TypeError, ValueError):
+        return 0
+    mask = 0
+    for label in labels if isinstance(labels, list) else []:
+        if label in DURATION_LABELS:
+            mask |= 1 << DURATION_LABELS.index(label)
+    return mask
+
+
+class StringColumn:
+    """
+    Immutable column of strings stored as one UTF-8 byte blob plus an int64 offset array (n + 1 entries).
+    Both arrays are plain NumPy, so they can be memory-mapped and shared between processes.
+    """
+
+    def __init__(self, blob, offsets):
+        self.blob = blob
+        self.offsets = offsets
+
+    @classmethod
+    def from_list(cls, values):
+        encoded = [str(v).encode("utf-8") for v in values]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(b) for b in encoded])
+        blob = np.frombuffer(b"".join(encoded), dtype=np.uint8) if encoded else np.zeros(0, dtype=np.uint8)
+        return cls(blob, offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return self.blob[self.offsets[i]:self.offsets[i + 1]].tobytes().decode("utf-8")
+
+    def tolist(self):
+        return [self[i] for i in range(len(self))]
+
+
+class CategoryColumn:
+    """
+    Immutable column of interned strings: int16 codes into a vocabulary list.
+    """
+
+    def __init__(self, codes, vocab):
+        self.codes = codes
+        self.vocab = vocab
+
+    @classmethod
+    def from_list(cls, values):
+        vocab, index = [], {}
+        codes = np.empty(len(values), dtype=np.int16)
+        for i, v in enumerate(values):
+            v = str(v)
+            if v not in index:
+                index[v] = len(vocab)
+                vocab.append(v)
+            codes[i] = index[v]
+        return cls(codes, vocab)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, i):
+        return self.vocab[self.codes[i]]
+
+    def tolist(self):
+        return [self.vocab[c] for c in self.codes]
+
+
+class CityStore:
+    """
+    Typed, immutable, columnar copy of cities.csv, built once and shared by every consumer
+    (retrieval, geocoding, climatology, recommender, prompt parser, RAG summaries).
+
+    Columns:
+        id, city, short_description: StringColumn
+        country, region: CategoryColumn
+        lat, lon: float32 (n,)
+        climate: float32 (n, 12, 3) monthly avg/min/max temperatures, NaN for gaps
+        themes: int8 (n, 9) theme ratings (1-5) in THEME_COLUMNS order; 0 where the CSV has no valid rating
+        budget: int8 (n,) index into BUDGET_LEVELS, -1 if unknown
+        durations: uint8 (n,) bitmask over DURATION_LABELS
+
+    save() writes one .npy per array plus a meta.json; load() memory-maps them back.
+    """
+
+    def __init__(self, columns, vocabs):
+        self._columns = columns
+        self.id = StringColumn(columns["id.blob"], columns["id.offsets"])
+        self.city = StringColumn(columns["city.blob"], columns["city.offsets"])
+        self.short_description = StringColumn(columns["short_description.blob"],
+                                              columns["short_description.offsets"])
+        self.country = CategoryColumn(columns["country.codes"], vocabs["country"])
+        self.region = CategoryColumn(columns["region.codes"], vocabs["region"])
+        self.lat = columns["lat"]
+        self.lon = columns["lon"]
+        self.climate = columns["climate"]
+        self.themes = columns["themes"]
+        self.budget = columns["budget"]
+        self.durations = columns["durations"]
+        self._vocabs = vocabs
+        # csv_digest() of the CSV this store was built from (set by build_store; None for the fallback)
+        self.digest = None
+
+    def __len__(self):
+        return len(self.lat)
+
+    @classmethod
+    def from_rows(cls, rows):
+        """
+        Build a store from dicts shaped like csv.DictReader rows (FALLBACK_CITIES may carry a ready "themes" list).
+        """
+        values = {name: [] for name in TEXT_COLUMNS + CATEGORY_COLUMNS}
+        lat, lon, climate, themes, budget, durations = [], [], [], [], [], []
+        for row in rows:
+            for name in values:
+                values[name].append(row.get(name) or "")
+            lat.append(_float(row.get("latitude")))
+            lon.append(_float(row.get("longitude")))
+            climate.append(parse_monthly_temps(row.get("avg_temp_monthly")) or [[float("nan")] * 3] * 12)
+            ratings = row.get("themes") or [_int(row.get(c)) for c in THEME_COLUMNS]
+            if 0 in ratings:
+                log.warning("⚠️ [CityStore] %s: no valid rating for %s", row.get("city") or row.get("id"),
+                            ", ".join(c for c, v in zip(THEME_COLUMNS, ratings) if v == 0))
+            themes.append(ratings)
+            budget.append(BUDGET_LEVELS.index(row["budget_level"])
+                          if row.get("budget_level") in BUDGET_LEVELS else -1)
+            durations.append(parse_durations(row.get("ideal_durations")))
+
+        columns, vocabs = {}, {}
+        for name in TEXT_COLUMNS:
+            col = StringColumn.from_list(values[name])
+            columns[f"{name}.blob"], columns[f"{name}.offsets"] = col.blob, col.offsets
+        for name in CATEGORY_COLUMNS:
+            col = CategoryColumn.from_list(values[name])
+            columns[f"{name}.codes"], vocabs[name] = col.codes, col.vocab
+        columns["lat"] = np.array(lat, dtype=np.float32)
+        columns["lon"] = np.array(lon, dtype=np.float32)
+        columns["climate"] = np.array(climate, dtype=np.float32).reshape(-1, 12, 3)
+        columns["themes"] = np.array(themes, dtype=np.int8).reshape(-1, len(THEME_COLUMNS))
+        columns["budget"] = np.array(budget, dtype=np.int8)
+        columns["durations"] = np.array(durations, dtype=np.uint8)
+        return cls(columns, vocabs)
+
+    @classmethod
+    def from_csv(cls, csv_path):
+        with open(csv_path, newline="", encoding="utf-8") as f:
+            return cls.from_rows(csv.DictReader(f))
+
+    def save(self, directory):
+        """
+        Write every column as .npy plus meta.json into directory, atomically (temp dir + rename).
+        """
+        parent = os.path.dirname(os.path.abspath(directory))
+        os.makedirs(parent, exist_ok=True)
+        tmp = f"{directory}.{os.getpid()}.tmp"
+        os.makedirs(tmp, exist_ok=True)
+        for name, array in self._columns.items():
+            np.save(os.path.join(tmp, f"{name}.npy"), np.ascontiguousarray(array))
+        with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({"version": FORMAT_VERSION, "columns": sorted(self._columns), "vocabs": self._vocabs}, f)
+        try:
+            os.rename(tmp, directory)
+        except OSError:
+            # another worker got there first; its copy is identical
+            import shutil
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    @classmethod
+    def load(cls, directory):
+        """
+        Memory-map a store written by save().
+        """
+        with open(os.path.join(directory, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("version") != FORMAT_VERSION:
+            raise ValueError(f"unsupported CityStore format {meta.get('version')}")
+        columns = {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r")
+                   for name in meta["columns"]}
+        return cls(columns, meta["vocabs"])
+
+    def record(self, i) -> dict:
+        """
+        Plain-Python view of row i (for summaries and API responses).
+        """
+        climate = self.climate[i]
+        return {
+            "id": self.id[i],
+            "city": self.city[i],
+            "country": self.country[i],
+            "region": self.region[i],
+            "short_description": self.short_description[i],
+            "latitude": float(self.lat[i]),
+            "longitude": float(self.lon[i]),
+            "avg_temp_monthly": {
+                str(m + 1): {s: round(float(v), 1) for s, v in zip(CLIMATE_STATS, climate[m]) if not np.isnan(v)}
+                for m in range(12) if not np.isnan(climate[m, 0])
+            },
+            "budget_level": BUDGET_LEVELS[self.budget[i]] if self.budget[i] >= 0 else None,
+            "ideal_durations": [label for b, label in enumerate(DURATION_LABELS) if self.durations[i] & (1 << b)],
+            "themes": {t.capitalize(): int(v) for t, v in zip(THEME_COLUMNS, self.themes[i]) if v > 0},
+        }
+
+
+def csv_digest(csv_path):
+    h = hashlib.sha256(f"citystore-v{FORMAT_VERSION}".encode("utf-8"))
+    with open(csv_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()[:16]
+
+
+def build_store(csv_path="cities.csv", store_dir=CITY_STORE_DIR):
+    """
+    Return the CityStore for csv_path: memory-mapped from store_dir if a store for these exact CSV bytes
+    exists, otherwise parsed from the CSV and saved there. Falls back to FALLBACK_CITIES if the CSV is missing.
+    """
+    if not os.path.exists(csv_path):
+        return CityStore.from_rows(FALLBACK_CITIES)
+    digest = csv_digest(csv_path)
+    store = _load_or_parse(csv_path, store_dir, digest)
+    store.digest = digest
+    return store
+
+
+def _load_or_parse(csv_path, store_dir, digest):
+    if not store_dir:
+        return CityStore.from_csv(csv_path)
+    directory = os.path.join(store_dir, digest)
+    if os.path.exists(os.path.join(directory, "meta.json")):
+        try:
+            return CityStore.load(directory)
+        except (OSError, ValueError) as e:
+            log.warning("⚠️ [CityStore] ignoring unreadable store: %s", e)
+    store = CityStore.from_csv(csv_path)
+    try:
+        store.save(directory)
+    except OSError as e:
+        log.warning("⚠️ [CityStore] could not write store: %s", e)
+    return store
+
+
+def _float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float("nan")
+
+
+def _int(value):
+    # 0 marks a missing or malformed rating (valid ratings are 1-5)
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_city_store(csv_path="cities.csv"):
+    """
+    Return the process-wide CityStore for csv_path, building or memory-mapping it on first call.
+    """
+    key = os.path.abspath(csv_path)
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = _stores[key] = build_store(csv_path)
+    return store
+
+
+def reload_city_store(csv_path="cities.csv"):
+    """
+    Re-read csv_path and make the result the process-wide CityStore. When the CSV bytes are unchanged the
+    current store object itself is returned, so everything rebuilt on a new store (retrieval, geocoder,
+    recommender, ...) is kept. Callers holding a previous store keep a consistent, still-valid copy.
+    """
+    key = os.path.abspath(csv_path)
+    with _stores_lock:
+        current = _stores.get(key)
+    if current is not None and current.digest is not None and os.path.exists(csv_path) \
+            and csv_digest(csv_path) == current.digest:
+        return current
+    store = build_store(csv_path)
+    with _stores_lock:
+        _stores[key] = store
+    return store
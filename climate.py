@@ -0,0 +1,74 @@
+import threading
+import numpy as np
+from city_store import CLIMATE_STATS as STATS, get_city_store
+from geocode import normalize_name
+
+MONTH_NAMES = ["January", "February", "March", "April", "May", "June",
+               "July", "August", "September", "October", "November", "December"]
+
+
+class Climatology:
+    """
+    Monthly temperature normals for every city in the cities CSV.
+
+    Reads the (cities, 12, 3) float32 avg/min/max array that the CityStore parsed from avg_temp_monthly
+    (NaN where the dataset has no value). Lookups are a dict hit plus an array index, so month queries
+    for known cities need no network access.
+    """
+
+    def __init__(self, csv_path="cities.csv"):
+        self.csv_path = csv_path
+        self.load()
+
+    def load(self):
+        store = get_city_store(self.csv_path)
+        self.store = store
+        rows = {}
+        for i in range(len(store)):
+            city, country = store.city[i], store.country[i]
+            for key in (city, f"{city} {country}"):
+                rows.setdefault(normalize_name(key), i)
+        self.temps = store.climate
+        self._rows = rows
+
+    def row(self, place: str):
+        """
+        Returns:
+            int or None: row index of place in the climate array; None if the place is unknown
+        """
+        if not place:
+            return None
+        return self._rows.get(normalize_name(place))
+
+    def lookup(self, place: str, month: int):
+        """
+        Args:
+            place (str): human-readable place name
+            month (int): month of the year (1-12)
+
+        Returns:
+            dict or None: {"avg", "min", "max"} in °C for that month; None if the place is unknown or has no data
+        """
+        i = self.row(place)
+        if i is None:
+            return None
+        values = self.temps[i, month - 1]
+        if np.isnan(values[0]):
+            return None
+        return {stat: (None if np.isnan(v) else round(float(v), 1)) for stat, v in zip(STATS, values)}
+
+
+_climatology = None
+_climatology_lock = threading.Lock()
+
+
+def get_climatology(csv_path="cities.csv"):
+    """
+    Return the process-wide Climatology, rebuilding it when the CityStore was reloaded.
+    """
+    global _climatology
+    store = get_city_store(csv_path)
+    with _climatology_lock:
+        if _climatology is None or _climatology.store is not store:
+            _climatology = Climatology(csv_path)
+    return _climatology
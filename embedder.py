@@ -0,0 +1,146 @@
+import os
+import time
+import logging
+import threading
+from concurrent.futures import Future
+import numpy as np
+from cache import TTLCache
+from telemetry import histogram, mark_cache, span
+
+# under concurrent load, how long the worker waits for more queries before running a batch
+EMBED_BATCH_WAIT_MS = float(os.getenv("EMBED_BATCH_WAIT_MS", "2"))
+EMBED_MAX_BATCH = int(os.getenv("EMBED_MAX_BATCH", "64"))
+# query embeddings kept in the LRU (0 disables it); ~1.5 KB each for MiniLM
+EMBED_CACHE_SIZE = int(os.getenv("EMBED_CACHE_SIZE", "20000"))
+
+EMBED_BATCH_SIZE = histogram("travel_embed_batch_size", "Texts per embedding forward pass.",
+                             buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256))
+
+log = logging.getLogger(__name__)
+
+
+def cache_key(text: str) -> str:
+    # MiniLM's tokenizer is uncased and splits on whitespace, so case and spacing do not change the embedding
+    return " ".join(str(text).split()).lower()
+
+
+class EmbeddingService:
+    """
+    Shared query encoder: concurrent encode() calls from request threads are queued, collected by one worker
+    thread into micro-batches and run through the model in a single forward pass, instead of one small pass
+    per request competing for the same cores. A batch takes up to max_batch texts; once several queries
+    arrive together the worker waits up to wait_ms for more, while a lone query runs at once. New queries
+    queue up while a batch runs, so batches grow with the load.
+
+    An LRU of query embeddings sits in front of the queue: repeated place names and queries never reach the
+    model. Embeddings depend only on the model, so the cache survives dataset reloads.
+
+    Args:
+        encode (callable): list of texts -> (n, dim) array; only ever called from the worker thread
+        max_batch (int): most texts per forward pass
+        wait_ms (float): batching window in milliseconds (0 batches only what is already queued)
+        cache_size (int): LRU capacity in embeddings
+    """
+
+    def __init__(self, encode, max_batch=EMBED_MAX_BATCH, wait_ms=EMBED_BATCH_WAIT_MS, cache_size=EMBED_CACHE_SIZE):
+        self._encode = encode
+        self.max_batch = max(1, int(max_batch))
+        self.wait = max(0.0, float(wait_ms)) / 1000.0
+        self.cache = TTLCache(maxsize=cache_size, ttl=float("inf")) if cache_size > 0 else None
+        self.batches = 0
+        self.encoded = 0
+        self._pending = []              # (cache key, text, future)
+        self._last_batch = 0
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def encode(self, texts):
+        """
+        Args:
+            texts (list): query strings
+
+        Returns:
+            np.ndarray: (len(texts), dim) float32 embeddings, in order; blocks until they are computed
+        """
+        texts = list(texts)
+        vectors = [None] * len(texts)
+        missing = {}                    # cache key -> (text, positions)
+        for i, text in enumerate(texts):
+            key = cache_key(text)
+            vector = self.cache.get(key) if self.cache is not None else None
+            if vector is None:
+                missing.setdefault(key, (text, []))[1].append(i)
+            else:
+                vectors[i] = vector
+        if self.cache is not None and texts:
+            mark_cache("embedding", "miss" if missing else "hit")
+        if missing:
+            futures = self._submit([(key, text) for key, (text, _) in missing.items()])
+            for (_, positions), future in zip(missing.values(), futures):
+                vector = future.result()
+                for i in positions:
+                    vectors[i] = vector
+        if not vectors:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.stack(vectors)
+
+    def _submit(self, items):
+        futures = [Future() for _ in items]
+        with self._cond:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="embedding-service", daemon=True)
+                self._thread.start()
+            self._pending.extend((key, text, future) for (key, text), future in zip(items, futures))
+            self._cond.notify()
+        return futures
+
+    def _next_batch(self):
+        with self._cond:
+            while not self._pending:
+                self._cond.wait()
+            # a lone query with no concurrent traffic behind it runs at once instead of paying the window
+            busy = len(self._pending) > 1 or self._last_batch > 1
+            deadline = time.monotonic() + (self.wait if busy else 0.0)
+            while len(self._pending) < self.max_batch:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    break
+                self._cond.wait(left)
+            batch, self._pending = self._pending[:self.max_batch], self._pending[self.max_batch:]
+            self._last_batch = len(batch)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            # callers asking for the same text in one window share its row
+            texts = {}
+            for key, text, _ in batch:
+                texts.setdefault(key, text)
+            try:
+                with span("embed_batch", size=len(texts)):
+                    matrix = np.asarray(self._encode(list(texts.values())), dtype=np.float32)
+            except Exception as e:
+                log.warning("⚠️ [embedder] batch of %s failed: %s", len(texts), e)
+                for _, _, future in batch:
+                    future.set_exception(e)
+                continue
+            EMBED_BATCH_SIZE.observe(len(texts))
+            self.batches += 1
+            self.encoded += len(texts)
+            rows = dict(zip(texts, matrix))
+            for key, vector in rows.items():
+                vector.flags.writeable = False
+                if self.cache is not None:
+                    self.cache.set(key, vector)
+            for key, _, future in batch:
+                future.set_result(rows[key])
+
+    def stats(self):
+        """
+        Returns:
+            dict: LRU size/hits/misses, forward passes run, texts encoded and their mean batch size
+        """
+        cache = self.cache.stats() if self.cache is not None else {}
+        return {**cache, "batches": self.batches, "encoded": self.encoded,
+                "mean_batch": round(self.encoded / self.batches, 2) if self.batches else 0.0}
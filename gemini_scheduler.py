@@ -0,0 +1,322 @@
+import os
+import math
+import time
+import heapq
+import random
+import asyncio
+import logging
+import itertools
+import threading
+from telemetry import LLM_QUEUED, LLM_TOKENS, end_span, span, start_span
+
+# processes sharing one API key (serve.py sets it to its worker count); each gets an equal share of the quota
+GEMINI_PROCESSES = max(1, int(os.getenv("GEMINI_PROCESSES", "1")))
+# client-side Gemini quota; match GEMINI_RPM/GEMINI_TPM to the project's rate limits, the per-process
+# share is used here
+GEMINI_RPM = float(os.getenv("GEMINI_RPM", "10")) / GEMINI_PROCESSES
+GEMINI_TPM = float(os.getenv("GEMINI_TPM", "1000000")) / GEMINI_PROCESSES
+GEMINI_MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", "3"))
+BACKOFF_BASE = 1.0          # seconds; full-jitter exponential backoff between retries
+BACKOFF_MAX = 30.0
+CHARS_PER_TOKEN = 4
+
+# lane -> (priority, max queued calls, expected output tokens); lower priority value is served first
+LANES = {
+    "parse": (0, int(os.getenv("GEMINI_PARSE_QUEUE", "64")), 128),
+    "plan": (1, int(os.getenv("GEMINI_PLAN_QUEUE", "32")), 2048),
+}
+# stage name of each lane's calls in timing spans
+LANE_STAGES = {"parse": "llm_parse", "plan": "itinerary"}
+RETRY_CODES = {429, 500, 502, 503, 504}
+
+log = logging.getLogger(__name__)
+
+
+class SchedulerBusy(Exception):
+    """
+    Raised instead of queueing when a lane is full; retry_after is the estimated wait in seconds.
+    """
+
+    def __init__(self, lane: str, retry_after: float):
+        super().__init__(f"Gemini {lane} queue is full; retry in {math.ceil(retry_after)}s")
+        self.lane = lane
+        self.retry_after = retry_after
+
+
+def error_code(e: Exception):
+    """
+    HTTP-style status of a Gemini error (google.genai.errors.APIError.code), or None.
+    """
+    code = getattr(e, "code", None)
+    if isinstance(code, int):
+        return code
+    if "RESOURCE_EXHAUSTED" in str(e):
+        return 429
+    return None
+
+
+def is_quota_error(e: Exception) -> bool:
+    return isinstance(e, SchedulerBusy) or error_code(e) == 429
+
+
+def retry_after(e: Exception) -> int:
+    """
+    Seconds a client should wait before retrying after e (for the Retry-After header).
+    """
+    if isinstance(e, SchedulerBusy):
+        return max(1, math.ceil(e.retry_after))
+    return max(1, math.ceil(60.0 / GEMINI_RPM))
+
+
+def estimate_tokens(contents) -> int:
+    return -(-len(str(contents)) // CHARS_PER_TOKEN)
+
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at rate_per_minute / 60 per second, holding at most capacity.
+    Not thread-safe on its own; GeminiScheduler guards it with its lock.
+    """
+
+    def __init__(self, rate_per_minute: float, capacity=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or rate_per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, amount: float, now: float) -> float:
+        """
+        Seconds until amount tokens are available (0 if they are now).
+        """
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        return 0.0 if self.tokens >= amount else (amount - self.tokens) / self.rate
+
+    def take(self, amount: float, now: float):
+        self._refill(now)
+        self.tokens -= amount
+
+    def drain(self, now: float):
+        self._refill(now)
+        self.tokens = min(self.tokens, 0.0)
+
+
+class GeminiScheduler:
+    """
+    Client-side scheduler for every Gemini call in the process.
+
+    - Two token buckets cap requests per minute and tokens per minute (input estimated from the prompt
+      length plus the lane's expected output, corrected from usage_metadata after each call).
+    - Calls wait in one priority queue: the cheap "parse" lane is always dispatched before the
+      "plan" (itinerary) lane, FIFO within a lane.
+    - Each lane's queue is bounded; a call that would overflow it raises SchedulerBusy immediately
+      with an estimated retry-after instead of waiting.
+    - 429 and 5xx responses are retried with full-jitter exponential backoff. A 429 also empties the
+      request bucket so queued calls back off together instead of hitting the quota one by one.
+
+    Waiters may live on different event loops (the sync wrappers use asyncio.run); each one sleeps on
+    its own future and is woken with call_soon_threadsafe.
+    """
+
+    def __init__(self, rpm=GEMINI_RPM, tpm=GEMINI_TPM, lanes=None, max_retries=GEMINI_MAX_RETRIES):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.lanes = lanes or LANES
+        self.max_retries = max_retries
+        self._heap = []             # [priority, seq, future]
+        self._queued = {lane: 0 for lane in self.lanes}
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self.counters = {"calls": 0, "rejected": 0, "retries": 0, "quota_errors": 0, "wait_seconds": 0.0}
+
+    def check(self, lane: str):
+        """
+        Raise SchedulerBusy if a call on lane would be rejected right now (lets endpoints fail fast).
+        """
+        with self._lock:
+            self._check_locked(lane)
+
+    def _check_locked(self, lane):
+        _, max_queued, _ = self.lanes[lane]
+        if self._queued[lane] >= max_queued:
+            self.counters["rejected"] += 1
+            ahead = sum(self._queued[name] for name, spec in self.lanes.items() if spec[0] <= self.lanes[lane][0])
+            raise SchedulerBusy(lane, (ahead + 1) / self.requests.rate)
+
+    def _wake_head(self):
+        if self._heap:
+            future = self._heap[0][2]
+            future.get_loop().call_soon_threadsafe(_resolve, future)
+
+    async def acquire(self, lane: str, tokens: int, admit=True):
+        """
+        Wait until lane's turn and the buckets allow one request of tokens tokens, then take them.
+        """
+        loop = asyncio.get_running_loop()
+        started = time.monotonic()
+        entry = [self.lanes[lane][0], next(self._seq), loop.create_future()]
+        with self._lock:
+            if admit:
+                self._check_locked(lane)
+            heapq.heappush(self._heap, entry)
+            self._queued[lane] += 1
+            LLM_QUEUED.set(self._queued[lane], lane=lane)
+            if self._heap[0] is entry:
+                _resolve(entry[2])
+        try:
+            while True:
+                await entry[2]
+                with self._lock:
+                    now = time.monotonic()
+                    if self._heap[0] is not entry:          # pre-empted by a higher-priority call
+                        entry[2] = loop.create_future()
+                        continue
+                    wait = max(self.requests.delay(1, now), self.tokens.delay(tokens, now))
+                    if wait <= 0:
+                        self.requests.take(1, now)
+                        self.tokens.take(tokens, now)
+                        heapq.heappop(self._heap)
+                        self._queued[lane] -= 1
+                        LLM_QUEUED.set(self._queued[lane], lane=lane)
+                        self.counters["wait_seconds"] += now - started
+                        self._wake_head()
+                        return
+                    entry[2] = loop.create_future()
+                # still the head: sleep until the buckets refill, or until a higher-priority arrival wakes us
+                try:
+                    await asyncio.wait_for(asyncio.shield(entry[2]), timeout=wait)
+                except asyncio.TimeoutError:
+                    _resolve(entry[2])
+        except BaseException:
+            with self._lock:
+                if entry in self._heap:
+                    self._heap.remove(entry)
+                    heapq.heapify(self._heap)
+                    self._queued[lane] -= 1
+                    LLM_QUEUED.set(self._queued[lane], lane=lane)
+                    self._wake_head()
+            raise
+
+    def _settle(self, lane: str, estimated: int, response, s):
+        """
+        Correct the token bucket from the response's usage_metadata and record the token counts.
+        """
+        usage = getattr(response, "usage_metadata", None)
+        prompt = getattr(usage, "prompt_token_count", None) or 0
+        output = getattr(usage, "candidates_token_count", None) or 0
+        actual = getattr(usage, "total_token_count", None) or prompt + output
+        if actual:
+            with self._lock:
+                self.tokens.take(actual - estimated, time.monotonic())
+        LLM_TOKENS.inc(prompt, lane=lane, kind="prompt")
+        LLM_TOKENS.inc(output, lane=lane, kind="output")
+        s.set(prompt_tokens=prompt, output_tokens=output)
+
+    def _backoff(self, e: Exception, attempt: int) -> float:
+        code = error_code(e)
+        if code not in RETRY_CODES or attempt >= self.max_retries:
+            return -1
+        if code == 429:
+            self.counters["quota_errors"] += 1
+            with self._lock:
+                self.requests.drain(time.monotonic())
+        self.counters["retries"] += 1
+        return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+    async def generate(self, client, lane: str, **kwargs):
+        """
+        Scheduled client.aio.models.generate_content(**kwargs) on lane ("parse" or "plan").
+        """
+        estimated = estimate_tokens(kwargs.get("contents", "")) + self.lanes[lane][2]
+        attempt = 0
+        with span(LANE_STAGES.get(lane, lane)) as s:
+            while True:
+                queued = time.perf_counter()
+                await self.acquire(lane, estimated, admit=attempt == 0)
+                s.set(queue_ms=round((time.perf_counter() - queued) * 1000, 3), retries=attempt)
+                self.counters["calls"] += 1
+                try:
+                    response = await client.aio.models.generate_content(**kwargs)
+                except Exception as e:
+                    delay = self._backoff(e, attempt)
+                    if delay < 0:
+                        raise
+                    log.warning("⚠️ [gemini] %s call failed (%s); retry %d in %.1fs", lane, e, attempt + 1, delay)
+                    await asyncio.sleep(delay)
+                    attempt += 1
+                    continue
+                self._settle(lane, estimated, response, s)
+                return response
+
+    async def generate_stream(self, client, lane: str, **kwargs):
+        """
+        Scheduled client.aio.models.generate_content_stream(**kwargs). Opening the stream is retried like
+        generate(); errors after the first chunk are raised to the caller.
+        """
+        estimated = estimate_tokens(kwargs.get("contents", "")) + self.lanes[lane][2]
+        attempt = 0
+        # a span cannot be the current one across yields, so this one is started and ended explicitly
+        s = start_span(LANE_STAGES.get(lane, lane), stream=True)
+        try:
+            while True:
+                queued = time.perf_counter()
+                await self.acquire(lane, estimated, admit=attempt == 0)
+                s.set(queue_ms=round((time.perf_counter() - queued) * 1000, 3), retries=attempt)
+                self.counters["calls"] += 1
+                try:
+                    stream = await client.aio.models.generate_content_stream(**kwargs)
+                    iterator = stream.__aiter__()
+                    first = await iterator.__anext__()
+                except StopAsyncIteration:
+                    return
+                except Exception as e:
+                    delay = self._backoff(e, attempt)
+                    if delay < 0:
+                        raise
+                    log.warning("⚠️ [gemini] %s stream failed (%s); retry %d in %.1fs", lane, e, attempt + 1, delay)
+                    await asyncio.sleep(delay)
+                    attempt += 1
+                    continue
+                break
+
+            s.set(first_chunk_ms=round((time.perf_counter() - s.start) * 1000, 3))
+            last = first
+            yield first
+            async for chunk in iterator:
+                last = chunk
+                yield chunk
+            self._settle(lane, estimated, last, s)
+        finally:
+            end_span(s)
+
+    def stats(self):
+        with self._lock:
+            now = time.monotonic()
+            self.requests._refill(now)
+            self.tokens._refill(now)
+            return {**self.counters, "queued": dict(self._queued),
+                    "request_tokens": round(self.requests.tokens, 2), "token_budget": round(self.tokens.tokens)}
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """
+    Return the process-wide GeminiScheduler, creating it on first call.
+    """
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = GeminiScheduler()
+    return _scheduler
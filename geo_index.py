@@ -0,0 +1,132 @@
+import os
+import math
+import threading
+import numpy as np
+from city_store import get_city_store
+
+EARTH_RADIUS_KM = 6371.0088
+HALF_CIRCUMFERENCE_KM = math.pi * EARTH_RADIUS_KM
+KM_PER_DEGREE = EARTH_RADIUS_KM * math.pi / 180.0
+# grid cell size in degrees; a radius query scans ~(2r / (cell * 111 km))^2 cells
+GEO_CELL_DEG = float(os.getenv("GEO_CELL_DEG", "1.0"))
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """
+    Great-circle distance in km; every argument may be a scalar or a NumPy array (broadcast).
+    """
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=np.float64)) for v in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+class GeoIndex:
+    """
+    Fixed lat/lon grid over city coordinates for radius and k-nearest queries.
+
+    Points are sorted by cell (row-major: latitude band, then longitude), so the cells of one latitude band
+    are contiguous and a band's longitude range is one slice of `order` (two across the antimeridian).
+    A query gathers the slices overlapping its bounding box and filters them by exact haversine distance,
+    so its cost depends on the local density, not on the size of the dataset. Rows with NaN coordinates
+    are left out.
+    """
+
+    def __init__(self, lat, lon, cell_deg=GEO_CELL_DEG):
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.lon = np.asarray(lon, dtype=np.float64)
+        self.cell = float(cell_deg)
+        self.n_rows = int(math.ceil(180.0 / self.cell))
+        self.n_cols = int(math.ceil(360.0 / self.cell))
+        valid = np.flatnonzero(~(np.isnan(self.lat) | np.isnan(self.lon)))
+        cells = self._cell_row(self.lat[valid]) * self.n_cols + self._cell_col(self.lon[valid])
+        sort = np.argsort(cells, kind="stable")
+        self.order = valid[sort].astype(np.int64)
+        # starts[c]:starts[c + 1] is the slice of order holding cell c
+        self.starts = np.searchsorted(cells[sort], np.arange(self.n_rows * self.n_cols + 1)).astype(np.int64)
+
+    def __len__(self):
+        return len(self.order)
+
+    def _cell_row(self, lat):
+        return np.clip(((np.asarray(lat) + 90.0) // self.cell).astype(np.int64), 0, self.n_rows - 1)
+
+    def _cell_col(self, lon):
+        return np.clip((((np.asarray(lon) + 180.0) % 360.0) // self.cell).astype(np.int64), 0, self.n_cols - 1)
+
+    def _candidates(self, lat, lon, km):
+        """
+        Rows whose cell overlaps the bounding box of the circle (lat, lon, km); a superset of the answer.
+        """
+        dlat = km / KM_PER_DEGREE
+        lat_lo, lat_hi = max(-90.0, lat - dlat), min(90.0, lat + dlat)
+        row_lo, row_hi = int(self._cell_row(lat_lo)), int(self._cell_row(lat_hi))
+        widest = max(abs(lat_lo), abs(lat_hi))
+        if widest >= 89.9 or km >= HALF_CIRCUMFERENCE_KM / 2:
+            col_ranges = [(0, self.n_cols - 1)]
+        else:
+            dlon = dlat / math.cos(math.radians(widest))
+            if dlon >= 180.0:
+                col_ranges = [(0, self.n_cols - 1)]
+            else:
+                col_lo, col_hi = int(self._cell_col(lon - dlon)), int(self._cell_col(lon + dlon))
+                col_ranges = [(col_lo, col_hi)] if col_lo <= col_hi else [(col_lo, self.n_cols - 1), (0, col_hi)]
+        slices = []
+        for row in range(row_lo, row_hi + 1):
+            base = row * self.n_cols
+            for lo, hi in col_ranges:
+                start, stop = self.starts[base + lo], self.starts[base + hi + 1]
+                if stop > start:
+                    slices.append(self.order[start:stop])
+        return np.concatenate(slices) if slices else np.zeros(0, dtype=np.int64)
+
+    def radius(self, lat, lon, km):
+        """
+        Args:
+            lat, lon (float): query point
+            km (float): search radius
+
+        Returns:
+            tuple: (rows, distances in km), nearest first
+        """
+        rows = self._candidates(float(lat), float(lon), float(km))
+        dist = haversine_km(lat, lon, self.lat[rows], self.lon[rows])
+        keep = dist <= km
+        rows, dist = rows[keep], dist[keep]
+        sort = np.argsort(dist, kind="stable")
+        return rows[sort], dist[sort]
+
+    def nearest(self, lat, lon, k=5):
+        """
+        The k rows nearest to (lat, lon): radius queries with a doubling radius until k rows are inside,
+        which is exact because every point closer than the k-th is inside the same radius.
+
+        Returns:
+            tuple: (rows, distances in km), nearest first
+        """
+        k = min(int(k), len(self))
+        if k <= 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        # start from the radius that would hold k points if they were spread evenly over the globe
+        km = max(self.cell * KM_PER_DEGREE, 2 * EARTH_RADIUS_KM * math.sqrt(k / len(self)))
+        while True:
+            rows, dist = self.radius(lat, lon, km)
+            if len(rows) >= k or km >= HALF_CIRCUMFERENCE_KM:
+                return rows[:k], dist[:k]
+            km *= 2
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_geo_index(csv_path="cities.csv"):
+    """
+    Return the GeoIndex over the current CityStore for csv_path, rebuilding it when the store was reloaded.
+    """
+    store = get_city_store(csv_path)
+    key = os.path.abspath(csv_path)
+    with _indexes_lock:
+        entry = _indexes.get(key)
+        if entry is None or entry[0] is not store:
+            entry = _indexes[key] = (store, GeoIndex(store.lat, store.lon))
+    return entry[1]
@@ -0,0 +1,148 @@
+import os
+import re
+import threading
+import unicodedata
+import numpy as np
+from backends import geocoder_backend
+from cache import DiskCache, SingleFlight
+from city_store import get_city_store
+from telemetry import mark_cache, span
+
+GEOCODE_CACHE_PATH = os.getenv("GEOCODE_CACHE_PATH", os.path.join(".cache", "geocode.sqlite"))
+GEOCODE_CACHE_TTL = 90 * 24 * 3600      # positive results
+GEOCODE_NEGATIVE_TTL = 24 * 3600        # places Nominatim could not find
+# processes geocoding from one host (serve.py sets it to its worker count); each waits that many seconds
+# between requests so together they stay within Nominatim's usage policy of 1 request per second
+NOMINATIM_PROCESSES = max(1, int(os.getenv("NOMINATIM_PROCESSES", "1")))
+NOMINATIM_MIN_DELAY = 1.0 * NOMINATIM_PROCESSES
+
+
+def normalize_name(name: str) -> str:
+    """
+    Normalise a place name for lookups: strip accents, lowercase, drop punctuation, collapse whitespace.
+    "São Paulo, Brazil" -> "sao paulo brazil"
+    """
+    name = unicodedata.normalize("NFKD", str(name))
+    name = "".join(c for c in name if not unicodedata.combining(c))
+    name = re.sub(r"[^\w\s]", " ", name.lower())
+    return " ".join(name.split())
+
+
+class Gazetteer:
+    """
+    Offline place-name lookup over the latitude/longitude columns of the CityStore.
+
+    Every row is indexed under its city name, "city country", and "city, country" (both exact and
+    normalised). When several rows share a city name the first one wins for the bare name;
+    "city, country" always resolves to the right row.
+    """
+
+    def __init__(self, csv_path="cities.csv"):
+        self.csv_path = csv_path
+        self.exact = {}
+        self.normalized = {}
+        self.load()
+
+    def load(self):
+        self.exact.clear()
+        self.normalized.clear()
+        store = get_city_store(self.csv_path)
+        self.store = store
+        for i in range(len(store)):
+            if np.isnan(store.lat[i]) or np.isnan(store.lon[i]):
+                continue
+            coords = (float(store.lat[i]), float(store.lon[i]))
+            city, country = store.city[i], store.country[i]
+            for name in (city, f"{city} {country}", f"{city}, {country}"):
+                self.exact.setdefault(name, coords)
+                self.normalized.setdefault(normalize_name(name), coords)
+
+    def lookup(self, place: str):
+        """
+        Returns:
+            tuple or None: (latitude, longitude) if the place is in the dataset; None if not
+        """
+        if not place:
+            return None
+        return self.exact.get(place) or self.normalized.get(normalize_name(place))
+
+
+class Geocoder:
+    """
+    Geocoder that only goes to the network on a true miss:
+    local gazetteer -> persistent on-disk cache (LRU + TTL) -> Nominatim (rate-limited to 1 req/s).
+
+    The gazetteer is rebuilt when the CityStore was reloaded; the on-disk cache is kept.
+    """
+
+    def __init__(self, csv_path="cities.csv", cache_path=GEOCODE_CACHE_PATH):
+        self.csv_path = csv_path
+        self.gazetteer = Gazetteer(csv_path)
+        self._gazetteer_lock = threading.Lock()
+        self.cache = DiskCache(cache_path, ttl=GEOCODE_CACHE_TTL)
+        self._nominatim = None
+        self._nominatim_lock = threading.Lock()
+        self._flight = SingleFlight()
+
+    def _local(self):
+        """
+        Gazetteer over the current CityStore, rebuilt only when the store was reloaded.
+        """
+        store = get_city_store(self.csv_path)
+        with self._gazetteer_lock:
+            if self.gazetteer.store is not store:
+                self.gazetteer = Gazetteer(self.csv_path)
+            return self.gazetteer
+
+    def _geocode_remote(self, place: str):
+        # geopy's RateLimiter is not thread-safe; holding the lock serialises calls from worker threads
+        with self._nominatim_lock:
+            if self._nominatim is None:
+                self._nominatim = geocoder_backend(NOMINATIM_MIN_DELAY)
+            return self._nominatim(place)
+
+    def geocode(self, place: str):
+        """
+        Returns:
+            tuple or None: (latitude, longitude) if successful; None if not
+        """
+        with span("geocode"):
+            coords = self._local().lookup(place)
+            if coords:
+                mark_cache("geocode", "local")
+                return coords
+
+            key = normalize_name(place)
+            if not key:
+                return None
+            cached = self.cache.get(key)
+            if cached is not None:
+                mark_cache("geocode", "hit")
+                return tuple(cached) if cached else None
+            mark_cache("geocode", "miss")
+            # concurrent misses for the same place share one Nominatim request
+            return self._flight.do(key, self._geocode_and_store, key, place)
+
+    def _geocode_and_store(self, key, place):
+        location = self._geocode_remote(place)
+        if location:
+            coords = (location.latitude, location.longitude)
+            self.cache.set(key, list(coords))
+            return coords
+        self.cache.set(key, [], ttl=GEOCODE_NEGATIVE_TTL)
+        return None
+
+
+_geocoder = None
+_geocoder_lock = threading.Lock()
+
+
+def get_geocoder(csv_path="cities.csv"):
+    """
+    Return the process-wide Geocoder, creating it on first call.
+    """
+    global _geocoder
+    with _geocoder_lock:
+        if _geocoder is None:
+            _geocoder = Geocoder(csv_path)
+    return _geocoder
@@ -1,33 +1,325 @@
-from fastapi import FastAPI
-from pydantic import BaseModel
-from chatbot import TravelChatbot
-import os
+# first: starts the startup clock (and, with STARTUP_PROFILE=1, the import profiler)
+from startup import STARTUP
 from dotenv import load_dotenv
 
+# before the app modules below read their settings from the environment
 load_dotenv()
 
-app = FastAPI(title="AI Travel Planner", version="2.0.0")
+from contextlib import asynccontextmanager
+import signal
+import asyncio
+import json
+import time
+import logging
+from fastapi import FastAPI, Header, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from typing import List, Optional
+from pydantic import BaseModel, Field, field_validator, model_validator
+from chatbot import TravelChatbot
+from gemini_scheduler import SchedulerBusy, is_quota_error, retry_after
+from geo_index import get_geo_index
+from rag import RAG_RELOAD_INTERVAL, get_rag, watch_dataset
+from recommender import budget_level, get_recommender, preferences_from_message, temperature_target
+from response_cache import ResponseCache
+from telemetry import HTTP_IN_FLIGHT, HTTP_SECONDS, REGISTRY, SERVER_TIMING, configure_logging, start_trace
+from utils import aclose_async_client, cache_stats, get_async_client, get_session
+from climate import get_climatology
+from geocode import get_geocoder
+import os
+
+configure_logging()
+log = logging.getLogger(__name__)
+# required in the X-Admin-Token header of /admin/* requests; they are disabled (403) when it is not set
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+# pid of the serve.py parent when running in one of its pre-forked workers (set by serve.py)
+SERVE_PARENT_PID = int(os.getenv("SERVE_PARENT_PID", "0"))
+
+
+async def _warm_http_pools():
+    # the async client is bound to the serving loop, so it is created here rather than in a thread
+    get_async_client()
+    await asyncio.to_thread(get_session)
+
+
+def warm_up_steps(rag):
+    """
+    Everything the first requests would otherwise load: the embedding model and index, the Gemini client,
+    the HTTP pools and the city data structures. Run in order by STARTUP.warm_up() once the server is up.
+    """
+    return [
+        ("rag", rag.warm_up),
+        ("gemini", chatbot.warm_up),
+        ("http_pools", _warm_http_pools),
+        ("city_data", lambda: (get_recommender(), get_geocoder(), get_climatology(), get_geo_index("cities.csv"))),
+    ]
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # warm up in the background so the server binds (and /healthz answers) right away; /readyz reports
+    # 503 until the model, index and pools are loaded
+    rag = get_rag("cities.csv")
+    warm_up = asyncio.create_task(STARTUP.warm_up(warm_up_steps(rag)))
+    watcher = asyncio.create_task(watch_dataset(rag)) if RAG_RELOAD_INTERVAL > 0 else None
+    yield
+    for task in (warm_up, watcher):
+        if task:
+            task.cancel()
+    await aclose_async_client()
+
+
+app = FastAPI(title="AI Travel Planner", version="2.0.0", lifespan=lifespan)
 chatbot = TravelChatbot()
+response_cache = ResponseCache(chatbot.rag, parse=lambda message: chatbot.fast_parser.parse(message)[0])
+
+STARTUP.imports_done()
+log.info("🔹 [startup] app imported in %.2fs", STARTUP.phases["imports"])
+
+_route_paths = None
+
+
+@app.middleware("http")
+async def telemetry_middleware(request: Request, call_next):
+    """
+    Per-request trace, HTTP latency histogram and in-flight gauge; optional Server-Timing header.
+    For streaming endpoints the latency and spans cover the work done before the response headers.
+    """
+    global _route_paths
+    if _route_paths is None:
+        _route_paths = {getattr(route, "path", None) for route in app.routes}
+    path = request.url.path if request.url.path in _route_paths else "other"
+    trace = start_trace()
+    start = time.perf_counter()
+    with HTTP_IN_FLIGHT.track(path=path):
+        response = await call_next(request)
+    HTTP_SECONDS.observe(time.perf_counter() - start, path=path, status=response.status_code)
+    if SERVER_TIMING and trace.spans:
+        response.headers["Server-Timing"] = trace.server_timing()
+    if log.isEnabledFor(logging.DEBUG) and trace.spans:
+        log.debug("🔹 [trace] %s %s", path, [s.to_dict() for s in trace.spans])
+    return response
+
 
 class ChatRequest(BaseModel):
     message: str
 
+
+class BatchItem(BaseModel):
+    # either a free-text message or structured trip details
+    message: Optional[str] = None
+    place: Optional[str] = None
+    theme: str = "Culture"
+    duration: int = 5
+    time: str = "Today"
+    extras: str = ""
+
+    @model_validator(mode="after")
+    def message_or_place(self):
+        if not (self.message or self.place):
+            raise ValueError("each request needs a message or a place")
+        return self
+
+
+class RecommendRequest(BaseModel):
+    # free-text preferences; explicit fields below override what is extracted from it
+    message: Optional[str] = None
+    themes: Optional[List[str]] = None
+    month: Optional[int] = Field(None, ge=1, le=12)
+    temperature: Optional[str] = None
+    budget: Optional[str] = None
+    duration: Optional[int] = Field(None, ge=1)
+    regions: Optional[List[str]] = None
+    countries: Optional[List[str]] = None
+    top_k: int = Field(5, ge=1, le=50)
+    plan: bool = False      # also generate an itinerary for the top result
+
+    # unknown words are rejected with 422 instead of failing (temperature) or being ignored (budget)
+    @field_validator("temperature")
+    @classmethod
+    def known_temperature(cls, value):
+        if value is not None:
+            temperature_target(value)
+        return value
+
+    @field_validator("budget")
+    @classmethod
+    def known_budget(cls, value):
+        return budget_level(value) if value is not None else value
+
+
+class BatchRequest(BaseModel):
+    requests: List[BatchItem]
+    concurrency: int = Field(8, ge=1, le=32)
+
 @app.post("/chat")
-def chat(request: ChatRequest):
+async def chat(request: ChatRequest):
     """
-    Main chat endpoint (synchronous).
+    Main chat endpoint (async; weather and RAG lookups run concurrently).
     Returns structured JSON with itinerary, weather, rag info, and parsed prompt.
-    Handles Gemini quota or API errors gracefully.
+    Repeated and near-duplicate requests are served from the response cache; the X-Cache header
+    reports HIT, HIT-SEMANTIC or MISS.
+    Handles Gemini quota or API errors gracefully: quota errors and a full Gemini queue return
+    429 with a Retry-After header.
+    """
+    try:
+        result, status = await response_cache.aget_or_generate(
+            request.message, chatbot.aparse_prompt, chatbot.atravel_planner)
+        return JSONResponse(result, headers={"X-Cache": status})
+    except Exception as e:
+        return error_response(e)
+
+
+def error_message(e: Exception) -> str:
+    if isinstance(e, SchedulerBusy):
+        return f"Gemini API quota reached (request queue full). Please try again in {retry_after(e)}s."
+    if is_quota_error(e):
+        return "Gemini API quota exceeded. Please try again later."
+    return f"Unexpected error: {e}"
+
+
+def error_response(e: Exception) -> JSONResponse:
+    if is_quota_error(e):
+        return JSONResponse({"error": error_message(e)}, status_code=429,
+                            headers={"Retry-After": str(retry_after(e))})
+    return JSONResponse({"error": error_message(e)})
+
+
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest):
+    """
+    Streaming chat endpoint (Server-Sent Events).
+    Emits parsed_prompt, weather and rag events as soon as each is ready, then the itinerary
+    as a series of itinerary events, and finally done. Failures are reported as an error event.
+    Returns 429 up front when the itinerary queue is already full.
+    """
+    try:
+        chatbot.scheduler.check("plan")
+    except SchedulerBusy as e:
+        return error_response(e)
+
+    async def events():
+        try:
+            async for event, data in chatbot.astream_itinerary(request.message):
+                yield sse_event(event, data)
+        except Exception as e:
+            yield sse_event("error", {"error": error_message(e)})
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.post("/chat/batch")
+async def chat_batch(request: BatchRequest):
+    """
+    Batch itinerary endpoint. Streams one NDJSON line per request as it completes:
+    {"index": <position in the request list>, ...same fields as /chat, or "error"}.
+    """
+    items = [{"message": item.message} if item.message else item.model_dump(exclude={"message"})
+             for item in request.requests]
+
+    async def lines():
+        try:
+            async for i, result in chatbot.agenerate_batch(items, request.concurrency):
+                if "retry_after" in result:
+                    result = {**result, "error": "Gemini API quota exceeded. Please try again later."}
+                elif "error" in result:
+                    result = {**result, "error": error_message(Exception(result["error"]))}
+                yield json.dumps({"index": i, **result}, default=str) + "\n"
+        except Exception as e:
+            yield json.dumps({"error": error_message(e)}) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+@app.post("/recommend")
+async def recommend(request: RecommendRequest):
+    """
+    Rank destinations by theme, climate in the travel month, budget, ideal duration and region.
+    With plan=true the top result is passed straight to the itinerary planner.
+    """
+    prefs = preferences_from_message(request.message) if request.message else {}
+    prefs.update(request.model_dump(exclude={"message", "top_k", "plan"}, exclude_none=True))
+    recommender = get_recommender()
+    results = recommender.recommend(**prefs, top_k=request.top_k)
+    response = {"preferences": prefs, "results": results}
+    if request.plan and results:
+        details = recommender.details_for(results[0], prefs.get("themes"), prefs.get("month"),
+                                          prefs.get("duration"), request.message or "")
+        try:
+            response["plan"] = await chatbot.atravel_planner(details)
+        except Exception as e:
+            response["plan"] = {"error": error_message(e)}
+    return response
+
+
+@app.get("/cache/stats")
+def get_cache_stats():
+    """
+    Hit/miss counters for the weather, geocode, response and query-embedding caches.
+    """
+    return {**cache_stats(), "responses": response_cache.stats(), "embeddings": chatbot.rag.embedder.stats()}
+
+
+@app.get("/gemini/stats")
+def get_gemini_stats():
+    """
+    Gemini scheduler counters: calls, retries, rejections, queue depths and remaining bucket tokens.
+    """
+    return chatbot.scheduler.stats()
+
+
+@app.post("/admin/reload")
+async def admin_reload(x_admin_token: Optional[str] = Header(None)):
+    """
+    Apply changes to cities.csv without a restart: only added and edited rows are re-embedded, and the
+    new data is swapped in atomically while requests keep being served. In a serve.py worker the parent is
+    then signalled to reload and relay the reload to every other worker (only when something changed).
+    Needs ADMIN_TOKEN to be set and sent in the X-Admin-Token header.
     """
+    if not ADMIN_TOKEN:
+        return JSONResponse({"error": "admin endpoints are disabled: ADMIN_TOKEN is not set"}, status_code=403)
+    if x_admin_token != ADMIN_TOKEN:
+        return JSONResponse({"error": "invalid admin token"}, status_code=403)
     try:
-        result = chatbot.generate_itinerary(request.message)
-        return result
+        result = await asyncio.to_thread(get_rag("cities.csv").reload)
     except Exception as e:
-        error_msg = str(e)
-        # Check if Gemini quota issue
-        if "quota" in error_msg.lower() or "429" in error_msg or "exceeded" in error_msg:
-            return {"error": "Gemini API quota exceeded. Please try again later."}
-        return {"error": f"Unexpected error: {error_msg}"}
+        log.warning("⚠️ [admin] reload failed: %s", e)
+        return JSONResponse({"error": f"Reload failed: {e}"}, status_code=500)
+    changed = result["added"] or result["updated"] or result["removed"]
+    if changed and SERVE_PARENT_PID and os.getppid() == SERVE_PARENT_PID:
+        os.kill(SERVE_PARENT_PID, signal.SIGHUP)
+        result["workers"] = "all"
+    return result
+
+
+@app.get("/metrics")
+def metrics():
+    """
+    Prometheus metrics: per-stage and HTTP latency histograms, in-flight gauges, cache results,
+    Gemini token counts and scheduler queue depth.
+    """
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.get("/healthz")
+def healthz():
+    """
+    Liveness probe: the process is up and serving HTTP (it may still be warming up).
+    """
+    return {"status": "ok"}
+
+
+@app.get("/readyz")
+def readyz():
+    """
+    Readiness probe: 200 once the warm-up finished, 503 before that or if a warm-up step failed.
+    The body has the startup timings (and the import breakdown with STARTUP_PROFILE=1).
+    """
+    return JSONResponse(STARTUP.status(), status_code=200 if STARTUP.ready else 503)
+
 
 @app.get("/")
 def root():
@@ -0,0 +1,203 @@
+import re
+import unicodedata
+from city_store import get_city_store
+from climate import MONTH_NAMES
+from geocode import normalize_name
+
+THEMES = {
+    "Culture": ["culture", "cultural", "history", "historic", "historical", "museum", "museums", "art", "arts",
+                "temple", "temples", "heritage", "architecture"],
+    "Adventure": ["adventure", "adventurous", "hiking", "hike", "trekking", "trek", "climbing", "diving",
+                  "surfing", "rafting", "skiing", "extreme"],
+    "Nature": ["nature", "wildlife", "mountains", "mountain", "forest", "forests", "national", "parks", "safari",
+               "scenery", "lakes", "outdoors"],
+    "Beaches": ["beach", "beaches", "seaside", "coast", "coastal", "island", "islands", "snorkeling", "sun"],
+    "Nightlife": ["nightlife", "party", "parties", "partying", "clubs", "clubbing", "bars", "nightclubs"],
+    "Cuisine": ["food", "foodie", "cuisine", "culinary", "eating", "gastronomy", "restaurants", "wine"],
+    "Wellness": ["wellness", "spa", "spas", "relax", "relaxing", "relaxation", "yoga", "retreat", "detox"],
+    "Urban": ["urban", "shopping", "citybreak", "skyline", "city"],
+    "Seclusion": ["seclusion", "secluded", "quiet", "remote", "peaceful", "isolated", "tranquil", "solitude"],
+}
+
+MONTH_ALIASES = {name.lower(): name for name in MONTH_NAMES}
+MONTH_ALIASES.update({name.lower()[:3]: name for name in MONTH_NAMES if name != "May"})
+MONTH_ALIASES["sept"] = "September"
+
+# representative month per season (northern hemisphere), used for weather lookups
+SEASON_MONTHS = {"spring": 4, "summer": 7, "autumn": 10, "fall": 10, "winter": 1}
+NOW_WORDS = {"today", "now", "tomorrow", "asap"}
+# words that only mean a month/season after one of these ("in May", but not "I may go")
+TIME_PREPOSITIONS = {"in", "during", "this", "next", "early", "late", "mid", "of", "the"}
+
+NUMBER_WORDS = {"a": 1, "an": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7,
+                "eight": 8, "nine": 9, "ten": 10, "eleven": 11, "twelve": 12, "fourteen": 14, "couple": 2}
+DURATION_UNITS = {"day": 1, "days": 1, "night": 1, "nights": 1, "week": 7, "weeks": 7}
+DURATION_WORDS = {"weekend": 2, "fortnight": 14}
+
+# compass words that narrow a country to part of it ("northern Italy"); see route_planner
+DIRECTIONS = {"north": "north", "northern": "north", "south": "south", "southern": "south", "east": "east",
+              "eastern": "east", "west": "west", "western": "west", "central": "central"}
+
+# place names that are also common English words; only matched when capitalised in the message
+AMBIGUOUS_PLACES = {"split", "bath", "cork", "hue", "sal", "nice", "reading", "mobile", "victoria", "hope"}
+
+STOPWORDS = set("""
+i im i'm me my we our us you your a an the to in on at for of and or with from into around about
+want wanna would like love go going trip travel travelling traveling holiday holidays vacation visit
+visiting explore exploring plan planning please give make show suggest recommend itinerary some
+day days week weeks night nights long short focus focused on mostly mainly this next be do can could
+there here it its that d ll s t m ve re may might will should get
+across through between tour touring spend spending stay staying
+""".split())
+
+DEFAULT_DETAILS = {"place": "Unknown", "theme": "Culture", "duration": 5, "time": "Today", "extras": ""}
+
+
+def _tokens(message: str):
+    """
+    Split message into (original, lowercase) word tokens with accents stripped.
+    """
+    text = unicodedata.normalize("NFKD", message)
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    words = re.findall(r"\w+", text)
+    return words, [w.lower() for w in words]
+
+
+class FastPromptParser:
+    """
+    Deterministic local parser for the common "5 day trip to Kyoto in June for culture" shape of request.
+
+    Recognises city and country names from the CityStore, the nine theme keywords (and synonyms), month
+    names and seasons, and day/week durations. parse() returns the same dict as the Gemini parser plus a
+    confidence score in [0, 1]; callers fall back to Gemini when the score is low. The score is the share of
+    content words understood, scaled by how many of theme, duration and time were found, so a request with
+    constraints the parser cannot read ("vegetarian", "wheelchair accessible") goes to Gemini; the unread
+    words are also kept in extras.
+    """
+
+    def __init__(self, csv_path="cities.csv"):
+        self.csv_path = csv_path
+        self.places = {}        # token tuple -> (kind, canonical name); kind is "city" or "country"
+        self.max_place_len = 1
+        self.keywords = {kw: theme for theme, kws in THEMES.items() for kw in kws}
+        self.load()
+
+    def load(self):
+        places = {}
+        store = get_city_store(self.csv_path)
+        self.store = store
+        # cities overwrite same-named countries (e.g. Singapore)
+        for kind, names in (("country", store.country.vocab), ("city", store.city.tolist())):
+            for name in names:
+                key = tuple(normalize_name(name).split())
+                if key:
+                    places[key] = (kind, name)
+        self.places = places
+        self.max_place_len = max((len(k) for k in places), default=1)
+
+    def _match_places(self, words, lower, used):
+        cities, countries = [], []
+        i = 0
+        while i < len(lower):
+            for n in range(min(self.max_place_len, len(lower) - i), 0, -1):
+                key = tuple(lower[i:i + n])
+                match = self.places.get(key)
+                if match is None:
+                    continue
+                if n == 1 and key[0] in AMBIGUOUS_PLACES and not words[i][:1].isupper():
+                    continue
+                if match[0] == "country" and i > 0 and lower[i - 1] in DIRECTIONS and i - 1 not in used:
+                    countries.append(f"{words[i - 1].capitalize()} {match[1]}")
+                    used.add(i - 1)
+                else:
+                    (cities if match[0] == "city" else countries).append(match[1])
+                used.update(range(i, i + n))
+                i += n - 1
+                break
+            i += 1
+        return cities, countries
+
+    def _match_duration(self, lower, used):
+        for i, tok in enumerate(lower):
+            if tok in DURATION_WORDS:
+                used.add(i)
+                return DURATION_WORDS[tok]
+            m = re.fullmatch(r"(\d+)(days?|nights?|weeks?)", tok)
+            if m:
+                used.add(i)
+                return int(m.group(1)) * DURATION_UNITS[m.group(2)]
+            if tok in DURATION_UNITS and i > 0:
+                prev = lower[i - 1]
+                count = int(prev) if prev.isdigit() else NUMBER_WORDS.get(prev)
+                if count:
+                    used.update((i - 1, i))
+                    return count * DURATION_UNITS[tok]
+        return None
+
+    def _match_time(self, words, lower, used):
+        for i, tok in enumerate(lower):
+            prev = lower[i - 1] if i > 0 else ""
+            if tok in NOW_WORDS:
+                used.add(i)
+                return "Today"
+            if tok == "may" and not (words[i] == "May" or prev in TIME_PREPOSITIONS):
+                continue
+            if tok in MONTH_ALIASES or tok == "may":
+                used.add(i)
+                return MONTH_ALIASES.get(tok, "May")
+            if tok in SEASON_MONTHS and (tok != "fall" or prev in TIME_PREPOSITIONS):
+                used.add(i)
+                return tok.capitalize()
+        return None
+
+    def _match_theme(self, lower, used):
+        counts = {}
+        for i, tok in enumerate(lower):
+            theme = self.keywords.get(tok)
+            if theme and i not in used:
+                used.add(i)
+                counts[theme] = counts.get(theme, 0) + 1
+        if not counts:
+            return None
+        return max(counts, key=counts.get)
+
+    def parse(self, message: str):
+        """
+        Args:
+            message (str): the user's free-text travel request
+
+        Returns:
+            tuple: (details dict with place/theme/duration/time/extras, confidence float in [0, 1])
+        """
+        details = dict(DEFAULT_DETAILS)
+        words, lower = _tokens(message or "")
+        if not lower:
+            return details, 0.0
+
+        used = set()
+        cities, countries = self._match_places(words, lower, used)
+        duration = self._match_duration(lower, used)
+        time = self._match_time(words, lower, used)
+        theme = self._match_theme(lower, used)
+
+        place = cities[0] if cities else (countries[0] if countries else None)
+        if place is None:
+            return details, 0.0
+        details["place"] = place
+        if theme:
+            details["theme"] = theme
+        if duration:
+            details["duration"] = duration
+        if time:
+            details["time"] = time
+
+        # words we could not account for probably carry extras (budget, kids, diet, ...): they are passed on as
+        # extras, and when they are more than a stray word or two the request is left to the LLM
+        content = [i for i, tok in enumerate(lower) if tok not in STOPWORDS and not tok.isdigit()]
+        leftover = [i for i in content if i not in used]
+        details["extras"] = " ".join(words[i] for i in leftover)
+        understood = 1.0 - (len(leftover) / len(content) if content else 0.0)
+        confidence = understood * (0.8 + sum(0.2 / 3 for v in (theme, duration, time) if v))
+        if len(cities) + len(countries) > 2 or len(set(cities)) > 1:
+            confidence -= 0.3   # several destinations: leave it to the LLM
+        return details, round(min(confidence, 1.0), 3)
@@ -1,113 +1,476 @@
 import os
-import pandas as pd
-from sentence_transformers import SentenceTransformer
-import faiss
+import time
+import asyncio
+import hashlib
+import logging
+import threading
+from functools import partial
 import numpy as np
+from city_store import get_city_store, reload_city_store
+from embedder import EmbeddingService
+from geocode import normalize_name
+from retrieval import HybridRetriever
+from telemetry import span
+from vector_index import (INDEX_FORMAT, RAG_INDEX, RAG_METRIC, build_index, index_spec, prepare, read_index,
+                          update_index, vector_ids)
+
+MODEL_NAME = "all-MiniLM-L6-v2"
+CACHE_DIR = os.getenv("RAG_CACHE_DIR", ".rag_cache")
+# set RAG_DENSE=0 to run without sentence_transformers/FAISS (exact + BM25 retrieval only)
+RAG_DENSE = os.getenv("RAG_DENSE", "1") == "1"
+# seconds between checks of the CSV's mtime (0 disables the watcher; POST /admin/reload still works)
+RAG_RELOAD_INTERVAL = float(os.getenv("RAG_RELOAD_INTERVAL", "0"))
+
+log = logging.getLogger(__name__)
+
+
+def row_keys(store):
+    """
+    Stable key per row: the CSV id column, or "city|country" where it is empty; repeats get a "#n" suffix.
+    """
+    keys, seen = [], {}
+    for i in range(len(store)):
+        key = store.id[i] or f"{store.city[i]}|{store.country[i]}"
+        seen[key] = seen.get(key, 0) + 1
+        keys.append(key if seen[key] == 1 else f"{key}#{seen[key]}")
+    return keys
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+class RAGSnapshot:
+    """
+    One version of the searchable data: CityStore, documents, row keys, embeddings, FAISS index and
+    retriever, all built from the same CSV. Never modified after construction; TravelRAG swaps in a whole
+    new snapshot on reload, so a search never mixes rows of one version with vectors of another.
+
+    FAISS ids are vector_ids(keys), so search results map back to rows through rows (id -> row).
+    """
+
+    def __init__(self, store, docs, keys, embeddings=None, index=None, mtime=None):
+        self.store = store
+        self.docs = docs
+        self.keys = keys
+        self.embeddings = embeddings
+        self.index = index
+        self.mtime = mtime
+        self.rows = {int(v): i for i, v in enumerate(vector_ids(keys))} if index is not None else {}
+        self.retriever = None
+
 
 class TravelRAG:
-    def __init__(self, csv_path="cities.csv"):
+    def __init__(self, csv_path="cities.csv", cache_dir=CACHE_DIR, lazy=False, dense=True,
+                 index_type=RAG_INDEX, metric=RAG_METRIC):
         """
         Constructor for TravelRAG.
 
         Args:
             csv_path (str, optional): Path to the Worldwide Travel Cities Dataset (Ratings and Climate).csv file. Defaults to "Worldwide Travel Cities Dataset (Ratings and Climate).csv".
 
-        The constructor loads the Worldwide Travel Cities Dataset (Ratings and Climate).csv file into a pandas data frame, and initializes the
+        The constructor loads the Worldwide Travel Cities Dataset (Ratings and Climate).csv file into a CityStore, and initializes the
         SentenceTransformer model and the Faiss index. The load() method is called at the end of the constructor to load the data into the model and
         index.
 
         If the csv_path is not provided, a fallback list of documents is used instead.
+
+        Embeddings and the FAISS index are cached in cache_dir (env RAG_CACHE_DIR), keyed by a hash of
+        the CSV contents and the model name. Pass cache_dir=None to disable the cache.
+
+        With lazy=True nothing is loaded up front: the data, index and model are loaded on the first search()
+        or on an explicit warm_up(). Prefer get_rag() over constructing instances directly.
+
+        Retrieval goes through a HybridRetriever (exact name -> BM25 -> dense, fused with RRF). With
+        dense=False no model or FAISS index is ever built (the simple_rag mode).
+
+        index_type (env RAG_INDEX: flat, sq8, ivfpq, hnsw, hnsw_sq8) and metric (env RAG_METRIC: l2 or ip)
+        choose the FAISS index; see vector_index.py. Each combination is cached in its own file next to the
+        shared embeddings, so switching index type never re-encodes the cities.
         """
         self.csv_path = csv_path
-        self.df = None
-        self.docs = []
-        self.model = SentenceTransformer("all-MiniLM-L6-v2")
-        self.index = None
-        self.load()
+        self.cache_dir = cache_dir
+        self.dense = dense
+        self.index_type = index_type
+        self.metric = metric
+        index_spec(index_type, metric)
+        self.snapshot = None
+        self._model = None
+        # query encodings from concurrent requests are micro-batched and cached by the embedding service
+        self.embedder = EmbeddingService(self._encode_queries)
+        self._lock = threading.RLock()
+        self._reload_lock = threading.Lock()
+        if not lazy:
+            self.load()
+
+    # the current snapshot's parts (each read is consistent only with itself; search paths hold one snapshot)
+    store = property(lambda self: self.snapshot.store if self.snapshot else None)
+    docs = property(lambda self: self.snapshot.docs if self.snapshot else [])
+    embeddings = property(lambda self: self.snapshot.embeddings if self.snapshot else None)
+    index = property(lambda self: self.snapshot.index if self.snapshot else None)
+    retriever = property(lambda self: self.snapshot.retriever if self.snapshot else None)
+
+    @property
+    def model(self):
+        """
+        The SentenceTransformer model, constructed on first access. sentence_transformers (and torch) are
+        only imported here, so processes that never encode pay nothing for them.
+        """
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    from sentence_transformers import SentenceTransformer
+                    self._model = SentenceTransformer(MODEL_NAME)
+        return self._model
+
+    def _encode_queries(self, texts):
+        return self.model.encode(texts, convert_to_numpy=True)
+
+    def _ensure_loaded(self):
+        """
+        Returns:
+            RAGSnapshot: the current snapshot, loading the first one if needed
+        """
+        if self.snapshot is None:
+            with self._lock:
+                if self.snapshot is None:
+                    self.load()
+        return self.snapshot
+
+    def warm_up(self):
+        """
+        Load the data, index and model now instead of on the first request.
+        """
+        self._ensure_loaded()
+        if self.dense:
+            self.model
 
     def load(self):
         """
-        Load the Worldwide Travel Cities Dataset (Ratings and Climate).csv file into a pandas data frame, and initialize the SentenceTransformer model and
+        Load the Worldwide Travel Cities Dataset (Ratings and Climate).csv file into the shared CityStore, and initialize the SentenceTransformer model and
         the Faiss index. If the csv_path is not provided or does not exist, a fallback list of documents is used instead.
 
-        The method reads the csv file into a pandas data frame, constructs a list of short descriptions for each city, and uses the SentenceTransformer model
+        The method reads the columnar CityStore (memory-mapped when already built), constructs a list of short descriptions for each city, and uses the SentenceTransformer model
         to encode the descriptions into embeddings. The embeddings are then added to the Faiss index.
 
         If the csv_path does not exist, the method uses a fallback list of documents instead. The fallback list contains four cities: Tokyo, Kyoto, Paris, and
         Bangkok, with short descriptions for each city. The fallback list is used to initialize the SentenceTransformer model and the Faiss index.
 
+        Finally the HybridRetriever (name aliases + BM25, plus the dense index unless dense=False) is built over the rows,
+        and everything is published together as the current RAGSnapshot. reload() applies later CSV edits incrementally.
+
         Args:
             None
 
         Returns:
             None
         """
-        if not os.path.exists(self.csv_path):
-            # fallback docs if csv missing
-            self.docs = [
-                "Tokyo, Japan - major cultural sites, great food, efficient transport.",
-                "Kyoto, Japan - temples, traditional culture, best during cherry blossom and autumn.",
-                "Paris, France - museums, cafes, art, lively nightlife.",
-                "Bangkok, Thailand - street food, temples, vibrant nightlife."
-            ]
-            self.df = pd.DataFrame({"city": ["Tokyo","Kyoto","Paris","Bangkok"], "doc": self.docs})
+        # columnar city data (falls back to a built-in list of cities if the csv is missing)
+        mtime = _mtime(self.csv_path)
+        store = get_city_store(self.csv_path)
+        docs = self._documents(store)
+        keys = row_keys(store)
+
+        embeddings = index = None
+        if self.dense:
+            embeddings, index = self._load_cache(docs)
+            if embeddings is None:
+                # build embeddings (unless cached for another index type) + FAISS index
+                embeddings = self.model.encode(docs, convert_to_numpy=True).astype("float32")
+            if index is None:
+                index = build_index(embeddings, self.index_type, self.metric, ids=vector_ids(keys))
+                self._save_cache(docs, embeddings, index)
+
+        self.snapshot = self._finish(RAGSnapshot(store, docs, keys, embeddings, index, mtime))
+
+    @staticmethod
+    def _documents(store):
+        docs = []
+        for i in range(len(store)):
+            parts = [store.city[i], store.country[i], store.short_description[i]]
+            docs.append(" - ".join([p for p in parts if p]))
+        return docs
+
+    def _finish(self, snapshot):
+        snapshot.retriever = HybridRetriever(
+            snapshot.store.city.tolist(),
+            snapshot.store.country.tolist(),
+            snapshot.store.short_description.tolist(),
+            dense=partial(self._dense_search, snapshot) if self.dense else None,
+        )
+        return snapshot
+
+    def reload(self):
+        """
+        Re-read csv_path and swap in a new snapshot without blocking searches.
+
+        Rows are matched to the current snapshot by their stable id (row_keys). Only added rows and rows whose
+        document text changed are re-encoded; removed and changed ids are deleted from a copy of the FAISS
+        index and the new vectors added to it (HNSW indexes cannot delete, so they are rebuilt from the
+        embeddings instead). In-flight searches finish on the old snapshot. The result is written to the
+        cache under the new CSV's key, so other workers and restarts load it without encoding. A CSV with the
+        same bytes as the loaded one changes nothing.
+
+        Returns:
+            dict: counts of added, updated and removed rows, total rows, and seconds taken
+        """
+        with self._reload_lock:
+            old = self.snapshot
+            if old is None:
+                start = time.perf_counter()
+                snapshot = self._ensure_loaded()
+                return {"added": len(snapshot.docs), "updated": 0, "removed": 0, "rows": len(snapshot.docs),
+                        "seconds": round(time.perf_counter() - start, 3)}
+            start = time.perf_counter()
+            mtime = _mtime(self.csv_path)
+            store = reload_city_store(self.csv_path)
+            if store is old.store:
+                # same bytes (e.g. only touched): keep the snapshot, and the mtime so the watcher stops firing
+                old.mtime = mtime
+                return {"added": 0, "updated": 0, "removed": 0, "rows": len(old.docs),
+                        "seconds": round(time.perf_counter() - start, 3)}
+            docs = self._documents(store)
+            keys = row_keys(store)
+            old_rows = {key: i for i, key in enumerate(old.keys)}
+            new_keys = set(keys)
+            added = [i for i, key in enumerate(keys) if key not in old_rows]
+            updated = [i for i, key in enumerate(keys) if key in old_rows and old.docs[old_rows[key]] != docs[i]]
+            removed = [key for key in old.keys if key not in new_keys]
+
+            embeddings = index = None
+            if self.dense:
+                changed = sorted(added + updated)
+                embeddings = np.empty((len(docs), old.embeddings.shape[1]), dtype="float32")
+                kept = sorted(set(range(len(keys))) - set(changed))
+                if kept:
+                    embeddings[kept] = old.embeddings[[old_rows[keys[i]] for i in kept]]
+                if changed:
+                    embeddings[changed] = self.model.encode([docs[i] for i in changed], convert_to_numpy=True)
+                ids = vector_ids(keys)
+                stale = vector_ids(removed + [keys[i] for i in updated])
+                if changed or removed:
+                    index = update_index(old.index, self.index_type, self.metric, stale,
+                                         embeddings[changed], ids[changed])
+                    if index is None:
+                        index = build_index(embeddings, self.index_type, self.metric, ids=ids)
+                else:
+                    index = old.index
+                # with no row changes only write the files if this CSV version has none yet (other columns,
+                # e.g. ratings, changed the CSV's cache key)
+                if changed or removed or not os.path.exists(self._cache_paths(docs)[1]):
+                    self._save_cache(docs, embeddings, index)
+
+            self.snapshot = self._finish(RAGSnapshot(store, docs, keys, embeddings, index, mtime))
+            result = {"added": len(added), "updated": len(updated), "removed": len(removed), "rows": len(docs),
+                      "seconds": round(time.perf_counter() - start, 3)}
+            log.info("✅ [TravelRAG] reloaded %s: %s", self.csv_path, result)
+            return result
+
+    def reload_if_changed(self):
+        """
+        reload() if the CSV's mtime differs from the one the current snapshot was built from.
+
+        Returns:
+            dict or None: reload() result, or None when nothing changed (or nothing is loaded yet)
+        """
+        snapshot = self.snapshot
+        if snapshot is None or _mtime(self.csv_path) == snapshot.mtime:
+            return None
+        return self.reload()
+
+    def cache_key(self, docs=None):
+        """
+        Return the cache key for the current data: a sha256 over the model name and the raw CSV bytes
+        (or the fallback documents when the CSV is missing).
+        """
+        h = hashlib.sha256(MODEL_NAME.encode("utf-8"))
+        if os.path.exists(self.csv_path):
+            with open(self.csv_path, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    h.update(chunk)
         else:
-            self.df = pd.read_csv(self.csv_path)
-            self.docs = []
-            for _, r in self.df.iterrows():
-                parts = [str(r.get("city", "")), str(r.get("country", "")), str(r.get("short_description", ""))]
-                self.docs.append(" - ".join([p for p in parts if p]))
-
-        # build embeddings + FAISS index
-        embs = self.model.encode(self.docs, convert_to_numpy=True)
-        dim = embs.shape[1]
-        self.index = faiss.IndexFlatL2(dim)
-        self.index.add(embs.astype("float32"))
+            h.update("\n".join(self.docs if docs is None else docs).encode("utf-8"))
+        return h.hexdigest()[:16]
+
+    def _cache_paths(self, docs=None):
+        key = self.cache_key(docs)
+        spec = index_spec(self.index_type, self.metric)
+        return (os.path.join(self.cache_dir, f"{key}.npy"),
+                os.path.join(self.cache_dir, f"{key}.{spec}.v{INDEX_FORMAT}.faiss"))
+
+    def _load_cache(self, docs):
+        """
+        Load embeddings and index from the on-disk cache. Both files are memory-mapped (the index's vector
+        codes are viewed in place, see read_index), so a cache hit costs milliseconds and several worker
+        processes on one host share the same pages; IVF-PQ indexes are read into memory. Cached embeddings are
+        returned even when this index type has not been built yet, so load() only has to train the index.
+
+        Returns:
+            tuple: (embeddings or None, index or None)
+        """
+        if not self.cache_dir:
+            return None, None
+        emb_path, index_path = self._cache_paths(docs)
+        if not os.path.exists(emb_path):
+            return None, None
+        try:
+            embs = np.load(emb_path, mmap_mode="r")
+        except Exception as e:
+            log.warning("⚠️ [TravelRAG] ignoring unreadable cache: %s", e)
+            return None, None
+        if embs.shape[0] != len(docs):
+            return None, None
+        if not os.path.exists(index_path):
+            return embs, None
+        try:
+            index = read_index(index_path, self.index_type)
+        except Exception as e:
+            log.warning("⚠️ [TravelRAG] ignoring unreadable cache: %s", e)
+            return embs, None
+        if index.ntotal != len(docs):
+            return embs, None
+        return embs, index
+
+    def _save_cache(self, docs, embeddings, index):
+        """
+        Persist embeddings and index to the cache dir. Files are written to a temporary name and renamed into
+        place so concurrent workers never read a partial file.
+        """
+        if not self.cache_dir:
+            return
+        import faiss
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            emb_path, index_path = self._cache_paths(docs)
+            tmp_suffix = f".{os.getpid()}.tmp"
+            if not (isinstance(embeddings, np.memmap) and os.path.exists(emb_path)):
+                with open(emb_path + tmp_suffix, "wb") as f:
+                    np.save(f, embeddings)
+                os.replace(emb_path + tmp_suffix, emb_path)
+            faiss.write_index(index, index_path + tmp_suffix)
+            os.replace(index_path + tmp_suffix, index_path)
+        except OSError as e:
+            log.warning("⚠️ [TravelRAG] could not write cache: %s", e)
+
+    def nearest(self, query: str, top_k=1):
+        """
+        Return the CityStore row positions of the top_k documents best matching query (best first).
+        """
+        return self.nearest_batch([query], top_k)[0]
+
+    def nearest_batch(self, queries, top_k=1):
+        """
+        Batch nearest(). Exact city names are resolved from the alias dictionary; the remaining queries
+        go through BM25 and, in dense mode, the embedding service and one index.search over the whole
+        query matrix, fused with reciprocal-rank fusion.
+
+        Returns:
+            list: one list of row positions per query
+        """
+        snapshot = self._ensure_loaded()
+        if not queries:
+            return []
+        return snapshot.retriever.search_batch(list(queries), top_k)
+
+    def _dense_search(self, snapshot, queries, top_k):
+        with span("rag_encode", queries=len(queries)):
+            q_emb = prepare(self.embedder.encode(queries), self.metric)
+        with span("faiss_search", queries=len(queries), index=self.index_type):
+            dists, ids = snapshot.index.search(q_emb, top_k)
+        return [[snapshot.rows[int(i)] for i in row if int(i) in snapshot.rows] for row in ids]
+
+    def canonical_place(self, query: str):
+        """
+        Map a place name onto its dataset spelling, e.g. "kyoto japan" -> "Kyoto, Japan".
+
+        Returns "City, Country" when query is an exact city alias (optionally with its country), the
+        country name when it names a country in the dataset, and None otherwise (a semantic neighbour
+        is not a synonym).
+        """
+        if not query:
+            return None
+        snapshot = self._ensure_loaded()
+        row = snapshot.retriever.exact(query)
+        if row is not None:
+            return f"{snapshot.store.city[row]}, {snapshot.store.country[row]}"
+        rows = snapshot.retriever.countries.get(normalize_name(query))
+        if rows:
+            return snapshot.store.country[rows[0]]
+        return None
 
     def search(self, query: str, top_k=1):
         """
-        Search FAISS for the closest matching city and return structured info.
+        Find the best matching city (exact name, BM25 and FAISS, fused) and return its dataset record.
 
         The method takes a query string (e.g. "Tokyo Japan") and returns a dict with the following keys:
-        - city: the closest matching city
-        - country: the country the city is in
+        - id, city, country, region: identity of the closest matching city
         - short_description: a short description of the city
-        - climate: a short description of the climate in the city
-        - rating: the average rating of the city from the dataset
-        - lat: the latitude of the city
-        - lon: the longitude of the city
+        - latitude, longitude: coordinates of the city
+        - avg_temp_monthly: {"1": {"avg", "min", "max"}, ...} in °C, for months with data
+        - budget_level: "Budget", "Mid-range" or "Luxury" (or None)
+        - ideal_durations: list of trip-length labels
+        - themes: {"Culture": 1-5, ...}
 
-        If the query does not match any city, the method returns a message indicating that no info was found.
+        If the query is empty or does not match any city, the method returns None.
+        Use rag_context.render_context / describe / summary to turn a record into text.
         """
-        if not query:
-            return "No query provided."
-
-        q_emb = self.model.encode([query], convert_to_numpy=True).astype("float32")
-        dists, ids = self.index.search(q_emb, top_k)
-
-        if ids[0][0] >= len(self.docs):
-            return f"No info found for {query}."
-
-        # get row from dataframe
-        row = self.df.iloc[ids[0][0]]
-
-        # build structured summary
-        summary = f"""
-                📍 City: {row.get('city','N/A')}, {row.get('country','N/A')} ({row.get('region','N/A')})
-                🌍 Overview: {row.get('short_description','N/A')}
-                🌡️ Avg Monthly Temps: {row.get('avg_temp_monthly','N/A')}
-                💰 Budget: {row.get('budget_level','N/A')}
-                🗓️ Ideal Durations: {row.get('ideal_durations','N/A')}
-
-                🏖️ Themes (1–5 scale):
-                - Culture: {row.get('culture','N/A')}
-                - Adventure: {row.get('adventure','N/A')}
-                - Nature: {row.get('nature','N/A')}
-                - Beaches: {row.get('beaches','N/A')}
-                - Nightlife: {row.get('nightlife','N/A')}
-                - Cuisine: {row.get('cuisine','N/A')}
-                - Wellness: {row.get('wellness','N/A')}
-                - Urban: {row.get('urban','N/A')}
-                - Seclusion: {row.get('seclusion','N/A')}
-                """
-        return summary.strip()
\ No newline at end of file
+        return self.search_batch([query], top_k)[0]
+
+    def search_batch(self, queries, top_k=1):
+        """
+        Batch version of search(): exact names are looked up directly and the rest share one encode
+        call and one FAISS search.
+
+        Returns:
+            list: one record dict (or None) per query, in the same format as search()
+        """
+        results = [None] * len(queries)
+        todo = [i for i, q in enumerate(queries) if q]
+        snapshot = self._ensure_loaded()
+        with span("rag", queries=len(todo)) as s:
+            rows = snapshot.retriever.search_batch([queries[i] for i in todo], top_k) if todo else []
+            for i, ids in zip(todo, rows):
+                if ids:
+                    results[i] = snapshot.store.record(ids[0])
+            s.set(found=sum(r is not None for r in results))
+        return results
+
+
+_instances = {}
+_instances_lock = threading.Lock()
+
+
+def get_rag(csv_path="cities.csv"):
+    """
+    Return the process-wide TravelRAG for csv_path, creating it (lazily) on first call.
+    Thread-safe; every caller in the process shares one model and one index.
+
+    Args:
+        csv_path (str): path to the cities CSV
+
+    Returns:
+        TravelRAG: the shared instance
+    """
+    key = os.path.abspath(csv_path)
+    with _instances_lock:
+        rag = _instances.get(key)
+        if rag is None:
+            rag = TravelRAG(csv_path, lazy=True, dense=RAG_DENSE)
+            _instances[key] = rag
+    return rag
+
+
+async def watch_dataset(rag, interval=RAG_RELOAD_INTERVAL):
+    """
+    Poll rag's CSV every interval seconds and reload it in a worker thread when its mtime changes.
+    Runs until cancelled (main.py starts it in the app lifespan when RAG_RELOAD_INTERVAL > 0).
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.to_thread(rag.reload_if_changed)
+        except Exception as e:
+            log.warning("⚠️ [TravelRAG] reload of %s failed: %s", rag.csv_path, e)
@@ -0,0 +1,150 @@
+import os
+from climate import MONTH_NAMES
+
+# approximate input-token budget for the dataset section of the planning prompt
+CONTEXT_TOKEN_BUDGET = int(os.getenv("RAG_CONTEXT_TOKENS", "120"))
+CHARS_PER_TOKEN = 4         # rough English average for Gemini/SentencePiece tokenisers
+TOP_THEMES = 3
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Cheap token estimate (no tokenizer call): one token per CHARS_PER_TOKEN characters, rounded up.
+    """
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def month_climate(record: dict, month: int):
+    """
+    Returns:
+        str or None: "July: avg 25.8°C (20.5-30.8°C)" for that month; None if the dataset has no value
+    """
+    temps = (record.get("avg_temp_monthly") or {}).get(str(month))
+    if not temps or "avg" not in temps:
+        return None
+    text = f"{MONTH_NAMES[month - 1]}: avg {temps['avg']}°C"
+    if "min" in temps and "max" in temps:
+        text += f" ({temps['min']}-{temps['max']}°C)"
+    return text
+
+
+def summary(record) -> str:
+    """
+    One-line description of a search() record for the UI ("Location Info").
+    """
+    if not record:
+        return "No location data."
+    return record.get("short_description") or f"{record['city']}, {record['country']}"
+
+
+def describe(record) -> str:
+    """
+    Full plain-text rendering of a search() record (all months, all themes), shown as the raw RAG info.
+    """
+    if not record:
+        return "No info found."
+    lines = [f"City: {record['city']}, {record['country']} ({record.get('region') or 'N/A'})",
+             f"Overview: {record.get('short_description') or 'N/A'}"]
+    months = [month_climate(record, m) for m in range(1, 13)]
+    months = [m for m in months if m]
+    lines.append("Avg monthly temps: " + ("; ".join(months) if months else "N/A"))
+    lines.append(f"Budget: {record.get('budget_level') or 'N/A'}")
+    lines.append("Ideal durations: " + (", ".join(record.get("ideal_durations") or []) or "N/A"))
+    lines.append("Themes (1-5): " + ", ".join(f"{t} {v}" for t, v in record["themes"].items()))
+    return "\n".join(lines)
+
+
+def render_context(record, month=None, theme=None, budget=CONTEXT_TOKEN_BUDGET) -> str:
+    """
+    Compact, deterministic dataset section for the planning prompt.
+
+    Only facts that bear on this trip are rendered, most useful first: the place, the requested theme's
+    score and the strongest themes, the climate of the travel month, budget, ideal durations and the
+    overview. Lines are added while the estimated size stays within budget tokens; the overview is
+    trimmed at a word boundary to fit.
+
+    Args:
+        record (dict): a TravelRAG.search() record, or None
+        month (int): travel month (1-12); climate is omitted when None
+        theme (str): requested theme, always listed first among the themes
+        budget (int): approximate token budget for the whole section
+
+    Returns:
+        str: newline-separated "Key: value" lines
+    """
+    if not record:
+        return "No dataset entry for this destination."
+
+    themes = record.get("themes") or {}
+    ranked = sorted(themes, key=lambda t: (-themes[t], t))[:TOP_THEMES]
+    theme = (theme or "").capitalize()
+    if theme in themes:
+        ranked = [theme] + [t for t in ranked if t != theme][:TOP_THEMES - 1]
+
+    lines = [f"Place: {record['city']}, {record['country']}"]
+    if ranked:
+        lines.append("Theme scores (1-5): " + ", ".join(f"{t} {themes[t]}" for t in ranked))
+    climate = month_climate(record, month) if month else None
+    if climate:
+        lines.append(f"Climate in {climate}")
+    if record.get("budget_level"):
+        lines.append(f"Budget: {record['budget_level']}")
+    if record.get("ideal_durations"):
+        lines.append("Ideal durations: " + ", ".join(record["ideal_durations"]))
+
+    kept, used = [], 0
+    for line in lines:
+        cost = estimate_tokens(line) + 1       # + newline
+        if kept and used + cost > budget:
+            break
+        kept.append(line)
+        used += cost
+
+    overview = record.get("short_description") or ""
+    room = (budget - used) * CHARS_PER_TOKEN - len("Overview: ")
+    if overview and room >= 40:
+        if len(overview) > room:
+            overview = overview[:room - 3].rsplit(" ", 1)[0].rstrip(",;:") + "..."
+        kept.append(f"Overview: {overview}")
+    return "\n".join(kept)
+
+
+def render_route(route, month=None) -> str:
+    """
+    Route section of the planning prompt for a multi-city trip (a RoutePlanner.plan() result): the stops in
+    visiting order with their days, great-circle distance from the previous stop and travel-month climate.
+
+    Returns:
+        str: newline-separated lines, e.g. "2. Verona, Italy - 3 days, 140 km from Milan, July avg 25.3°C"
+    """
+    if not route or not route.get("stops"):
+        return ""
+    stops = route["stops"]
+    lines = [f"{len(stops)} stops, about {route['total_km']} km between them in total (straight-line)"]
+    for n, stop in enumerate(stops, 1):
+        line = f"{n}. {stop['city']}, {stop['country']} - {stop['days']} day{'s' if stop['days'] != 1 else ''}"
+        if stop.get("km_from_previous") is not None:
+            line += f", {stop['km_from_previous']} km from {stops[n - 2]['city']}"
+        if month and stop.get("avg_temp") is not None:
+            line += f", {MONTH_NAMES[month - 1]} avg {stop['avg_temp']}°C"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def render_route_context(records, month=None, theme=None, budget=CONTEXT_TOKEN_BUDGET) -> str:
+    """
+    Dataset section for a multi-city trip: render_context() of every stop's record, sharing budget.
+
+    Args:
+        records (list): the stops' TravelRAG.search() records, in route order (None for a stop not found)
+        month, theme: as for render_context
+        budget (int): approximate token budget for all stops together
+
+    Returns:
+        str: one render_context() block per stop, separated by blank lines
+    """
+    records = [r for r in records or [] if r]
+    if not records:
+        return "No dataset entry for this destination."
+    share = max(40, budget // len(records))
+    return "\n\n".join(render_context(r, month=month, theme=theme, budget=share) for r in records)
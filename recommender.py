@@ -0,0 +1,234 @@
+import threading
+from datetime import datetime
+import numpy as np
+from city_store import BUDGET_LEVELS, DURATION_LABELS, THEME_COLUMNS, get_city_store
+from climate import MONTH_NAMES
+from prompt_parser import MONTH_ALIASES, SEASON_MONTHS, THEMES, _tokens
+
+REGIONS = ["africa", "asia", "europe", "middle_east", "north_america", "oceania", "south_america"]
+
+# target average temperature (°C) per temperature preference
+TEMPERATURE_TARGETS = {"hot": 30.0, "warm": 26.0, "mild": 20.0, "cool": 12.0, "cold": 2.0}
+TEMPERATURE_WORDS = {"hot": "hot", "tropical": "hot", "warm": "warm", "sunny": "warm", "mild": "mild",
+                     "cool": "cool", "chilly": "cool", "cold": "cold", "snow": "cold", "snowy": "cold"}
+BUDGET_WORDS = {"budget": "Budget", "cheap": "Budget", "affordable": "Budget", "backpacking": "Budget",
+                "midrange": "Mid-range", "moderate": "Mid-range", "luxury": "Luxury", "luxurious": "Luxury",
+                "upscale": "Luxury"}
+REGION_WORDS = {"africa": "africa", "african": "africa", "asia": "asia", "asian": "asia", "europe": "europe",
+                "european": "europe", "oceania": "oceania", "pacific": "oceania", "australia": "oceania"}
+TEMPERATURE_SIGMA = 5.0
+
+DEFAULT_WEIGHTS = {"theme": 1.0, "temperature": 0.8, "budget": 0.5, "duration": 0.3}
+
+
+def temperature_target(temperature):
+    """
+    Target average °C for a temperature preference: a word ("warm", "chilly", any case) or a number.
+
+    Raises:
+        ValueError: for anything else
+    """
+    if isinstance(temperature, (int, float)) and not isinstance(temperature, bool):
+        return float(temperature)
+    word = str(temperature).strip().lower()
+    if word in TEMPERATURE_WORDS:
+        return TEMPERATURE_TARGETS[TEMPERATURE_WORDS[word]]
+    try:
+        return float(word)
+    except ValueError:
+        raise ValueError(f"unknown temperature {temperature!r}: use one of {', '.join(TEMPERATURE_TARGETS)} "
+                         f"or a temperature in °C") from None
+
+
+def budget_level(budget) -> str:
+    """
+    Dataset budget level ("Budget", "Mid-range", "Luxury") for a budget preference in any case, or a synonym.
+
+    Raises:
+        ValueError: for anything else
+    """
+    word = str(budget).strip().lower()
+    levels = {level.lower(): level for level in BUDGET_LEVELS}
+    level = levels.get(word) or BUDGET_WORDS.get(word.replace("-", "").replace(" ", ""))
+    if level is None:
+        raise ValueError(f"unknown budget {budget!r}: use one of {', '.join(BUDGET_LEVELS)}")
+    return level
+
+
+def duration_label(days: int) -> str:
+    """
+    Map a trip length in days onto the dataset's ideal_durations labels.
+    """
+    if days <= 1:
+        return "Day trip"
+    if days <= 3:
+        return "Weekend"
+    if days <= 6:
+        return "Short trip"
+    if days <= 9:
+        return "One week"
+    return "Long trip"
+
+
+def preferences_from_message(message: str) -> dict:
+    """
+    Extract recommend() keyword arguments from free text, e.g.
+    "somewhere warm with beaches and nightlife in February, budget" ->
+    {"themes": ["Beaches", "Nightlife"], "month": 2, "temperature": "warm", "budget": "Budget"}
+    """
+    keywords = {kw: theme for theme, kws in THEMES.items() for kw in kws if kw != "city"}
+    _, lower = _tokens(message or "")
+    prefs = {"themes": []}
+    for i, tok in enumerate(lower):
+        if i > 0 and f"{lower[i - 1]}_{tok}" in REGIONS:       # "middle east", "south america", ...
+            prefs.setdefault("regions", []).append(f"{lower[i - 1]}_{tok}")
+        elif tok in keywords and keywords[tok] not in prefs["themes"]:
+            prefs["themes"].append(keywords[tok])
+        elif tok in TEMPERATURE_WORDS:
+            prefs.setdefault("temperature", TEMPERATURE_WORDS[tok])
+        elif tok in BUDGET_WORDS:
+            prefs.setdefault("budget", BUDGET_WORDS[tok])
+        elif tok in REGION_WORDS:
+            prefs.setdefault("regions", []).append(REGION_WORDS[tok])
+        elif tok in MONTH_ALIASES and tok != "may":
+            prefs.setdefault("month", MONTH_NAMES.index(MONTH_ALIASES[tok]) + 1)
+        elif tok in SEASON_MONTHS:
+            prefs.setdefault("month", SEASON_MONTHS[tok])
+        elif tok in ("day", "days", "week", "weeks") and i > 0 and lower[i - 1].isdigit():
+            prefs.setdefault("duration", int(lower[i - 1]) * (7 if tok.startswith("week") else 1))
+    return prefs
+
+
+class DestinationRecommender:
+    """
+    Rank every city in the dataset against theme, climate, budget, duration and region preferences.
+
+    Reads the CityStore arrays directly (int8 theme matrix, float32 monthly average temperatures, budget
+    codes, ideal-duration bitmask, interned country/region codes); recommend() scores all cities in one
+    vectorised pass.
+    """
+
+    def __init__(self, csv_path="cities.csv"):
+        self.csv_path = csv_path
+        self.load()
+
+    def load(self):
+        store = get_city_store(self.csv_path)
+        self.store = store
+        self.themes = store.themes
+        self.temps = store.climate[:, :, 0]
+        self.budgets = store.budget
+        self.durations = store.durations
+
+    def recommend(self, themes=None, month=None, temperature=None, budget=None, duration=None,
+                  regions=None, countries=None, top_k=5, weights=None):
+        """
+        Args:
+            themes (list): theme names (e.g. ["Beaches", "Nightlife"]); all nine count equally if empty
+            month (int): travel month (1-12); defaults to the current month for the temperature term
+            temperature: preferred climate ("hot", "warm", "mild", "cool", "cold") or a target °C
+            budget (str): "Budget", "Mid-range" or "Luxury" (any case)
+            duration (int): trip length in days, matched against ideal_durations
+            regions (list): only cities in these regions (e.g. ["europe"])
+            countries (list): only cities in these countries
+            top_k (int): number of results
+            weights (dict): overrides for DEFAULT_WEIGHTS
+
+        Returns:
+            list: top_k dicts (best first) with city, country, region, score, avg_temp, budget_level and theme scores
+
+        Raises:
+            ValueError: for an unknown temperature or budget (see temperature_target and budget_level)
+        """
+        w = {**DEFAULT_WEIGHTS, **(weights or {})}
+        n = len(self.store)
+        if n == 0:
+            return []
+
+        cols = [THEME_COLUMNS.index(t.lower()) for t in (themes or []) if t and t.lower() in THEME_COLUMNS]
+        theme_scores = self.themes[:, cols] if cols else self.themes
+        # mean over the rated themes only (0 = no rating in the dataset)
+        rated = (theme_scores > 0).sum(axis=1)
+        mean = np.where(rated > 0, theme_scores.sum(axis=1, dtype=np.float32) / np.maximum(rated, 1), 1.0)
+        score = w["theme"] * (mean - 1.0) / 4.0
+        total = w["theme"]
+
+        target = temperature_target(temperature) if temperature is not None else None
+        if target is not None:
+            month = month or datetime.today().month
+            diff = np.nan_to_num(self.temps[:, month - 1] - target, nan=3 * TEMPERATURE_SIGMA)
+            score += w["temperature"] * np.exp(-0.5 * (diff / TEMPERATURE_SIGMA) ** 2)
+            total += w["temperature"]
+
+        if budget is not None:
+            budget = budget_level(budget)
+            gap = np.abs(self.budgets - BUDGET_LEVELS.index(budget)).astype(np.float32)
+            score += w["budget"] * np.where(self.budgets < 0, 0.0, 1.0 - gap / 2.0)
+            total += w["budget"]
+
+        if duration:
+            bit = 1 << DURATION_LABELS.index(duration_label(int(duration)))
+            score += w["duration"] * ((self.durations & bit) > 0)
+            total += w["duration"]
+
+        score = score / total
+        mask = np.ones(n, dtype=bool)
+        if regions:
+            mask &= np.isin(self.store.region.codes, _codes(self.store.region.vocab, regions))
+        if countries:
+            mask &= np.isin(self.store.country.codes, _codes(self.store.country.vocab, countries))
+        score = np.where(mask, score, -np.inf)
+
+        k = min(top_k, int(mask.sum()))
+        if k <= 0:
+            return []
+        top = np.argpartition(-score, k - 1)[:k]
+        top = top[np.argsort(-score[top], kind="stable")]
+        return [self._result(int(i), float(score[i]), month) for i in top]
+
+    def _result(self, i, score, month):
+        temp = float(self.temps[i, month - 1]) if month else None
+        return {
+            "city": self.store.city[i],
+            "country": self.store.country[i],
+            "region": self.store.region[i],
+            "score": round(score, 4),
+            "avg_temp": None if temp is None or np.isnan(temp) else round(temp, 1),
+            "budget_level": BUDGET_LEVELS[self.budgets[i]] if self.budgets[i] >= 0 else None,
+            "themes": {t.capitalize(): int(v) for t, v in zip(THEME_COLUMNS, self.themes[i])},
+        }
+
+    @staticmethod
+    def details_for(result: dict, themes=None, month=None, duration=None, extras="") -> dict:
+        """
+        Turn a recommend() result into the details dict that TravelChatbot.atravel_planner expects.
+        """
+        theme = themes[0] if themes else max(result["themes"], key=result["themes"].get)
+        return {
+            "place": f"{result['city']}, {result['country']}",
+            "theme": theme,
+            "duration": duration or 5,
+            "time": MONTH_NAMES[month - 1] if month else "Today",
+            "extras": extras,
+        }
+
+
+def _codes(vocab, names):
+    wanted = {n.lower() for n in names}
+    return [i for i, v in enumerate(vocab) if v.lower() in wanted]
+
+
+_recommender = None
+_recommender_lock = threading.Lock()
+
+
+def get_recommender(csv_path="cities.csv"):
+    """
+    Return the process-wide DestinationRecommender, rebuilding it when the CityStore was reloaded.
+    """
+    global _recommender
+    store = get_city_store(csv_path)
+    with _recommender_lock:
+        if _recommender is None or _recommender.store is not store:
+            _recommender = DestinationRecommender(csv_path)
+    return _recommender
@@ -0,0 +1,180 @@
+import os
+import asyncio
+import threading
+from collections import OrderedDict
+import numpy as np
+from cache import DiskCache, TTLCache
+from climate import MONTH_NAMES
+from geocode import normalize_name
+from prompt_parser import SEASON_MONTHS
+from telemetry import mark_cache, span
+
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "1024"))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", str(6 * 3600)))
+RESPONSE_CACHE_TODAY_TTL = 10 * 60      # "today" plans embed live weather
+RESPONSE_CACHE_PATH = os.getenv("RESPONSE_CACHE_PATH")      # set to share entries across workers
+SEMANTIC_CACHE = os.getenv("SEMANTIC_CACHE", "1") == "1"
+SEMANTIC_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+SEMANTIC_CACHE_SIZE = 2048
+
+MONTH_WORDS = {name.lower() for name in MONTH_NAMES} | set(SEASON_MONTHS)
+
+
+def trip_days(duration) -> str:
+    # exact: an itinerary is planned day by day, so a 3-day plan never answers a 4-day request
+    try:
+        return str(int(duration))
+    except (TypeError, ValueError):
+        return "5"
+
+
+def normalize_extras(extras) -> str:
+    """
+    Order- and case-insensitive form of the parsed extras ("Vegetarian, kids" == "kids vegetarian").
+    """
+    return " ".join(sorted(set(normalize_name(str(extras or "")).split())))
+
+
+class ResponseCache:
+    """
+    Cache of /chat results keyed on the normalised parsed request rather than the raw message.
+
+    Tier 1 keys on (canonical place, theme, duration in days, normalised extras, normalised time), with the
+    place canonicalised through TravelRAG.canonical_place; requests with different constraints in extras
+    ("vegetarian", "wheelchair accessible") or different times ("next week", "Christmas") never share an
+    itinerary. Results live in an in-memory LRU with TTL, or in a SQLite file shared by all workers when
+    RESPONSE_CACHE_PATH is set.
+    Tier 2 (optional) remembers the MiniLM embedding of every raw message that produced a tier-1 key, so a
+    near-duplicate message is answered without the full (possibly Gemini) parse. A near duplicate must also
+    pass guard(): the same numbers and month words, and the same key under the local parser when one is given.
+
+    Args:
+        rag (TravelRAG): canonicalises places and provides the embedding model
+        parse (callable): optional local parser (message -> details) for the semantic guard, e.g. the
+            FastPromptParser; without it only numbers and month words are compared
+    """
+
+    def __init__(self, rag, maxsize=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL, path=RESPONSE_CACHE_PATH,
+                 semantic=SEMANTIC_CACHE, threshold=SEMANTIC_THRESHOLD, parse=None):
+        self.rag = rag
+        self.parse = parse
+        self.ttl = ttl
+        self.store = DiskCache(path, maxsize=maxsize, ttl=ttl) if path else TTLCache(maxsize=maxsize, ttl=ttl)
+        self.semantic = semantic and rag.dense     # the semantic tier needs the embedding model
+        self.threshold = threshold
+        self.semantic_hits = 0
+        self._messages = OrderedDict()      # normalised message -> (embedding, guard, key)
+        self._lock = threading.Lock()
+
+    def key(self, details: dict) -> str:
+        place = details.get("place", "") or ""
+        canonical = self.rag.canonical_place(place) or normalize_name(place)
+        # the planning prompt includes the time as given, so "next week" and "Christmas" plans differ
+        time = normalize_name(details.get("time") or "Today") or "today"
+        theme = str(details.get("theme", "Culture")).strip().lower()
+        extras = normalize_extras(details.get("extras"))
+        return "|".join([canonical, theme, trip_days(details.get("duration")), extras, time])
+
+    def guard(self, message: str):
+        """
+        What two messages must share before one can answer the other from the semantic tier: their numbers
+        and month/season words, so "3 days in Paris" never answers "4 days in Paris" however similar the
+        embeddings are, and their tier-1 key under the local parser (extras included), so "... vegetarian"
+        never answers "... vegan".
+        """
+        words = normalize_name(message).split()
+        numbers = tuple(sorted(w for w in words if w.isdigit() or w in MONTH_WORDS))
+        if self.parse is None:
+            return numbers
+        return numbers, self.key(self.parse(message))
+
+    def get(self, key):
+        return self.store.get(key)
+
+    def set(self, key, result):
+        ttl = RESPONSE_CACHE_TODAY_TTL if key.endswith("|today") else self.ttl
+        self.store.set(key, result, ttl=ttl)
+
+    def _embed(self, message: str):
+        with span("rag_encode", purpose="semantic_cache"):
+            vector = self.rag.embedder.encode([message])[0]
+            return vector / (np.linalg.norm(vector) or 1.0)
+
+    def _prepare(self, message: str):
+        return self._embed(message), self.guard(message)
+
+    def lookup_message(self, message: str, embedding=None, guard=None):
+        """
+        Tier 2: return the cached tier-1 key of a previously seen message that is a near duplicate
+        of this one, or None.
+        """
+        if not self.semantic or not self._messages:
+            return None
+        norm = normalize_name(message)
+        with self._lock:
+            exact = self._messages.get(norm)
+            entries = list(self._messages.values())
+        if exact is not None:
+            return exact[2]
+        if guard is None:
+            guard = self.guard(message)
+        candidates = [e for e in entries if e[1] == guard]
+        if not candidates:
+            return None
+        if embedding is None:
+            embedding = self._embed(message)
+        scores = np.stack([e[0] for e in candidates]) @ embedding
+        best = int(np.argmax(scores))
+        return candidates[best][2] if scores[best] >= self.threshold else None
+
+    def remember(self, message: str, key: str, embedding=None, guard=None):
+        if not self.semantic:
+            return
+        norm = normalize_name(message)
+        if embedding is None:
+            embedding = self._embed(message)
+        if guard is None:
+            guard = self.guard(message)
+        entry = (embedding, guard, key)
+        with self._lock:
+            self._messages[norm] = entry
+            self._messages.move_to_end(norm)
+            while len(self._messages) > SEMANTIC_CACHE_SIZE:
+                self._messages.popitem(last=False)
+
+    async def aget_or_generate(self, message: str, parse, plan):
+        """
+        Serve message from the cache, or run parse (message -> details) and plan (details -> result) and
+        cache the result.
+
+        Returns:
+            tuple: (result dict, cache status: "HIT-SEMANTIC", "HIT" or "MISS")
+        """
+        embedding = guard = None
+        if self.semantic:
+            embedding, guard = await asyncio.to_thread(self._prepare, message)
+        key = self.lookup_message(message, embedding, guard)
+        if key is not None:
+            result = self.get(key)
+            if result is not None:
+                self.semantic_hits += 1
+                mark_cache("response", "semantic_hit")
+                return result, "HIT-SEMANTIC"
+
+        details = await parse(message)
+        key = await asyncio.to_thread(self.key, details)
+        result = self.get(key)
+        status = "HIT"
+        if result is None:
+            mark_cache("response", "miss")
+            result = await plan(details)
+            self.set(key, result)
+            status = "MISS"
+        else:
+            mark_cache("response", "hit")
+            result = {**result, "parsed_prompt": details}
+        self.remember(message, key, embedding, guard)
+        return result, status
+
+    def stats(self):
+        return {**self.store.stats(), "semantic_hits": self.semantic_hits, "semantic_entries": len(self._messages)}
@@ -0,0 +1,155 @@
+import math
+import re
+from collections import Counter, defaultdict
+import numpy as np
+from geocode import normalize_name
+
+RRF_K = 60                  # reciprocal-rank fusion constant
+STAGE_DEPTH = 20            # candidates taken from each ranked stage before fusion
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+BM25_STOPWORDS = {"a", "an", "and", "the", "of", "in", "on", "to", "for", "with", "by", "its", "is", "are",
+                  "that", "this", "from", "at", "as", "or", "into", "their", "it", "be", "where", "while"}
+
+
+def bm25_tokens(text: str):
+    return [t for t in re.findall(r"\w+", normalize_name(text)) if t not in BM25_STOPWORDS]
+
+
+class BM25Index:
+    """
+    Okapi BM25 over a list of documents, stored as an inverted index of numpy posting arrays.
+    """
+
+    def __init__(self, texts):
+        postings = defaultdict(list)
+        lengths = np.zeros(len(texts), dtype=np.float32)
+        for doc_id, text in enumerate(texts):
+            tokens = bm25_tokens(text)
+            lengths[doc_id] = len(tokens)
+            for term, tf in Counter(tokens).items():
+                postings[term].append((doc_id, tf))
+        n = len(texts)
+        avg_len = float(lengths.mean()) if n else 0.0
+        self.n_docs = n
+        # per-term (doc ids, precomputed BM25 term weights)
+        self.postings = {}
+        for term, entries in postings.items():
+            ids = np.array([d for d, _ in entries], dtype=np.int32)
+            tf = np.array([t for _, t in entries], dtype=np.float32)
+            idf = math.log(1.0 + (n - len(ids) + 0.5) / (len(ids) + 0.5))
+            norm = tf + BM25_K1 * (1.0 - BM25_B + BM25_B * lengths[ids] / (avg_len or 1.0))
+            self.postings[term] = (ids, (idf * tf * (BM25_K1 + 1.0) / norm).astype(np.float32))
+
+    def search(self, query: str, top_k=STAGE_DEPTH):
+        """
+        Returns:
+            list: (doc id, score) pairs with score > 0, best first
+        """
+        scores = np.zeros(self.n_docs, dtype=np.float32)
+        hit = False
+        for term in set(bm25_tokens(query)):
+            entry = self.postings.get(term)
+            if entry is not None:
+                np.add.at(scores, entry[0], entry[1])
+                hit = True
+        if not hit:
+            return []
+        k = min(top_k, int((scores > 0).sum()))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(int(i), float(scores[i])) for i in top]
+
+
+def rrf(rankings, k=RRF_K):
+    """
+    Reciprocal-rank fusion. rankings is a list of ranked lists of doc ids, or of lists of "tiers"
+    (sets of doc ids sharing a rank). Returns doc ids ordered by fused score.
+    """
+    fused = defaultdict(float)
+    first_seen = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking):
+            for doc_id in (item if isinstance(item, (list, set, tuple)) else (item,)):
+                fused[doc_id] += 1.0 / (k + rank + 1)
+                first_seen.setdefault(doc_id, len(first_seen))
+    return sorted(fused, key=lambda d: (-fused[d], first_seen[d]))
+
+
+class HybridRetriever:
+    """
+    Three-stage retrieval over the city dataset:
+
+    1. exact: O(1) dictionary of normalised city names, "city country" and country aliases.
+       An exact city hit is returned immediately (for top_k=1); the model is never touched.
+    2. lexical: BM25 over the city/country names and short_description.
+    3. dense (optional): a callable (list of queries, top_k) -> ranked row lists, i.e. MiniLM + FAISS.
+
+    Stages that produce candidates are merged with reciprocal-rank fusion. A query nothing matches
+    returns no rows.
+    """
+
+    def __init__(self, cities, countries, descriptions, dense=None):
+        self.cities = {}
+        self.countries = defaultdict(list)
+        for i, (city, country) in enumerate(zip(cities, countries)):
+            for alias in (city, f"{city} {country}"):
+                self.cities.setdefault(normalize_name(alias), i)
+            if country:
+                self.countries[normalize_name(country)].append(i)
+        self.bm25 = BM25Index([f"{c} {k} {d}" for c, k, d in zip(cities, countries, descriptions)])
+        self.dense = dense
+
+    def exact(self, query: str):
+        """
+        Returns:
+            int or None: row of the city named by query; None if query is not an exact city alias
+        """
+        return self.cities.get(normalize_name(query))
+
+    def search(self, query: str, top_k=1):
+        return self.search_batch([query], top_k)[0]
+
+    def search_batch(self, queries, top_k=1):
+        """
+        Returns:
+            list: one ranked list of row ids (at most top_k) per query
+        """
+        results = [None] * len(queries)
+        exact_rows = {}
+        pending = []
+        for i, query in enumerate(queries):
+            row = self.exact(query) if query else None
+            if row is not None and top_k == 1:
+                results[i] = [row]
+            elif query:
+                if row is not None:
+                    exact_rows[i] = row
+                pending.append(i)
+            else:
+                results[i] = []
+
+        dense_rankings = {}
+        if pending and self.dense is not None:
+            ranked = self.dense([queries[i] for i in pending], max(top_k, STAGE_DEPTH))
+            dense_rankings = dict(zip(pending, ranked))
+
+        for i in pending:
+            rankings = []
+            country_rows = self.countries.get(normalize_name(queries[i]))
+            if country_rows:
+                rankings.append([country_rows])   # all of the country's cities share the top rank
+            lexical = [d for d, _ in self.bm25.search(queries[i])]
+            if lexical:
+                rankings.append(lexical)
+            if i in dense_rankings:
+                rankings.append(dense_rankings[i])
+            fused = rrf(rankings)
+            if country_rows:
+                allowed = set(country_rows)
+                fused = [d for d in fused if d in allowed]
+            if i in exact_rows:
+                fused = [exact_rows[i]] + [d for d in fused if d != exact_rows[i]]
+            results[i] = fused[:top_k]
+        return results
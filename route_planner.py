@@ -0,0 +1,261 @@
+import os
+import re
+import threading
+import numpy as np
+from city_store import THEME_COLUMNS, get_city_store
+from geo_index import get_geo_index, haversine_km
+from geocode import normalize_name
+from prompt_parser import DIRECTIONS
+
+# trips shorter than this stay single-destination unless several cities are named explicitly
+ROUTE_MIN_DAYS = int(os.getenv("ROUTE_MIN_DAYS", "6"))
+ROUTE_DAYS_PER_STOP = float(os.getenv("ROUTE_DAYS_PER_STOP", "3"))
+ROUTE_MAX_STOPS = int(os.getenv("ROUTE_MAX_STOPS", "6"))
+MIN_STOP_SPACING_KM = 40.0          # closer candidates count as the same stop
+REACH_KM_PER_DAY = 200.0            # how far from the first stop a route may reach, per trip day
+MIN_REACH_KM = 400.0
+
+REGION_NAMES = {"africa": "africa", "asia": "asia", "europe": "europe", "middle east": "middle_east",
+                "north america": "north_america", "oceania": "oceania", "south america": "south_america"}
+SPLIT_PLACES = re.compile(r"\s*(?:,|;|/|&|->|\band\b|\bthen\b)\s*", re.IGNORECASE)
+
+
+def route_length(order, dist):
+    return float(sum(dist[a, b] for a, b in zip(order, order[1:])))
+
+
+def order_stops(lat, lon):
+    """
+    Shortest open path through all points (heuristic): nearest-neighbour from every start, improved with
+    2-opt, best total kept. Exact enough for the handful of stops in a trip.
+
+    Returns:
+        tuple: (visit order as positions into lat/lon, total km)
+    """
+    n = len(lat)
+    dist = haversine_km(lat[:, None], lon[:, None], lat[None, :], lon[None, :])
+    if n <= 2:
+        return list(range(n)), route_length(list(range(n)), dist)
+    best, best_km = None, float("inf")
+    for start in range(n):
+        order, left = [start], set(range(n)) - {start}
+        while left:
+            nxt = min(left, key=lambda j: dist[order[-1], j])
+            order.append(nxt)
+            left.remove(nxt)
+        order = _two_opt(order, dist)
+        km = route_length(order, dist)
+        if km < best_km:
+            best, best_km = order, km
+    return best, best_km
+
+
+def _two_opt(order, dist):
+    """
+    Reverse segments of an open path while that shortens it.
+    """
+    improved = True
+    while improved:
+        improved = False
+        for i in range(len(order) - 2):
+            for j in range(i + 2, len(order)):
+                a, b = order[i], order[i + 1]
+                c = order[j]
+                d = order[j + 1] if j + 1 < len(order) else None
+                delta = dist[a, c] - dist[a, b]
+                if d is not None:
+                    delta += dist[b, d] - dist[c, d]
+                if delta < -1e-9:
+                    order[i + 1:j + 1] = reversed(order[i + 1:j + 1])
+                    improved = True
+    return order
+
+
+def split_days(duration: int, weights):
+    """
+    Split duration days over the stops: one day each, the rest proportional to weights (largest remainder).
+    """
+    n = len(weights)
+    weights = np.asarray(weights, dtype=np.float64)
+    weights = weights / weights.sum() if weights.sum() > 0 else np.full(n, 1.0 / n)
+    extra = max(0, int(duration) - n)
+    share = weights * extra
+    days = np.floor(share).astype(int)
+    for i in np.argsort(-(share - days), kind="stable")[:extra - int(days.sum())]:
+        days[i] += 1
+    return [int(d) + 1 for d in days]
+
+
+class RoutePlanner:
+    """
+    Turns a multi-city request ("Rome, Florence and Venice", "northern Italy", "Japan", "south america")
+    into an ordered route with a day split, using the CityStore and the GeoIndex over its coordinates.
+
+    Stops are chosen by the requested theme's score, at least MIN_STOP_SPACING_KM apart and within reach of
+    the best-scoring city (REACH_KM_PER_DAY per trip day), then ordered by order_stops().
+    """
+
+    def __init__(self, csv_path="cities.csv"):
+        self.csv_path = csv_path
+        self._names = (None, {}, {})        # (store, normalised city -> rows, normalised country -> name)
+        self._lock = threading.Lock()
+
+    def plan(self, place: str, duration: int, theme=None, month=None):
+        """
+        Args:
+            place (str): the parsed destination
+            duration (int): trip length in days
+            theme (str): requested theme, used to score candidate cities
+            month (int): travel month (1-12), for the per-stop climate
+
+        Returns:
+            dict or None: {"stops": [{city, country, latitude, longitude, days, km_from_previous,
+            theme_score, avg_temp}, ...], "total_km": float}; None for a single-destination request
+        """
+        store = get_city_store(self.csv_path)
+        duration = max(1, int(duration or 1))
+        cities, countries = self._lookup(store)
+        rows = self._named_cities(place, cities, countries, store)
+        if len(rows) < 2:
+            area = self._area_rows(place, countries, store)
+            if area is None or duration < ROUTE_MIN_DAYS:
+                return None
+            rows = self._choose_stops(store, area, duration, theme)
+        rows = rows[:min(ROUTE_MAX_STOPS, duration)]
+        if len(rows) < 2:
+            return None
+
+        rows = np.asarray(rows)
+        order, total_km = order_stops(store.lat[rows].astype(np.float64), store.lon[rows].astype(np.float64))
+        rows = rows[order]
+        scores = self._scores(store, theme)[rows]
+        days = split_days(duration, scores)
+        stops, previous = [], None
+        for row, day_count, score in zip(rows, days, scores):
+            leg = None if previous is None else float(haversine_km(store.lat[previous], store.lon[previous],
+                                                                   store.lat[row], store.lon[row]))
+            temp = float(store.climate[row, month - 1, 0]) if month else float("nan")
+            stops.append({
+                "city": store.city[row],
+                "country": store.country[row],
+                "latitude": round(float(store.lat[row]), 4),
+                "longitude": round(float(store.lon[row]), 4),
+                "days": day_count,
+                "km_from_previous": None if leg is None else round(leg),
+                "theme_score": round(float(score), 2),
+                "avg_temp": None if np.isnan(temp) else round(temp, 1),
+            })
+            previous = row
+        return {"stops": stops, "total_km": round(total_km)}
+
+    def known_place(self, place: str) -> bool:
+        """
+        True if place names one or more dataset cities or an area (country, region, "northern Italy").
+        """
+        store = get_city_store(self.csv_path)
+        cities, countries = self._lookup(store)
+        return bool(self._named_cities(place, cities, countries, store)) or \
+            self._area_rows(place, countries, store) is not None
+
+    @staticmethod
+    def _scores(store, theme):
+        col = THEME_COLUMNS.index(theme.lower()) if theme and theme.lower() in THEME_COLUMNS else None
+        if col is None:
+            return store.themes.mean(axis=1, dtype=np.float32)
+        return store.themes[:, col].astype(np.float32)
+
+    def _lookup(self, store):
+        """
+        Name dictionaries for store, rebuilt only when the store was reloaded.
+        """
+        with self._lock:
+            if self._names[0] is not store:
+                cities = {}
+                for i in range(len(store)):
+                    cities.setdefault(normalize_name(store.city[i]), []).append(i)
+                self._names = (store, cities, {normalize_name(c): c for c in store.country.vocab})
+            return self._names[1], self._names[2]
+
+    @staticmethod
+    def _named_cities(place: str, cities, countries, store):
+        """
+        Rows of the dataset cities named in place ("Rome, Florence and Venice"), in the order given.
+        A country right after a city picks that country's city of the name ("Paris, France").
+        """
+        parts = [normalize_name(p) for p in SPLIT_PLACES.split(place or "") if p.strip()]
+        rows = []
+        for i, part in enumerate(parts):
+            matches = cities.get(part)
+            if not matches:
+                continue
+            nxt = parts[i + 1] if i + 1 < len(parts) else None
+            if nxt in countries:
+                matches = [r for r in matches if normalize_name(store.country[r]) == nxt] or matches
+            if matches[0] not in rows:
+                rows.append(matches[0])
+        return rows
+
+    @staticmethod
+    def _area_rows(place: str, countries, store):
+        """
+        Rows in the country or region named by place, optionally narrowed by a direction word to the half
+        of its cities on that side ("northern Italy"). None if place is not an area.
+        """
+        words = normalize_name(place or "").split()
+        name, direction = " ".join(words), None
+        if len(words) > 1 and words[0] in DIRECTIONS and name not in countries and name not in REGION_NAMES:
+            name, direction = " ".join(words[1:]), DIRECTIONS[words[0]]
+        if name in countries:
+            code = store.country.vocab.index(countries[name])
+            rows = np.flatnonzero(store.country.codes == code)
+        elif name in REGION_NAMES and REGION_NAMES[name] in store.region.vocab:
+            rows = np.flatnonzero(store.region.codes == store.region.vocab.index(REGION_NAMES[name]))
+        else:
+            return None
+        rows = rows[~(np.isnan(store.lat[rows]) | np.isnan(store.lon[rows]))]
+        if direction and len(rows) > 3:
+            lat, lon = store.lat[rows], store.lon[rows]
+            keep = {"north": lat >= np.median(lat), "south": lat <= np.median(lat),
+                    "east": lon >= np.median(lon), "west": lon <= np.median(lon),
+                    "central": (np.abs(lat - np.median(lat)) <= np.percentile(np.abs(lat - np.median(lat)), 60))
+                    & (np.abs(lon - np.median(lon)) <= np.percentile(np.abs(lon - np.median(lon)), 60))}[direction]
+            rows = rows[keep]
+        return rows if len(rows) else None
+
+    def _choose_stops(self, store, area, duration, theme):
+        """
+        Best-scoring cities of area, spread at least MIN_STOP_SPACING_KM apart and within reach of the
+        best one (radius query on the GeoIndex).
+        """
+        n_stops = int(max(1, min(ROUTE_MAX_STOPS, round(duration / ROUTE_DAYS_PER_STOP))))
+        scores = self._scores(store, theme)
+        area = area[np.argsort(-scores[area], kind="stable")]
+        seed = int(area[0])
+        reach, _ = get_geo_index(self.csv_path).radius(store.lat[seed], store.lon[seed],
+                                                         max(MIN_REACH_KM, REACH_KM_PER_DAY * duration))
+        reachable = set(reach.tolist())
+        chosen = [seed]
+        for row in area[1:]:
+            if len(chosen) >= n_stops:
+                break
+            if int(row) not in reachable:
+                continue
+            gaps = haversine_km(store.lat[row], store.lon[row], store.lat[chosen], store.lon[chosen])
+            if gaps.min() >= MIN_STOP_SPACING_KM:
+                chosen.append(int(row))
+        return chosen
+
+
+_planner = None
+_planner_lock = threading.Lock()
+
+
+def get_route_planner(csv_path="cities.csv"):
+    """
+    Return the process-wide RoutePlanner, creating it on first call.
+    """
+    global _planner
+    with _planner_lock:
+        if _planner is None:
+            _planner = RoutePlanner(csv_path)
+    return _planner
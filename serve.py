@@ -0,0 +1,296 @@
+"""
+Pre-fork server for multi-core hosts. The parent process imports the app and loads everything the workers
+only read (embedding model, FAISS index, CityStore, retrieval, geo and recommender indexes), then forks
+worker processes that serve one shared listening socket. Workers share the parent's pages copy-on-write,
+and the CityStore columns and the cached FAISS index's vector codes are memory-mapped files shared through
+the page cache, so each extra worker costs its own request state rather than another copy of the model and
+data. (IVF-PQ indexes are read into memory, and an index updated by a reload is private to each worker.)
+
+    python serve.py --workers 4 --port 8000
+    kill -USR1 <parent pid>         # log the per-worker memory report again
+    kill -HUP <parent pid>          # reload cities.csv in the parent and every worker
+
+The memory report lists RSS, PSS (resident memory with shared pages divided among the processes sharing
+them), shared and private MB per process; PSS well below RSS confirms the sharing. Linux only.
+
+Workers are separate processes: the response cache, embedding LRU, counters, /metrics and /cache/stats are
+per worker. The Gemini quota (GEMINI_RPM, GEMINI_TPM) and Nominatim's 1 request per second are split
+evenly between the workers. POST /admin/reload in any worker signals the parent, which reloads and relays
+SIGHUP to every worker.
+"""
+import os
+import gc
+import sys
+import time
+import threading
+import signal
+import socket
+import logging
+import argparse
+
+# worker processes (0: one per available CPU)
+SERVE_WORKERS = int(os.getenv("SERVE_WORKERS", "0"))
+# seconds after startup at which the memory report is logged (0 disables it; SIGUSR1 always works)
+SERVE_REPORT_AFTER = float(os.getenv("SERVE_REPORT_AFTER", "30"))
+# a worker dying sooner than this after its start is restarted with a delay
+MIN_WORKER_LIFETIME = 5.0
+
+log = logging.getLogger(__name__)
+
+
+def cgroup_cpu_limit():
+    """
+    Returns:
+        float or None: CPUs allowed by the cgroup quota (cgroup v2 cpu.max, or v1 cpu.cfs_quota_us over
+        cpu.cfs_period_us); None when there is no quota or it cannot be read
+    """
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()[:2]
+        return None if quota == "max" else int(quota) / int(period)
+    except (OSError, ValueError):
+        pass
+    try:
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+            quota = int(f.read())
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+            period = int(f.read())
+    except (OSError, ValueError):
+        return None
+    return quota / period if quota > 0 and period > 0 else None
+
+
+def available_cpus():
+    """
+    Returns:
+        int: CPUs this process may run on: its affinity mask (taskset, cpusets), capped by a container's
+        CPU quota. os.cpu_count() counts every core of the host instead.
+    """
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    limit = cgroup_cpu_limit()
+    if limit:
+        cpus = min(cpus, int(limit))
+    return max(1, cpus)
+
+
+def process_memory(pid="self"):
+    """
+    Returns:
+        dict: rss_mb, pss_mb, shared_mb and private_mb of the process, from /proc/<pid>/smaps_rollup
+        (empty if it cannot be read)
+    """
+    fields = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 3 and parts[2] == "kB":
+                    fields[parts[0].rstrip(":")] = int(parts[1])
+    except OSError:
+        return {}
+
+    def mb(*names):
+        return round(sum(fields.get(n, 0) for n in names) / 1024, 1)
+
+    return {"rss_mb": mb("Rss"), "pss_mb": mb("Pss"), "shared_mb": mb("Shared_Clean", "Shared_Dirty"),
+            "private_mb": mb("Private_Clean", "Private_Dirty")}
+
+
+def memory_report(pids):
+    """
+    Log process_memory() for the parent and every worker, and the totals: the summed PSS is the real
+    footprint of the whole server, the summed RSS what it would be without any sharing.
+    """
+    rows = [("parent", os.getpid())] + [("worker", pid) for pid in sorted(pids)]
+    total_rss = total_pss = 0.0
+    for role, pid in rows:
+        mem = process_memory(pid)
+        if not mem:
+            continue
+        total_rss += mem["rss_mb"]
+        total_pss += mem["pss_mb"]
+        log.info("🔹 [serve] %s %s: rss %.1f MB, pss %.1f MB, shared %.1f MB, private %.1f MB",
+                 role, pid, mem["rss_mb"], mem["pss_mb"], mem["shared_mb"], mem["private_mb"])
+    log.info("🔹 [serve] total: pss %.1f MB for %s processes (rss sum %.1f MB)", total_pss, len(rows), total_rss)
+
+
+def preload():
+    """
+    Import the app and load its read-only state in the parent. Nothing loaded here may hold threads,
+    sockets or event loops: the Gemini client, HTTP pools and the embedding worker thread are created in
+    each worker by the app's lifespan (and SQLite caches reconnect per process).
+
+    Returns:
+        FastAPI: the app
+    """
+    import main
+    from geo_index import get_geo_index
+    from recommender import get_recommender
+    from climate import get_climatology
+
+    start = time.perf_counter()
+    main.get_rag("cities.csv").warm_up()
+    main.chatbot.fast_parser
+    get_recommender()
+    get_climatology()
+    get_geo_index("cities.csv")
+    log.info("✅ [serve] preloaded model, index and city data in %.2fs", time.perf_counter() - start)
+    return main.app
+
+
+def limit_threads(workers: int):
+    """
+    Give each worker an equal share of the cores for torch and FAISS, so N workers do not each start a
+    thread per core.
+    """
+    threads = max(1, available_cpus() // workers)
+    if "torch" in sys.modules:
+        sys.modules["torch"].set_num_threads(threads)
+    if "faiss" in sys.modules:
+        sys.modules["faiss"].omp_set_num_threads(threads)
+
+
+def reload_dataset():
+    """
+    Reload cities.csv if it changed since this process loaded it (the worker whose /admin/reload started
+    the relay finds nothing to do).
+    """
+    from rag import get_rag
+    try:
+        result = get_rag("cities.csv").reload_if_changed()
+    except Exception as e:
+        log.warning("⚠️ [serve] reload in %s failed: %s", os.getpid(), e)
+        return
+    if result:
+        log.info("✅ [serve] %s reloaded the dataset: %s", os.getpid(), result)
+
+
+def run_worker(app, sock, workers: int):
+    import uvicorn
+    for sig in (signal.SIGINT, signal.SIGTERM, signal.SIGUSR1):
+        signal.signal(sig, signal.SIG_DFL)
+    # SIGHUP from the parent: reload off the event loop's thread
+    signal.signal(signal.SIGHUP, lambda *_: threading.Thread(target=reload_dataset, name="dataset-reload",
+                                                             daemon=True).start())
+    limit_threads(workers)
+    # log_config=None keeps the logging configured by main.py
+    server = uvicorn.Server(uvicorn.Config(app, log_config=None))
+    server.run(sockets=[sock])
+
+
+class Supervisor:
+    """
+    Forks the workers, restarts any that exit and stops them all on SIGINT/SIGTERM. On SIGHUP (sent by a
+    worker's /admin/reload) it relays the signal to every worker and reloads its own copy of the dataset,
+    so restarted workers start from the new data.
+    """
+
+    def __init__(self, app, sock, workers: int, report_after=SERVE_REPORT_AFTER):
+        self.app = app
+        self.sock = sock
+        self.workers = workers
+        self.children = {}          # pid -> start time
+        self.stopping = False
+        self.reload_requested = False
+        self.report_at = time.monotonic() + report_after if report_after > 0 else None
+
+    def spawn(self):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                run_worker(self.app, self.sock, self.workers)
+            except BaseException:
+                log.exception("❌ [serve] worker %s crashed", os.getpid())
+                code = 1
+            finally:
+                logging.shutdown()
+                os._exit(code)
+        self.children[pid] = time.monotonic()
+
+    def stop(self, *_):
+        if not self.stopping:
+            self.stopping = True
+            for pid in self.children:
+                try:
+                    os.kill(pid, signal.SIGTERM)
+                except ProcessLookupError:
+                    pass
+
+    def request_report(self, *_):
+        self.report_at = time.monotonic()
+
+    def request_reload(self, *_):
+        self.reload_requested = True
+
+    def relay_reload(self):
+        self.reload_requested = False
+        log.info("🔹 [serve] relaying reload to workers %s", sorted(self.children))
+        for pid in self.children:
+            try:
+                os.kill(pid, signal.SIGHUP)
+            except ProcessLookupError:
+                pass
+        reload_dataset()
+
+    def run(self):
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGUSR1, self.request_report)
+        signal.signal(signal.SIGHUP, self.request_reload)
+        for _ in range(self.workers):
+            self.spawn()
+        log.info("✅ [serve] %s workers started: %s", self.workers, sorted(self.children))
+        while self.children:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+            if pid:
+                started = self.children.pop(pid, None)
+                if started is not None and not self.stopping:
+                    log.warning("⚠️ [serve] worker %s exited (status %s), restarting", pid, status)
+                    if time.monotonic() - started < MIN_WORKER_LIFETIME:
+                        time.sleep(1.0)
+                    self.spawn()
+                continue
+            if self.reload_requested and not self.stopping:
+                self.relay_reload()
+            if self.report_at is not None and time.monotonic() >= self.report_at:
+                self.report_at = None
+                memory_report(self.children)
+            time.sleep(0.2)
+        log.info("🔹 [serve] all workers stopped")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the API from pre-forked workers sharing one model and index.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=SERVE_WORKERS,
+                        help="worker processes (0: one per available CPU)")
+    parser.add_argument("--report-after", type=float, default=SERVE_REPORT_AFTER,
+                        help="seconds until the memory report is logged (0: only on SIGUSR1)")
+    args = parser.parse_args()
+    workers = args.workers or available_cpus()
+
+    # read by the app on import: the workers split the Gemini quota and Nominatim's 1 request per second,
+    # and /admin/reload finds the parent (values already set count other replicas on the same key or host)
+    for name in ("GEMINI_PROCESSES", "NOMINATIM_PROCESSES"):
+        os.environ[name] = str(int(os.getenv(name, "1")) * workers)
+    os.environ["SERVE_PARENT_PID"] = str(os.getpid())
+    app = preload()
+    sock = socket.socket(socket.AF_INET6 if ":" in args.host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((args.host, args.port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    log.info("🔹 [serve] listening on %s:%s", args.host, args.port)
+    # move everything loaded so far out of the collector's reach, so its passes do not write to (and
+    # un-share) the preloaded objects' pages in the workers
+    gc.freeze()
+    Supervisor(app, sock, workers, args.report_after).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,6 @@
 #!/bin/bash
-# Start FastAPI in the background
-uvicorn main:app --host 0.0.0.0 --port 8000 &
+# Start FastAPI in the background (pre-forked workers sharing the model and index; SERVE_WORKERS, default one per available CPU)
+python serve.py --host 0.0.0.0 --port 8000 &
 
 # Start Streamlit (keeps container running)
 streamlit run travel_ui.py --server.address 0.0.0.0 --server.port 8501
\ No newline at end of file
@@ -0,0 +1,181 @@
+"""
+Startup timing for the API process: how long the imports took, per warm-up step, and whether the process
+is ready to serve (for /readyz).
+
+With STARTUP_PROFILE=1 an import profiler is installed as soon as this module is imported (main.py imports
+it first), and the report breaks the import time down per module and per top-level package, like
+`python -X importtime` but available in-process and in the /readyz body.
+"""
+import os
+import sys
+import time
+import asyncio
+import logging
+import inspect
+import threading
+from contextlib import contextmanager
+
+STARTUP_PROFILE = os.getenv("STARTUP_PROFILE", "0") == "1"
+REPORT_TOP = 15
+
+log = logging.getLogger(__name__)
+
+
+class _TimedLoader:
+    """
+    Wraps a module loader to time exec_module (the module body, including its own imports).
+    """
+
+    def __init__(self, loader, profiler):
+        self._loader = loader
+        self._profiler = profiler
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        # hide the wrapper from the module itself
+        module.__loader__ = self._loader
+        if getattr(module, "__spec__", None) is not None:
+            module.__spec__.loader = self._loader
+        self._profiler._enter()
+        start = time.perf_counter()
+        try:
+            self._loader.exec_module(module)
+        finally:
+            self._profiler._exit(module.__name__, time.perf_counter() - start)
+
+    def __getattr__(self, name):
+        return getattr(self._loader, name)
+
+
+class ImportProfiler:
+    """
+    sys.meta_path hook recording cumulative and self time of every module imported while installed.
+    """
+
+    def __init__(self):
+        self.modules = {}           # name -> (cumulative seconds, self seconds)
+        self._children = threading.local()
+        self._finding = threading.local()
+
+    def install(self):
+        sys.meta_path.insert(0, self)
+        return self
+
+    def uninstall(self):
+        if self in sys.meta_path:
+            sys.meta_path.remove(self)
+
+    def find_spec(self, name, path=None, target=None):
+        if getattr(self._finding, "active", False):
+            return None
+        self._finding.active = True
+        try:
+            for finder in sys.meta_path:
+                if finder is self or not hasattr(finder, "find_spec"):
+                    continue
+                spec = finder.find_spec(name, path, target)
+                if spec is not None:
+                    break
+            else:
+                return None
+        finally:
+            self._finding.active = False
+        if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+            spec.loader = _TimedLoader(spec.loader, self)
+        return spec
+
+    def _enter(self):
+        stack = getattr(self._children, "stack", None)
+        if stack is None:
+            stack = self._children.stack = []
+        stack.append(0.0)
+
+    def _exit(self, name, seconds):
+        stack = self._children.stack
+        nested = stack.pop()
+        if stack:
+            stack[-1] += seconds
+        self.modules[name] = (seconds, max(0.0, seconds - nested))
+
+    def report(self, top=REPORT_TOP):
+        """
+        Returns:
+            dict: total import seconds, self time summed per top-level package, and the slowest modules by
+            cumulative time
+        """
+        packages = {}
+        for name, (_, own) in self.modules.items():
+            root = name.split(".", 1)[0]
+            packages[root] = packages.get(root, 0.0) + own
+        slowest = sorted(self.modules.items(), key=lambda item: -item[1][0])[:top]
+        return {
+            "total_s": round(sum(own for _, own in self.modules.values()), 3),
+            "packages": {k: round(v, 3) for k, v in sorted(packages.items(), key=lambda kv: -kv[1])[:top]},
+            "modules": {name: round(cumulative, 3) for name, (cumulative, _) in slowest},
+        }
+
+
+class Startup:
+    """
+    Startup phases of the process and its readiness. imports_done() is called once the app is imported;
+    warm_up() runs the warm-up steps in the background and flips ready when they all succeeded.
+    """
+
+    def __init__(self, profile=STARTUP_PROFILE):
+        self.started = time.perf_counter()
+        self.phases = {}
+        self.ready = False
+        self.error = None
+        self.profiler = ImportProfiler().install() if profile else None
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = round(time.perf_counter() - start, 4)
+
+    def imports_done(self):
+        self.phases["imports"] = round(time.perf_counter() - self.started, 4)
+        if self.profiler:
+            self.profiler.uninstall()
+
+    async def warm_up(self, steps):
+        """
+        Run steps in order, each a (name, callable) pair: coroutine functions are awaited on the loop, plain
+        functions run in a worker thread. A failing step leaves the process not ready and stops the warm-up.
+        """
+        for name, step in steps:
+            try:
+                with self.phase(f"warm_up.{name}"):
+                    if inspect.iscoroutinefunction(step):
+                        await step()
+                    else:
+                        await asyncio.to_thread(step)
+            except Exception as e:
+                self.error = f"{name}: {e}"
+                log.warning("⚠️ [startup] warm-up step %s failed: %s", name, e)
+                return
+        self.ready = True
+        self.phases["ready_after"] = round(time.perf_counter() - self.started, 4)
+        log.info("✅ [startup] ready: %s", self.status())
+
+    def status(self):
+        """
+        Returns:
+            dict: ready flag, error (if a warm-up step failed), phase durations in seconds, uptime and, with
+            STARTUP_PROFILE=1, the import breakdown
+        """
+        status = {"ready": self.ready, "phases": dict(self.phases),
+                  "uptime_s": round(time.perf_counter() - self.started, 3)}
+        if self.error:
+            status["error"] = self.error
+        if self.profiler:
+            status["imports"] = self.profiler.report()
+        return status
+
+
+STARTUP = Startup()
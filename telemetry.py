@@ -0,0 +1,271 @@
+import os
+import time
+import logging
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# add a Server-Timing header (per-stage durations) to /chat responses
+SERVER_TIMING = os.getenv("SERVER_TIMING", "0") == "1"
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def configure_logging(level=LOG_LEVEL):
+    """
+    Configure the root logger once for the API process (modules only call logging.getLogger(__name__)).
+    """
+    logging.basicConfig(level=level, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+
+def _label_key(labelnames, labels):
+    return tuple(str(labels.get(name, "")) for name in labelnames)
+
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values)) + (list(extra.items()) if extra else [])
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1.0, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, None, value) for key, value in self._values.items()]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount=1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    @contextmanager
+    def track(self, **labels):
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}           # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _label_key(self.labelnames, labels)
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            row = self._values.get(key)
+            if row is None:
+                row = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            if i < len(self.buckets):
+                row[i] += 1
+            row[-2] += value
+            row[-1] += 1
+
+    def samples(self):
+        with self._lock:
+            rows = {key: list(row) for key, row in self._values.items()}
+        out = []
+        for key, row in rows.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, row):
+                cumulative += count
+                out.append((f"{self.name}_bucket", key, {"le": repr(float(bound))}, cumulative))
+            out.append((f"{self.name}_bucket", key, {"le": "+Inf"}, row[-1]))
+            out.append((f"{self.name}_sum", key, None, row[-2]))
+            out.append((f"{self.name}_count", key, None, row[-1]))
+        return out
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            return self.metrics.setdefault(metric.name, metric)
+
+    def render(self) -> str:
+        """
+        Returns:
+            str: all metrics in the Prometheus text exposition format (version 0.0.4)
+        """
+        lines = []
+        for metric in list(self.metrics.values()):
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, key, extra, value in metric.samples():
+                lines.append(f"{name}{_format_labels(metric.labelnames, key, extra)} {float(value):g}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def counter(name, help, labelnames=()):
+    return REGISTRY.register(Counter(name, help, labelnames))
+
+
+def gauge(name, help, labelnames=()):
+    return REGISTRY.register(Gauge(name, help, labelnames))
+
+
+def histogram(name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+    return REGISTRY.register(Histogram(name, help, labelnames, buckets))
+
+
+STAGE_SECONDS = histogram("travel_stage_duration_seconds", "Duration of each request stage.", ["stage", "cache"])
+STAGES_IN_FLIGHT = gauge("travel_stage_in_flight", "Stages currently running.", ["stage"])
+HTTP_SECONDS = histogram("travel_http_request_duration_seconds", "HTTP request latency.", ["path", "status"])
+HTTP_IN_FLIGHT = gauge("travel_http_requests_in_flight", "HTTP requests currently being served.", ["path"])
+LLM_TOKENS = counter("travel_llm_tokens_total", "Gemini tokens used.", ["lane", "kind"])
+LLM_QUEUED = gauge("travel_llm_queued", "Gemini calls waiting in the scheduler.", ["lane"])
+CACHE_RESULTS = counter("travel_cache_results_total", "Cache lookups by cache and result.", ["cache", "result"])
+
+
+class Span:
+    """
+    One timed stage of a request. attrs carries details such as cache="hit" or token counts.
+    """
+    __slots__ = ("name", "start", "duration", "attrs")
+
+    def __init__(self, name, attrs):
+        self.name = name
+        self.start = time.perf_counter()
+        self.duration = None
+        self.attrs = attrs
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def to_dict(self):
+        return {"stage": self.name, "ms": round((self.duration or 0.0) * 1000, 3), **self.attrs}
+
+
+class Trace:
+    """
+    The spans recorded while serving one request (shared by every task and worker thread it spawns).
+    """
+
+    def __init__(self):
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def server_timing(self) -> str:
+        """
+        Returns:
+            str: Server-Timing header value, e.g. 'parse;dur=1.2, weather;dur=0.4;desc="hit"'
+        """
+        with self._lock:
+            spans = [s for s in self.spans if s.duration is not None]
+        parts = []
+        for s in spans:
+            part = f"{s.name};dur={s.duration * 1000:.1f}"
+            if "cache" in s.attrs:
+                part += f';desc="{s.attrs["cache"]}"'
+            parts.append(part)
+        return ", ".join(parts)
+
+
+_trace = ContextVar("travel_trace", default=None)
+_span = ContextVar("travel_span", default=None)
+
+
+def start_trace():
+    """
+    Start collecting spans for the current request; returns the Trace.
+    """
+    trace = Trace()
+    _trace.set(trace)
+    return trace
+
+
+def current_trace():
+    return _trace.get()
+
+
+def current_span():
+    return _span.get()
+
+
+def _finish(s):
+    s.duration = time.perf_counter() - s.start
+    STAGE_SECONDS.observe(s.duration, stage=s.name, cache=s.attrs.get("cache", ""))
+    trace = _trace.get()
+    if trace is not None:
+        trace.add(s)
+
+
+@contextmanager
+def span(name, **attrs):
+    """
+    Time a stage: records travel_stage_duration_seconds{stage=name, cache=attrs["cache"]} and, inside a
+    request, appends the span to its Trace. Call .set(...) on the yielded Span to add attributes.
+    Do not hold a span across a yield in an async generator; use start_span()/end_span() there.
+    """
+    s = Span(name, attrs)
+    token = _span.set(s)
+    STAGES_IN_FLIGHT.inc(stage=name)
+    try:
+        yield s
+    finally:
+        STAGES_IN_FLIGHT.dec(stage=name)
+        _span.reset(token)
+        _finish(s)
+
+
+def start_span(name, **attrs):
+    """
+    Start a span that is not made current (for stages that span several yields of a generator).
+    """
+    STAGES_IN_FLIGHT.inc(stage=name)
+    return Span(name, attrs)
+
+
+def end_span(s):
+    STAGES_IN_FLIGHT.dec(stage=s.name)
+    _finish(s)
+
+
+def mark_cache(cache: str, result: str):
+    """
+    Count a cache lookup (travel_cache_results_total) and tag the current span with cache=result.
+    """
+    CACHE_RESULTS.inc(cache=cache, result=result)
+    s = _span.get()
+    if s is not None:
+        s.attrs["cache"] = result
@@ -1,6 +1,7 @@
 # travel_ui.py
 import streamlit as st
 import requests
+import json
 import os
 
 API_URL = os.getenv("API_URL", "http://127.0.0.1:8000")  # default local
@@ -22,61 +23,101 @@ with st.form("trip_form", clear_on_submit=False):
     )
     submitted = st.form_submit_button("Plan my trip")
 
-if submitted and user_message.strip():
-    with st.spinner("Planning your trip..."):
-        data = {}
-        try:
-            resp = requests.post(f"{API_URL}/chat", json={"message": user_message}, timeout=90)
-            resp.raise_for_status()
-            data = resp.json()
-        except Exception as e:
-            st.error(f"❌ Request failed: {e}")
-            data = {}
 
-    # ✅ Check for Gemini quota error
-    if data.get("error") and "quota" in data["error"].lower():
-        st.warning("⚠️ Gemini API quota exceeded. Please try again later.")
-    elif not data:
-        st.error("⚠️ No response from the chatbot.")
-    else:
-        tab1, tab2, tab3 = st.tabs(["📋 Itinerary", "🌤️ Weather & Locations", "🔎 Prompt Analysis"])
+def stream_events(message):
+    """
+    POST to /chat/stream and yield (event, data) pairs as the server sends them.
+    """
+    with requests.post(f"{API_URL}/chat/stream", json={"message": message}, stream=True, timeout=(10, 90)) as resp:
+        if resp.status_code == 429:
+            # Gemini queue full / quota reached: the body carries the message, Retry-After the wait
+            yield "error", resp.json()
+            return
+        resp.raise_for_status()
+        event, data_lines = None, []
+        for line in resp.iter_lines(decode_unicode=True):
+            if line is None:
+                continue
+            if line == "":
+                if event:
+                    yield event, json.loads("\n".join(data_lines) or "{}")
+                event, data_lines = None, []
+            elif line.startswith("event:"):
+                event = line[len("event:"):].strip()
+            elif line.startswith("data:"):
+                data_lines.append(line[len("data:"):].strip())
 
-        with tab1:
-            st.subheader("Itinerary")
-            itinerary = data.get("itinerary") or "_No itinerary generated._"
-            st.markdown(itinerary)
 
-        with tab2:
-            st.subheader("Weather & Location Overview")
+def render_weather(weather):
+    st.markdown("**Weather summary:** " + weather.get("summary", "N/A"))
 
-            weather = data.get("weather", {}) or {}
-            st.markdown("**Weather summary:** " + weather.get("summary", "N/A"))
+    meta_cols = st.columns(3)
+    with meta_cols[0]:
+        st.caption("Source")
+        st.write(weather.get("source", "N/A"))
+    with meta_cols[1]:
+        if "details" in weather and isinstance(weather["details"], dict):
+            main = weather["details"].get("main") if isinstance(weather["details"].get("main"), dict) else None
+            temp = main.get("temp") if main else None
+            if temp is not None:
+                st.caption("Current Temp (°C)")
+                st.write(temp)
+    with meta_cols[2]:
+        coord = weather.get("details", {}).get("coord", {})
+        if coord:
+            st.caption("Coordinates")
+            st.write(f"{coord.get('lat')}, {coord.get('lon')}")
 
-            meta_cols = st.columns(3)
-            with meta_cols[0]:
-                st.caption("Source")
-                st.write(weather.get("source", "N/A"))
-            with meta_cols[1]:
-                if "details" in weather and isinstance(weather["details"], dict):
-                    main = weather["details"].get("main") if isinstance(weather["details"].get("main"), dict) else None
-                    temp = main.get("temp") if main else None
-                    if temp is not None:
-                        st.caption("Current Temp (°C)")
-                        st.write(temp)
-            with meta_cols[2]:
-                coord = weather.get("details", {}).get("coord", {})
-                if coord:
-                    st.caption("Coordinates")
-                    st.write(f"{coord.get('lat')}, {coord.get('lon')}")
+if submitted and user_message.strip():
+    tab1, tab2, tab3 = st.tabs(["📋 Itinerary", "🌤️ Weather & Locations", "🔎 Prompt Analysis"])
 
-            st.markdown("---")
-            st.subheader("Location Overview")
-            st.markdown(data.get("rag_summary", "_No location data._"))
+    with tab1:
+        st.subheader("Itinerary")
+        itinerary_box = st.empty()
+    with tab2:
+        st.subheader("Weather & Location Overview")
+        weather_box = st.empty()
+        st.markdown("---")
+        st.subheader("Location Overview")
+        location_box = st.empty()
+        route_box = st.empty()
+    with tab3:
+        st.subheader("Prompt Analysis (How your request was understood)")
+        parsed_box = st.empty()
+        st.subheader("Full RAG Context (raw)")
+        rag_raw_box = st.empty()
 
-        with tab3:
-            st.subheader("Prompt Analysis (How your request was understood)")
-            parsed = data.get("parsed_prompt") or data.get("details") or {}
-            st.json(parsed)
+    itinerary_box.info("Planning your trip...")
+    itinerary = ""
+    error = None
+    try:
+        # render each event as soon as it arrives
+        for event, data in stream_events(user_message):
+            if event == "parsed_prompt":
+                parsed_box.json(data)
+            elif event == "weather":
+                with weather_box.container():
+                    render_weather(data or {})
+            elif event == "rag":
+                location_box.markdown(data.get("rag_summary") or "_No location data._")
+                rag_raw_box.text_area("Raw RAG Info", data.get("rag_info_raw", ""), height=250)
+            elif event == "route":
+                route_box.markdown("**Route**\n\n" + "\n".join(
+                    f"{n}. {stop['city']}, {stop['country']} – {stop['days']} days"
+                    + (f" ({stop['km_from_previous']} km)" if stop.get("km_from_previous") else "")
+                    for n, stop in enumerate(data.get("stops", []), 1)))
+            elif event == "itinerary":
+                itinerary += data.get("text", "")
+                itinerary_box.markdown(itinerary)
+            elif event == "error":
+                error = data.get("error", "Unknown error")
+    except Exception as e:
+        error = f"❌ Request failed: {e}"
 
-            st.subheader("Full RAG Context (raw)")
-            st.text_area("Raw RAG Info", data.get("rag_info_raw", ""), height=250)
+    # ✅ Check for Gemini quota error
+    if error and "quota" in error.lower():
+        itinerary_box.warning("⚠️ Gemini API quota exceeded. Please try again later.")
+    elif error:
+        itinerary_box.error(error)
+    elif not itinerary:
+        itinerary_box.markdown("_No itinerary generated._")
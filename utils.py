@@ -1,21 +1,104 @@
 import os
-import requests
+import json
+import asyncio
+import threading
 from datetime import datetime
-from meteostat import Point, Daily, Monthly
-from geopy.geocoders import Nominatim
-from dotenv import load_dotenv
+from backends import fake_weather
+from cache import AsyncSingleFlight, DiskCache, SingleFlight, TTLCache
+from climate import MONTH_NAMES, get_climatology
+from geocode import get_geocoder
+from telemetry import mark_cache, span
 
-load_dotenv()
+OPENWEATHER_API_KEY = os.getenv("OPENWEATHER_API_KEY")
+OPENWEATHER_URL = "https://api.openweathermap.org/data/2.5/weather"
+WEATHER_CACHE_PATH = os.getenv("WEATHER_CACHE_PATH", os.path.join(".cache", "weather.sqlite"))
+CURRENT_TTL = 10 * 60
+HISTORICAL_TTL = 180 * 24 * 3600
+COORD_PRECISION = 2                 # ~1 km: nearby lookups share a cache entry
+HTTP_TIMEOUT = (5, 10)              # (connect, read) seconds
+HTTP_RETRIES = 2
+HTTP_BACKOFF = 0.3
+RETRY_STATUSES = (429, 500, 502, 503, 504)
 
-geolocator = Nominatim(user_agent="travel_chatbot")
+_current_cache = TTLCache(maxsize=4096, ttl=CURRENT_TTL)
+_historical_cache = None
+_flight = SingleFlight()
+_async_flight = AsyncSingleFlight()
 
-OPENWEATHER_API_KEY = os.getenv("OPENWEATHER_API_KEY")
+_session = None
+_init_lock = threading.Lock()
+_async_client = None
+_async_client_loop = None
+
+
+def get_session():
+    """
+    Return the shared keep-alive requests.Session, with bounded retries on connection errors and 429/5xx.
+    """
+    global _session
+    with _init_lock:
+        if _session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            from urllib3.util.retry import Retry
+            retry = Retry(total=HTTP_RETRIES, backoff_factor=HTTP_BACKOFF,
+                          status_forcelist=RETRY_STATUSES, allowed_methods=["GET"])
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=32, max_retries=retry)
+            _session = requests.Session()
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+    return _session
+
+
+def get_async_client():
+    """
+    Return the shared httpx.AsyncClient for the running event loop, creating it on first use.
+    A new client is created if the loop changed (e.g. a script calling asyncio.run() repeatedly).
+    """
+    global _async_client, _async_client_loop
+    loop = asyncio.get_running_loop()
+    if _async_client is None or _async_client_loop is not loop:
+        import httpx
+        _async_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(HTTP_TIMEOUT[1], connect=HTTP_TIMEOUT[0]),
+            limits=httpx.Limits(max_connections=64, max_keepalive_connections=32),
+            transport=httpx.AsyncHTTPTransport(retries=HTTP_RETRIES),
+        )
+        _async_client_loop = loop
+    return _async_client
+
+
+async def aclose_async_client():
+    """
+    Close the shared httpx.AsyncClient (called at API shutdown).
+    """
+    global _async_client, _async_client_loop
+    if _async_client is not None:
+        await _async_client.aclose()
+    _async_client = None
+    _async_client_loop = None
+
+
+def _coord_key(lat, lon):
+    return f"{round(lat, COORD_PRECISION)},{round(lon, COORD_PRECISION)}"
+
+
+def cache_stats():
+    """
+    Hit/miss counters for the weather and geocode caches.
+    """
+    return {
+        "current_weather": {**_current_cache.stats(), "coalesced": _flight.coalesced + _async_flight.coalesced},
+        "historical_weather": _get_historical_cache().stats(),
+        "geocode": get_geocoder().cache.stats(),
+    }
 
 
 def get_coordinates(place: str):
     """
     Given a human-readable place name, returns (latitude, longitude) coordinates.
-    Uses the Nominatim geocoder service.
+    Cities in cities.csv are resolved locally; anything else goes through the on-disk geocode cache
+    and, on a miss, the rate-limited Nominatim geocoder service.
 
     Args:
         place (str): human-readable place name
@@ -23,11 +106,7 @@ def get_coordinates(place: str):
     Returns:
         tuple or None: (latitude, longitude) if successful; None if not
     """
-    geolocator = Nominatim(user_agent="travel_chatbot")
-    location = geolocator.geocode(place)
-    if location:
-        return (location.latitude, location.longitude)
-    return None
+    return get_geocoder().geocode(place)
 
 def get_current_weather(place: str):
     """
@@ -44,29 +123,116 @@ def get_current_weather(place: str):
     Returns:
         dict or None: if successful, a dictionary with weather data; None if not
     """
-    coords = get_coordinates(place)
-    if not coords:
-        return {"source": "none", "summary": "Could not determine location", "details": {}}
+    with span("weather", kind="current"):
+        coords = get_coordinates(place)
+        if not coords:
+            return {"source": "none", "summary": "Could not determine location", "details": {}}
+
+        lat, lon = coords
+        key = _coord_key(lat, lon)
+        cached = _current_cache.get(key)
+        if cached is not None:
+            mark_cache("current_weather", "hit")
+            return cached
+        mark_cache("current_weather", "miss")
+        return _flight.do(key, _fetch_current_weather, lat, lon)
+
+
+def _fetch_current_weather(lat, lon):
+    fake = fake_weather()
+    if fake is not None:
+        data = fake.current(lat, lon)
+    else:
+        resp = get_session().get(OPENWEATHER_URL, params=_openweather_params(lat, lon), timeout=HTTP_TIMEOUT)
+        resp.raise_for_status()
+        data = resp.json()
+    result = _current_weather_result(data)
+    _current_cache.set(_coord_key(lat, lon), result)
+    return result
 
-    lat, lon = coords
-    url = f"https://api.openweathermap.org/data/2.5/weather?lat={lat}&lon={lon}&appid={OPENWEATHER_API_KEY}&units=metric"
-    data = requests.get(url).json()
 
+def _openweather_params(lat, lon):
+    return {"lat": lat, "lon": lon, "appid": OPENWEATHER_API_KEY, "units": "metric"}
+
+
+def _current_weather_result(data):
     return {
         "source": "openweather",
         "summary": f"{data['weather'][0]['description'].capitalize()}, {data['main']['temp']}°C",
         "details": data
     }
 
+
+async def aget_coordinates(place: str):
+    """
+    Async version of get_coordinates. Dataset cities are resolved inline; anything else may block on the
+    cache or network, so it runs in a worker thread.
+    """
+    geocoder = get_geocoder()
+    if geocoder._local().lookup(place):
+        return geocoder.geocode(place)      # answered from memory; no thread hop needed
+    return await asyncio.to_thread(get_coordinates, place)
+
+
+async def aget_current_weather(place: str):
+    """
+    Async version of get_current_weather, using the shared httpx.AsyncClient.
+    Returns the same dictionary shape as get_current_weather.
+    """
+    with span("weather", kind="current"):
+        coords = await aget_coordinates(place)
+        if not coords:
+            return {"source": "none", "summary": "Could not determine location", "details": {}}
+
+        lat, lon = coords
+        key = _coord_key(lat, lon)
+        cached = _current_cache.get(key)
+        if cached is not None:
+            mark_cache("current_weather", "hit")
+            return cached
+        mark_cache("current_weather", "miss")
+        return await _async_flight.do(key, _afetch_current_weather, lat, lon)
+
+
+async def _afetch_current_weather(lat, lon):
+    fake = fake_weather()
+    if fake is not None:
+        result = _current_weather_result(await fake.acurrent(lat, lon))
+        _current_cache.set(_coord_key(lat, lon), result)
+        return result
+    params = _openweather_params(lat, lon)
+    for attempt in range(HTTP_RETRIES + 1):
+        resp = await get_async_client().get(OPENWEATHER_URL, params=params)
+        if resp.status_code not in RETRY_STATUSES or attempt == HTTP_RETRIES:
+            break
+        await asyncio.sleep(HTTP_BACKOFF * 2 ** attempt)
+    resp.raise_for_status()
+    result = _current_weather_result(resp.json())
+    _current_cache.set(_coord_key(lat, lon), result)
+    return result
+
+
+async def aget_historical_weather(place: str, month: int):
+    """
+    Async version of get_historical_weather. Known cities are answered inline from the climatology;
+    the Meteostat fallback is blocking, so it runs in a worker thread.
+    """
+    if get_climatology().row(place) is not None:
+        return get_historical_weather(place, month)
+    return await asyncio.to_thread(get_historical_weather, place, month)
+
 def get_historical_weather(place: str, month: int):
     """
     Given a human-readable place name and a month (1-12), returns average temperature for that month as a dictionary:
     {
-        "source": "meteostat",  # source of the weather data
+        "source": "climatology" or "meteostat",  # source of the weather data
         "summary": "Short text summary of the weather",  # short text summary (e.g. "Average temperature 10°C in May (2024)")
-        "details": { ... }  # more detailed weather data from the Meteostat API
+        "details": { ... }  # more detailed weather data
     }
 
+    Cities in cities.csv are answered from the local climatology (avg_temp_monthly) without any network access.
+    Other places fall back to Meteostat; those results are cached on disk.
+
     Args:
         place (str): human-readable place name
         month (int): month of the year (1-12)
@@ -74,22 +240,71 @@ def get_historical_weather(place: str, month: int):
     Returns:
         dict or None: if successful, a dictionary with weather data; None if not
     """
-    coords = get_coordinates(place)
-    if not coords:
-        return {"source": "none", "summary": "Could not determine location", "details": {}}
+    month_str = MONTH_NAMES[month - 1]
+    with span("weather", kind="historical"):
+        normals = get_climatology().lookup(place, month)
+        if normals:
+            mark_cache("historical_weather", "local")
+            return {
+                "source": "climatology",
+                "summary": f"Average temperature {normals['avg']}°C (min {normals['min']}°C, max {normals['max']}°C) "
+                           f"in month {month_str}",
+                "details": {"month": month, **normals}
+            }
+
+        coords = get_coordinates(place)
+        if not coords:
+            return {"source": "none", "summary": "Could not determine location", "details": {}}
+
+        lat, lon = coords
+        return _meteostat_monthly(lat, lon, month)
+
+
+def _meteostat_monthly(lat, lon, month):
+    """
+    Meteostat monthly average for (lat, lon), cached on disk by rounded coordinates and month.
+    """
+    key = f"meteostat:{_coord_key(lat, lon)}:{month}"
+    cached = _get_historical_cache().get(key)
+    if cached is not None:
+        mark_cache("historical_weather", "hit")
+        return cached
+    mark_cache("historical_weather", "miss")
+    return _flight.do(key, _fetch_meteostat_monthly, lat, lon, month)
 
-    lat, lon = coords
-    location = Point(lat, lon)
-    data = Monthly(location, start=datetime(2024, month, 1), end=datetime(2024, month, 28))
+
+def _get_historical_cache():
+    global _historical_cache
+    with _init_lock:
+        if _historical_cache is None:
+            _historical_cache = DiskCache(WEATHER_CACHE_PATH, ttl=HISTORICAL_TTL)
+    return _historical_cache
+
+
+def _fetch_meteostat_monthly(lat, lon, month):
+    month_str = MONTH_NAMES[month - 1]
+    fake = fake_weather()
+    if fake is not None:
+        avg_temp = fake.monthly(lat, lon, month)
+        result = {
+            "source": "meteostat",
+            "summary": f"Average temperature {avg_temp}°C in month {month_str} (2024)",
+            "details": {"month": month, "tavg": avg_temp}
+        }
+        _get_historical_cache().set(f"meteostat:{_coord_key(lat, lon)}:{month}", result)
+        return result
+
+    from meteostat import Point, Monthly
+    data = Monthly(Point(lat, lon), start=datetime(2024, month, 1), end=datetime(2024, month, 28))
     data = data.fetch()
-    months = ["January", "February", "March", "April", "May", "June", "July", "August", "September", "October", "November", "December"]
-    month_str = months[month - 1]
     if data.empty:
-        return {"source": "meteostat", "summary": "No data found", "details": {}}
-
-    avg_temp = round(data["tavg"].mean(), 1)
-    return {
-        "source": "meteostat",
-        "summary": f"Average temperature {avg_temp}°C in month {month_str} (2024)",
-        "details": data.to_dict()
-    }
\ No newline at end of file
+        result = {"source": "meteostat", "summary": "No data found", "details": {}}
+    else:
+        avg_temp = round(data["tavg"].mean(), 1)
+        result = {
+            "source": "meteostat",
+            "summary": f"Average temperature {avg_temp}°C in month {month_str} (2024)",
+            "details": json.loads(data.to_json(date_format="iso"))
+        }
+    _get_historical_cache().set(f"meteostat:{_coord_key(lat, lon)}:{month}", result)
+    return result
@@ -0,0 +1,315 @@
+"""
+FAISS index construction for TravelRAG, plus a build step and a recall-vs-latency report.
+
+    python vector_index.py build --index hnsw --metric ip      # encode (or reuse cached embeddings), train, save
+    python vector_index.py report --scale 200000 --out report.json
+
+Index types (RAG_INDEX), all over 384-d MiniLM embeddings:
+    flat       exact search over float32 vectors (1536 B/vector), the baseline
+    sq8        exact scan over int8 scalar-quantized vectors (~384 B/vector, 4x smaller)
+    ivfpq      inverted file + product quantization (~PQ_M B/vector + ids, 16-30x smaller at scale)
+    hnsw       HNSW graph over float32 vectors (fastest queries, largest)
+    hnsw_sq8   HNSW graph over int8 vectors (~650 B/vector)
+Metric (RAG_METRIC): "l2" (IndexFlatL2, the original behaviour) or "ip" (cosine: vectors and queries are
+L2-normalised, MiniLM is trained for cosine similarity).
+"""
+import os
+import sys
+import json
+import math
+import time
+import hashlib
+import argparse
+import numpy as np
+
+INDEX_TYPES = ("flat", "sq8", "ivfpq", "hnsw", "hnsw_sq8")
+METRICS = ("l2", "ip")
+RAG_INDEX = os.getenv("RAG_INDEX", "flat")
+RAG_METRIC = os.getenv("RAG_METRIC", "l2")
+
+HNSW_M = int(os.getenv("RAG_HNSW_M", "32"))
+HNSW_EF_CONSTRUCTION = 80
+HNSW_EF_SEARCH = int(os.getenv("RAG_EF_SEARCH", "64"))
+IVF_NPROBE = int(os.getenv("RAG_NPROBE", "16"))
+PQ_M = int(os.getenv("RAG_PQ_M", "48"))         # sub-quantizers: 48 one-byte codes per 384-d vector
+MIN_POINTS_PER_CENTROID = 39                    # FAISS k-means wants at least this many training points
+INDEX_FORMAT = 2                                # bump when the ids stored in cached indexes change meaning
+
+
+def index_spec(kind=RAG_INDEX, metric=RAG_METRIC) -> str:
+    """
+    Returns:
+        str: "<kind>-<metric>", used in cache file names
+    """
+    if kind not in INDEX_TYPES:
+        raise ValueError(f"unknown index type {kind!r}; expected one of {', '.join(INDEX_TYPES)}")
+    if metric not in METRICS:
+        raise ValueError(f"unknown metric {metric!r}; expected one of {', '.join(METRICS)}")
+    return f"{kind}-{metric}"
+
+
+def factory_string(kind: str, dim: int, n: int) -> str:
+    """
+    faiss.index_factory description for kind, sized for n vectors of dimension dim.
+    """
+    if kind == "flat":
+        return "Flat"
+    if kind == "sq8":
+        return "SQ8"
+    if kind == "hnsw":
+        return f"HNSW{HNSW_M},Flat"
+    if kind == "hnsw_sq8":
+        return f"HNSW{HNSW_M},SQ8"
+    # IVF-PQ: ~4*sqrt(n) lists, PQ_M sub-quantizers (largest divisor of dim not above PQ_M), and fewer
+    # bits per code while the corpus is too small to train 256 centroids per sub-space
+    nlist = max(1, min(int(4 * math.sqrt(n)), n // MIN_POINTS_PER_CENTROID))
+    m = max(d for d in range(1, min(PQ_M, dim) + 1) if dim % d == 0)
+    nbits = int(min(8, max(1, math.floor(math.log2(max(n, 2) / MIN_POINTS_PER_CENTROID)))))
+    return f"IVF{nlist},PQ{m}x{nbits}"
+
+
+def vector_ids(keys):
+    """
+    Stable FAISS ids for row keys (the CSV id column): the first 63 bits of a blake2b hash, so a row keeps
+    its id across reloads no matter where it moves in the file.
+
+    Returns:
+        np.ndarray: int64 ids, one per key
+    """
+    return np.array([int.from_bytes(hashlib.blake2b(str(k).encode("utf-8"), digest_size=8).digest(), "big") >> 1
+                     for k in keys], dtype="int64")
+
+
+def supports_removal(kind: str) -> bool:
+    """
+    HNSW graphs cannot delete vectors; every other index type here can.
+    """
+    return not kind.startswith("hnsw")
+
+
+def prepare(vectors, metric: str):
+    """
+    float32, C-contiguous copy of vectors, L2-normalised for the inner-product metric.
+    """
+    import faiss
+    x = np.array(vectors, dtype="float32", order="C", copy=True)
+    if metric == "ip":
+        faiss.normalize_L2(x)
+    return x
+
+
+def hnsw_of(index):
+    """
+    The HNSW index of index, looking inside an IDMap wrapper (which has no .hnsw of its own); None if it
+    is not an HNSW index.
+    """
+    import faiss
+    if hasattr(index, "id_map"):
+        index = faiss.downcast_index(index.index)
+    return index if hasattr(index, "hnsw") else None
+
+
+def configure(index):
+    """
+    Apply the query-time parameters (IVF nprobe, HNSW efSearch) to a built or loaded index.
+    """
+    import faiss
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = min(IVF_NPROBE, ivf.nlist)
+    graph = hnsw_of(index)
+    if graph is not None:
+        graph.hnsw.efSearch = HNSW_EF_SEARCH
+    return index
+
+
+def build_index(embeddings, kind=RAG_INDEX, metric=RAG_METRIC, ids=None):
+    """
+    Train (if needed) and fill an index of the given kind over embeddings.
+
+    Args:
+        embeddings (np.ndarray): (n, dim) document embeddings
+        kind (str): one of INDEX_TYPES
+        metric (str): "l2" or "ip"
+        ids (np.ndarray, optional): int64 id per vector (see vector_ids); searches then return these ids
+            instead of row positions, and update_index() can remove and add vectors by id
+
+    Returns:
+        faiss.Index: ready to search (queries must go through prepare() with the same metric)
+    """
+    import faiss
+    index_spec(kind, metric)
+    x = prepare(embeddings, metric)
+    n, dim = x.shape
+    faiss_metric = faiss.METRIC_INNER_PRODUCT if metric == "ip" else faiss.METRIC_L2
+    description = factory_string(kind, dim, n)
+    if ids is not None and kind != "ivfpq":          # IVF indexes store ids natively
+        description = "IDMap," + description
+    index = faiss.index_factory(dim, description, faiss_metric)
+    graph = hnsw_of(index)
+    if graph is not None:
+        graph.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+    if hasattr(index, "do_polysemous_training"):
+        index.do_polysemous_training = False         # only useful for Hamming pre-filtering, and slow
+    if not index.is_trained:
+        index.train(x)
+    if ids is None:
+        index.add(x)
+    else:
+        index.add_with_ids(x, np.asarray(ids, dtype="int64"))
+    return configure(index)
+
+
+def update_index(index, kind, metric, remove_ids, vectors, ids):
+    """
+    Copy of an id-mapped index with remove_ids deleted and vectors added under ids. The original (possibly
+    memory-mapped and in use by searches) is left untouched. IVF-PQ keeps its trained quantizers; retrain it
+    with build_index() once most of the corpus has changed.
+
+    Returns:
+        faiss.Index, or None if the index type cannot delete vectors (the caller rebuilds instead)
+    """
+    import faiss
+    if len(remove_ids) and not supports_removal(kind):
+        return None
+    # a serialised copy owns its codes; clone_index would keep viewing the memory-mapped ones, which
+    # cannot grow
+    updated = faiss.deserialize_index(faiss.serialize_index(index))
+    if len(remove_ids):
+        updated.remove_ids(np.asarray(remove_ids, dtype="int64"))
+    if len(ids):
+        updated.add_with_ids(prepare(vectors, metric), np.asarray(ids, dtype="int64"))
+    return configure(updated)
+
+
+def read_index(path, kind):
+    """
+    Read a saved index with its flat, SQ and HNSW codes viewed in place from the memory-mapped file
+    (IO_FLAG_MMAP_IFC), so processes reading the same file share those pages through the page cache.
+    IO_FLAG_MMAP alone still copies these codes into private memory. IVF inverted lists are read into
+    memory: memory-mapped ones cannot be copied for update_index, and IVF-PQ codes are small anyway.
+    Falls back to a plain read when this FAISS build cannot map the file.
+    """
+    import faiss
+    flag = getattr(faiss, "IO_FLAG_MMAP_IFC", None)
+    if kind != "ivfpq" and flag is not None:
+        try:
+            return configure(faiss.read_index(path, flag))
+        except RuntimeError:
+            pass
+    return configure(faiss.read_index(path))
+
+
+def bytes_per_vector(index) -> float:
+    import faiss
+    return len(faiss.serialize_index(index)) / max(1, index.ntotal)
+
+
+def _synthetic(embeddings, n, seed=0):
+    """
+    n vectors around the real embeddings (each a real vector plus small noise), to model a larger corpus.
+    """
+    rng = np.random.default_rng(seed)
+    base = embeddings[rng.integers(0, len(embeddings), n)]
+    noise = rng.normal(0.0, 0.35 / math.sqrt(embeddings.shape[1]), base.shape).astype("float32")
+    return np.asarray(base, dtype="float32") + noise
+
+
+def _latency(index, queries, k):
+    samples = []
+    for q in queries:
+        start = time.perf_counter()
+        index.search(q[None, :], k)
+        samples.append(time.perf_counter() - start)
+    ms = np.asarray(samples) * 1000.0
+    p50, p99 = np.percentile(ms, [50, 99])
+    return round(float(p50), 4), round(float(p99), 4)
+
+
+def report(embeddings, kinds=INDEX_TYPES, metrics=METRICS, n_queries=500, k=10, seed=0):
+    """
+    Recall and latency of every index type against the exact flat index of the same metric.
+
+    Queries are corpus vectors plus noise (held-out paraphrases of the documents). recall@1 is the share of
+    queries whose exact nearest neighbour is ranked first; recall@k the overlap of the top-k lists. The
+    indexes are id-mapped like the ones TravelRAG serves (the ids are the row positions).
+
+    Returns:
+        list: one dict per (kind, metric)
+    """
+    rng = np.random.default_rng(seed + 1)
+    picks = rng.integers(0, len(embeddings), n_queries)
+    raw_queries = np.asarray(embeddings[picks], dtype="float32")
+    raw_queries += rng.normal(0.0, 0.5 / math.sqrt(embeddings.shape[1]), raw_queries.shape).astype("float32")
+    k = min(k, len(embeddings))
+    ids = np.arange(len(embeddings), dtype="int64")
+
+    rows = []
+    for metric in metrics:
+        queries = prepare(raw_queries, metric)
+        exact = build_index(embeddings, "flat", metric, ids=ids)
+        _, truth = exact.search(queries, k)
+        flat_bytes = bytes_per_vector(exact)
+        for kind in kinds:
+            start = time.perf_counter()
+            index = exact if kind == "flat" else build_index(embeddings, kind, metric, ids=ids)
+            build_s = time.perf_counter() - start
+            _, found = index.search(queries, k)
+            recall_1 = float(np.mean(found[:, 0] == truth[:, 0]))
+            recall_k = float(np.mean([len(set(f) & set(t)) / k for f, t in zip(found, truth)]))
+            p50, p99 = _latency(index, queries, k)
+            start = time.perf_counter()
+            index.search(queries, k)
+            batch_ms = (time.perf_counter() - start) * 1000.0 / len(queries)
+            per_vector = bytes_per_vector(index)
+            rows.append({
+                "index": kind, "metric": metric, "vectors": int(index.ntotal),
+                "build_s": round(build_s, 3), "bytes_per_vector": round(per_vector, 1),
+                "memory_reduction": round(flat_bytes / per_vector, 2),
+                "recall_at_1": round(recall_1, 4), f"recall_at_{k}": round(recall_k, 4),
+                "p50_ms": p50, "p99_ms": p99, "batch_ms_per_query": round(batch_ms, 4),
+            })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build TravelRAG vector indexes and compare them.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="encode the cities (or reuse cached embeddings), train and save an index")
+    build.add_argument("--index", default=RAG_INDEX, choices=INDEX_TYPES)
+    build.add_argument("--metric", default=RAG_METRIC, choices=METRICS)
+    build.add_argument("--csv", default="cities.csv")
+    rep = sub.add_parser("report", help="recall vs latency of every index type against the flat baseline")
+    rep.add_argument("--csv", default="cities.csv")
+    rep.add_argument("--index", default=",".join(INDEX_TYPES), help="comma-separated index types")
+    rep.add_argument("--metric", default=",".join(METRICS), help="comma-separated metrics")
+    rep.add_argument("--scale", type=int, default=0, help="grow the corpus to this many synthetic vectors")
+    rep.add_argument("--queries", type=int, default=500)
+    rep.add_argument("--k", type=int, default=10)
+    rep.add_argument("--out", help="also write the rows as JSON to this file")
+    args = parser.parse_args()
+
+    from rag import TravelRAG
+    if args.command == "build":
+        start = time.perf_counter()
+        rag = TravelRAG(args.csv, index_type=args.index, metric=args.metric)
+        print(f"✅ [vector_index] {index_spec(args.index, args.metric)}: {rag.index.ntotal} vectors, "
+              f"{bytes_per_vector(rag.index):.0f} B/vector, {time.perf_counter() - start:.2f}s")
+        return
+
+    embeddings = np.asarray(TravelRAG(args.csv).embeddings, dtype="float32")
+    if args.scale > len(embeddings):
+        embeddings = _synthetic(embeddings, args.scale)
+    rows = report(embeddings, [k for k in args.index.split(",") if k], [m for m in args.metric.split(",") if m],
+                  n_queries=args.queries, k=args.k)
+    columns = list(rows[0])
+    print(" ".join(f"{c:>18}" for c in columns))
+    for row in rows:
+        print(" ".join(f"{row[c]!s:>18}" for c in columns))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"vectors": len(embeddings), "rows": rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    sys.exit(main())